@@ -0,0 +1,125 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from kernel import KernelConfig
+from log_sink import TextLogSink, CountingLogSink
+from metrics import MetricsCollector
+from simulator import Simulator, Workload
+
+# A simulation description: the path of a .json or .jsonl file, or a Workload parsed with load_workload.
+# A path is all that is shipped to a worker, which parses the description itself.
+# A Workload is shipped already parsed, which pays off when it is simulated more than once.
+Description = Path | str | Workload
+
+@dataclass(frozen=True)
+class RunOptions:
+    # Keep each log in memory and return it. Without it the log is discarded.
+    logs: bool = True
+    # Collect and return MetricsCollector.report().
+    metrics: bool = False
+    student_logs: bool = False
+    event_driven: bool = True
+    tickless: bool = True
+    kernel_config: KernelConfig | None = None
+
+@dataclass(slots=True)
+class RunResult:
+    # Position of the description among the descriptions that were run.
+    index: int
+    log: str | None = None
+    metrics: dict | None = None
+    # "ExceptionType: message" if the simulation raised. The log then holds everything logged until it did.
+    error: str | None = None
+    run_time_s: float = 0.0
+
+
+def run_one(index: int, description: Description, options: RunOptions) -> RunResult:
+    result = RunResult(index)
+    log_sink = TextLogSink() if options.logs else CountingLogSink()
+    metrics = MetricsCollector() if options.metrics else None
+    start = time.perf_counter()
+    try:
+        simulator = Simulator(description, None, options.student_logs, options.event_driven, log_sink, options.tickless, metrics,
+                              None, options.kernel_config)
+        simulator.run_simulator()
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.run_time_s = time.perf_counter() - start
+    if options.logs:
+        result.log = log_sink.getvalue()
+    if metrics is not None:
+        result.metrics = metrics.report()
+    return result
+
+# Each worker of a worker_pool receives what all of its tasks share once, when it starts, rather than with every task.
+# Tasks read it back with worker_shared().
+shared_with_worker: object = None
+
+def set_worker_shared(shared: object):
+    global shared_with_worker
+    shared_with_worker = shared
+
+def worker_shared() -> object:
+    return shared_with_worker
+
+def worker_pool(workers: int | None, shared: object) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=set_worker_shared, initargs=(shared,))
+
+def run_worker_chunk(chunk: list[tuple[int, Description]]) -> list[RunResult]:
+    return [run_one(index, description, worker_shared()) for index, description in chunk]
+
+# Runs every description as its own simulation, in parallel when workers > 1, and yields each result as soon as it is ready.
+# Results come back in chunks of chunksize simulations, in the order the chunks finish, so use RunResult.index to match them up.
+# Larger chunks send fewer messages between processes, smaller ones stream the first results sooner.
+# Closing the iterator early cancels the simulations that have not started.
+def iter_many(descriptions: Iterable[Description], workers: int | None = None, options: RunOptions = RunOptions(),
+              chunksize: int = 1) -> Iterator[RunResult]:
+    assert(chunksize > 0)
+    tasks = list(enumerate(descriptions))
+    if workers == 1:
+        for index, description in tasks:
+            yield run_one(index, description, options)
+        return
+
+    executor = worker_pool(workers, options)
+    try:
+        futures = [executor.submit(run_worker_chunk, tasks[i:i + chunksize]) for i in range(0, len(tasks), chunksize)]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Runs every description as its own simulation and returns the results in the order of descriptions.
+def run_many(descriptions: Iterable[Description], workers: int | None = None, options: RunOptions = RunOptions(),
+             chunksize: int = 1) -> list[RunResult]:
+    results = list(iter_many(descriptions, workers, options, chunksize))
+    results.sort(key=lambda result: result.index)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many simulations in parallel, writing each log next to its description.")
+    parser.add_argument("descriptions", nargs="+", help="simulation descriptions (.json or .jsonl)")
+    parser.add_argument("--output-dir", help="directory the logs are written to, named after their descriptions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=1)
+    parser.add_argument("--student-logs", action="store_true")
+    args = parser.parse_args()
+
+    options = RunOptions(student_logs=args.student_logs)
+    start = time.perf_counter()
+    failed = 0
+    for result in iter_many(args.descriptions, args.workers, options, args.chunksize):
+        description = Path(args.descriptions[result.index])
+        output_dir = Path(args.output_dir) if args.output_dir is not None else description.parent
+        log_path = output_dir / (description.stem + ".log")
+        with open(log_path, 'w') as file:
+            file.write(result.log)
+        print(f"{description}: {result.error or 'ok'} ({result.run_time_s * 1000:.1f}ms) -> {log_path}")
+        failed += result.error is not None
+    print(f"{len(args.descriptions) - failed}/{len(args.descriptions)} simulations finished in {time.perf_counter() - start:.2f}s")
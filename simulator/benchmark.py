@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+
+from log_sink import CountingLogSink
+from simulator import Simulator, VALID_SCHEDULING_ALGORITHMS
+from workload_generator import generate_workload, add_config_arguments, config_from_arguments
+
+# Times loading a workload and running it to completion.
+# Runs in a fresh worker process so that the peak RSS belongs to this run alone.
+def run_benchmark(description_path: str, event_driven: bool, tickless: bool = False, fast_path: bool = True) -> dict:
+    start = time.perf_counter()
+    log_sink = CountingLogSink()
+    simulator = Simulator(description_path, None, False, event_driven, log_sink, tickless)
+    simulator.fast_path = fast_path
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    simulator.run_simulator()
+    run_time = time.perf_counter() - start
+
+    return {
+        "event_driven": event_driven,
+        "tickless": tickless,
+        "fast_path": fast_path,
+        "load_time_s": load_time,
+        "run_time_s": run_time,
+        "simulated_us": simulator.elapsed_time,
+        "simulated_us_per_s": simulator.elapsed_time / run_time,
+        "events": log_sink.events,
+        "events_per_s": log_sink.events / run_time,
+        # Zero when the run was computed without the kernel.
+        "decision_cache_hits": simulator.kernel.decision_cache.hits,
+        "decision_cache_misses": simulator.kernel.decision_cache.misses,
+        # ru_maxrss is reported in kilobytes on Linux.
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time Simulator.run_simulator on generated workloads.")
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(VALID_SCHEDULING_ALGORITHMS),
+                        default=sorted(VALID_SCHEDULING_ALGORITHMS))
+    parser.add_argument("--event-driven", action="store_true", help="run the simulator in event-driven mode")
+    parser.add_argument("--tickless", action="store_true", help="only raise the timer interrupts the kernel asks for")
+    parser.add_argument("--no-fast-path", action="store_true", help="step through workloads without syscalls instead of computing their logs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="benchmarks to run at once; more than 1 makes timings noisier")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    configs = [config_from_arguments(args, algorithm) for algorithm in args.algorithms]
+    with tempfile.TemporaryDirectory() as directory:
+        description_paths = []
+        for config in configs:
+            description_paths.append(os.path.join(directory, f"{config.scheduling_algorithm}.json"))
+            with open(description_paths[-1], 'w') as file:
+                json.dump(generate_workload(config), file)
+
+        with ProcessPoolExecutor(max_workers=args.workers, max_tasks_per_child=1) as executor:
+            results = list(executor.map(run_benchmark, description_paths, [args.event_driven] * len(configs),
+                                        [args.tickless] * len(configs), [not args.no_fast_path] * len(configs)))
+
+    for i, config in enumerate(configs):
+        result = results[i] = {"scheduling_algorithm": config.scheduling_algorithm, "config": asdict(config), **results[i]}
+        print(f"{config.scheduling_algorithm:>10}: {result['run_time_s']:8.3f}s, "
+              f"{result['simulated_us_per_s']:12.0f} simulated us/s, {result['events_per_s']:10.0f} events/s, "
+              f"{result['decision_cache_hits']:9} of {result['decision_cache_hits'] + result['decision_cache_misses']} "
+              f"timer interrupts cached, peak {result['peak_rss_kb'] / 1024:.1f} MiB")
+
+    with open(args.output, 'w') as file:
+        json.dump({"python": platform.python_version(), "results": results}, file, indent=4)
@@ -0,0 +1,366 @@
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from io import BufferedIOBase
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Iterator
+
+from log_sink import LogSink, TextLogSink, SIMULATOR_DELIMITER, STUDENT_DELIMITER, LOG_MESSAGES, LOG_SWITCH
+
+MICRO_S = int
+PID = int
+
+# A binary trace is a header, then one block per flush, and finally the sparse time index and a trailer that locates it.
+# A block holds the strings first logged since the previous block, then fixed-size records in log order.
+# Everything up to the last block written is readable on its own, so a run that was killed still leaves a usable trace.
+TRACE_MAGIC = b"SIMTRACE"
+TRACE_VERSION = 2
+# magic, version, index stride
+HEADER = struct.Struct("<8sII")
+# string count, record count; followed by the length of each string, the strings padded to 8 bytes, and the records
+BLOCK = struct.Struct("<qq")
+# time, arg, pid, kind
+RECORD = struct.Struct("<qqiB3x")
+# record count, index offset, whether the last microsecond was spaced, end marker
+TRAILER = struct.Struct("<qq?7x8s")
+TRACE_END = b"SIMTREND"
+
+# Records that are not structured simulator events, whose text is a string of the trace and indexed by arg.
+TRACE_STUDENT_TEXT = 254
+TRACE_SIMULATOR_TEXT = 255
+
+# Bytes of strings remembered to write a repeated message only once. Past this they are forgotten,
+# so a run logging many distinct messages writes some again rather than holding all of them.
+INTERNED_STRING_BYTES = 1 << 24
+
+# The index holds the time of every INDEX_STRIDE-th record and the pid running before it.
+INDEX_STRIDE = 1024
+
+# Bytes of records held in memory before they are written to the file.
+DEFAULT_BUFFER_BYTES = 1 << 20
+
+
+# Writes the log as a binary trace. Structured events are stored as they are logged, without formatting them,
+# and spacing is implied like in RecordLogSink: a blank line follows each run of records with the same time.
+class BinaryTraceSink(LogSink):
+    trace_path: str
+    # None after being restored from a checkpoint until the trace is reopened.
+    file: BufferedIOBase | None
+    # Length of the trace when the checkpoint this sink was restored from was taken.
+    checkpoint_offset: int
+    buffer: bytearray
+    buffer_bytes: int
+    records: int
+    index_times: array
+    index_running: array
+    running: PID
+    # Number of the next new string, and the number of each string remembered.
+    strings: int
+    string_ids: dict[str, int]
+    interned_bytes: int
+    # Encoded strings to write with the next block.
+    pending_strings: list[bytes]
+    pending_string_bytes: int
+    spaced: int
+
+    def __init__(self, trace_path: str, buffer_bytes: int = DEFAULT_BUFFER_BYTES):
+        self.trace_path = trace_path
+        self.file = open(trace_path, 'wb')
+        self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, INDEX_STRIDE))
+        self.buffer = bytearray()
+        self.buffer_bytes = buffer_bytes
+        self.records = 0
+        self.index_times = array('q')
+        self.index_running = array('q')
+        self.running = 0
+        self.strings = 0
+        self.string_ids = dict()
+        self.interned_bytes = 0
+        self.pending_strings = []
+        self.pending_string_bytes = 0
+        self.spaced = 0
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        # Student logs may pass live kernel objects, so they have to be formatted now.
+        text = f"{message}"
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            if self.interned_bytes >= INTERNED_STRING_BYTES:
+                self.string_ids.clear()
+                self.interned_bytes = 0
+            string_id = self.string_ids[text] = self.strings
+            self.interned_bytes += len(text)
+            self.strings += 1
+            self.pending_strings.append(text.encode())
+            self.pending_string_bytes += len(self.pending_strings[-1])
+        kind = TRACE_STUDENT_TEXT if delimiter == STUDENT_DELIMITER else TRACE_SIMULATOR_TEXT
+        self.write_event(time, kind, 0, string_id)
+
+    def write_event(self, time: MICRO_S, kind: int, pid: int, arg: int):
+        if self.records % INDEX_STRIDE == 0:
+            self.index_times.append(time)
+            self.index_running.append(self.running)
+        if kind == LOG_SWITCH:
+            self.running = pid
+        self.buffer += RECORD.pack(time, arg, pid, kind)
+        self.records += 1
+        if len(self.buffer) + self.pending_string_bytes >= self.buffer_bytes:
+            self.flush()
+
+    def write_spacing(self):
+        self.spaced = self.records
+
+    # Writes the buffered records and the strings they introduced as one block.
+    def flush(self):
+        if self.file is None:
+            self.reopen()
+        if len(self.buffer) == 0:
+            return
+        lengths = little_endian(array('q', map(len, self.pending_strings))).tobytes()
+        self.file.write(BLOCK.pack(len(self.pending_strings), len(self.buffer) // RECORD.size) + lengths
+                        + padded(b"".join(self.pending_strings)) + self.buffer)
+        self.buffer.clear()
+        self.pending_strings.clear()
+        self.pending_string_bytes = 0
+
+    def close(self):
+        self.flush()
+        index_offset = self.file.tell()
+        self.file.write(little_endian(self.index_times).tobytes())
+        self.file.write(little_endian(self.index_running).tobytes())
+        self.file.write(TRAILER.pack(self.records, index_offset, self.records > 0 and self.spaced == self.records, TRACE_END))
+        self.file.close()
+
+    # A checkpoint keeps how many bytes of records were written rather than the open file.
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state["file"] = self.file.tell()
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.checkpoint_offset = self.file
+        self.file = None
+
+    # Reopens the trace and drops any records written after the checkpoint was taken.
+    def reopen(self):
+        self.file = open(self.trace_path, 'r+b')
+        self.file.seek(self.checkpoint_offset)
+        self.file.truncate()
+
+
+def little_endian(values: array) -> array:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+def read_array(data, offset: int, count: int) -> array:
+    values = array('q', data[offset:offset + 8 * count])
+    return little_endian(values)
+
+def padded(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 8)
+
+
+# Reads a binary trace through a memory map, so only the pages a query touches are read from disk.
+# Records are (time, kind, pid, arg) tuples in log order. Strings are only decoded when a record using them is rendered.
+class TraceReader:
+    # Index of the first record of each block and the offset of its records.
+    block_first: array
+    block_offsets: array
+    string_offsets: array
+    string_lengths: array
+
+    def __init__(self, trace_path: str):
+        self.file = open(trace_path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        magic, version, self.index_stride = HEADER.unpack_from(self.data, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{trace_path} is not a version {TRACE_VERSION} simulator trace")
+
+        complete = len(self.data) >= HEADER.size + TRAILER.size and self.data[-len(TRACE_END):] == TRACE_END
+        if complete:
+            records, index_offset, self.spaced, _ = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+            self.read_blocks(index_offset)
+            index_entries = -(-self.records // self.index_stride)
+            self.index_times = read_array(self.data, index_offset, index_entries)
+            self.index_running = read_array(self.data, index_offset + 8 * index_entries, index_entries)
+        else:
+            # The run was killed before the sink was closed. Every block written is read, and the index rebuilt from them.
+            self.spaced = False
+            self.read_blocks(len(self.data))
+            self.build_index()
+
+    # Locates the strings and records of the blocks before end. A block cut short ends the trace after its last whole record.
+    def read_blocks(self, end: int):
+        self.block_first = array('q')
+        self.block_offsets = array('q')
+        self.string_offsets = array('q')
+        self.string_lengths = array('q')
+        self.records = 0
+        offset = HEADER.size
+        while offset + BLOCK.size <= end:
+            strings, records = BLOCK.unpack_from(self.data, offset)
+            offset += BLOCK.size
+            if offset + 8 * strings > end:
+                break
+            lengths = read_array(self.data, offset, strings)
+            offset += 8 * strings
+            records_offset = offset + len(padded(bytes(sum(lengths))))
+            if records_offset > end:
+                break
+            self.string_offsets.extend(list(accumulate(lengths, initial=offset))[:-1])
+            self.string_lengths.extend(lengths)
+            records = min(records, (end - records_offset) // RECORD.size)
+            self.block_first.append(self.records)
+            self.block_offsets.append(records_offset)
+            self.records += records
+            offset = records_offset + records * RECORD.size
+
+    def build_index(self):
+        self.index_times = array('q')
+        self.index_running = array('q')
+        running = 0
+        for i, (time, arg, pid, kind) in enumerate(self.raw_records(0, self.records)):
+            if i % self.index_stride == 0:
+                self.index_times.append(time)
+                self.index_running.append(running)
+            if kind == LOG_SWITCH:
+                running = pid
+
+    def __len__(self):
+        return self.records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+        self.file.close()
+
+    def record_offset(self, i: int) -> int:
+        block = bisect_right(self.block_first, i) - 1
+        return self.block_offsets[block] + (i - self.block_first[block]) * RECORD.size
+
+    # Records first until before last as stored, (time, arg, pid, kind), read block by block without copying them.
+    def raw_records(self, first: int, last: int) -> Iterator[tuple[MICRO_S, int, PID, int]]:
+        block = bisect_right(self.block_first, first) - 1
+        while first < last:
+            block_end = self.block_first[block + 1] if block + 1 < len(self.block_first) else self.records
+            stop = min(last, block_end)
+            offset = self.block_offsets[block] + (first - self.block_first[block]) * RECORD.size
+            records = self.view[offset:offset + (stop - first) * RECORD.size]
+            try:
+                yield from RECORD.iter_unpack(records)
+            finally:
+                records.release()
+            first = stop
+            block += 1
+
+    def record(self, i: int) -> tuple[MICRO_S, int, PID, int]:
+        time, arg, pid, kind = RECORD.unpack_from(self.data, self.record_offset(i))
+        return time, kind, pid, arg
+
+    def time(self, i: int) -> MICRO_S:
+        return RECORD.unpack_from(self.data, self.record_offset(i))[0]
+
+    def string(self, i: int) -> str:
+        offset = self.string_offsets[i]
+        return str(self.view[offset:offset + self.string_lengths[i]], "utf-8")
+
+    # Index of the first record at or after time.
+    # The sparse index narrows the search to one stride of records, which is then binary searched.
+    def find(self, time: MICRO_S) -> int:
+        block = bisect_left(self.index_times, time)
+        if block == 0:
+            return 0
+        low = (block - 1) * self.index_stride
+        high = min(block * self.index_stride, self.records)
+        while low < high:
+            middle = (low + high) // 2
+            if self.time(middle) < time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Indices of the first record logged at or after start and of the first one logged at or after end.
+    def bounds(self, start: MICRO_S | None = None, end: MICRO_S | None = None) -> tuple[int, int]:
+        return 0 if start is None else self.find(start), self.records if end is None else self.find(end)
+
+    # Records logged from start until before end.
+    def range(self, start: MICRO_S | None = None, end: MICRO_S | None = None) -> Iterator[tuple[MICRO_S, int, PID, int]]:
+        for time, arg, pid, kind in self.raw_records(*self.bounds(start, end)):
+            yield time, kind, pid, arg
+
+    # The pid running after everything logged at time, 0 for the idle process.
+    def running_at(self, time: MICRO_S) -> PID:
+        block = bisect_right(self.index_times, time) - 1
+        if block < 0:
+            return 0
+        running = self.index_running[block]
+        for record_time, arg, pid, kind in self.raw_records(block * self.index_stride, min((block + 1) * self.index_stride, self.records)):
+            if record_time > time:
+                break
+            if kind == LOG_SWITCH:
+                running = pid
+        return running
+
+    def message(self, kind: int, pid: PID, arg: int) -> tuple[str, str]:
+        if kind == TRACE_STUDENT_TEXT:
+            return STUDENT_DELIMITER, self.string(arg)
+        if kind == TRACE_SIMULATOR_TEXT:
+            return SIMULATOR_DELIMITER, self.string(arg)
+        return SIMULATOR_DELIMITER, LOG_MESSAGES[kind].format(pid=pid, arg=arg)
+
+    # Renders records from start until before end in the text log format.
+    # The whole trace renders to the same log TextLogSink would have written.
+    def render(self, sink: LogSink, start: MICRO_S | None = None, end: MICRO_S | None = None):
+        last_time = None
+        for time, kind, pid, arg in self.range(start, end):
+            if last_time is not None and time != last_time:
+                sink.write_spacing()
+            delimiter, message = self.message(kind, pid, arg)
+            sink.write(time, delimiter, message)
+            last_time = time
+        # Only the final microsecond of the run may have been left without its blank line.
+        if last_time is not None and (self.bounds(start, end)[1] < self.records or self.spaced):
+            sink.write_spacing()
+
+
+def convert_to_text(trace_path: str, text_path: str, start: MICRO_S | None = None, end: MICRO_S | None = None):
+    with TraceReader(trace_path) as reader:
+        sink = TextLogSink(text_path)
+        reader.render(sink, start, end)
+        sink.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a binary simulator trace to the text log format, or query it.")
+    parser.add_argument("trace", help="trace written with --binary-trace")
+    parser.add_argument("output", nargs="?", help="text log to write; the log is printed if omitted")
+    parser.add_argument("--start", type=int, help="first simulated microsecond to include")
+    parser.add_argument("--end", type=int, help="simulated microsecond to stop before")
+    parser.add_argument("--running-at", type=int, help="print the pid running at this simulated microsecond instead")
+    args = parser.parse_args()
+
+    if args.running_at is not None:
+        with TraceReader(args.trace) as reader:
+            print(reader.running_at(args.running_at))
+    elif args.output is not None:
+        convert_to_text(args.trace, args.output, args.start, args.end)
+    else:
+        with TraceReader(args.trace) as reader:
+            sink = TextLogSink()
+            reader.render(sink, args.start, args.end)
+            sys.stdout.write(sink.getvalue())
@@ -0,0 +1,184 @@
+import math
+from collections import deque
+from itertools import accumulate
+
+from kernel import FirstComeFirstServe, RoundRobin
+from log_sink import LOG_ARRIVAL_KINDS, LOG_EXIT, LOG_SWITCH
+
+MICRO_S = int
+
+# The simulator raises a SimulationError once the idle process has run for a second.
+# Schedules that come within a microsecond of that are left to the per-tick path, which raises it with the right log.
+IDLE_LIMIT: MICRO_S = 1000000 - 1
+
+
+# When no process makes a syscall, FCFS and RR schedules only depend on arrival and total_cpu_time,
+# so the whole log can be computed without stepping through the simulation.
+# Only a fresh simulator with every process loaded, that nothing else observes (metrics, profiling, the watchdog, checkpoints), qualifies.
+def fast_path_applies(simulator) -> bool:
+    if not simulator.fast_path or simulator.elapsed_time != 0 or len(simulator.processes) > 0:
+        return False
+    if simulator.arrival_stream is not None or simulator.metrics is not None or simulator.profiler is not None \
+            or simulator.watchdog is not None or simulator.checkpoint_interval is not None:
+        return False
+    if type(simulator.kernel.scheduler) not in (FirstComeFirstServe, RoundRobin):
+        return False
+    return len(simulator.arrivals) > 0 and all(len(process.events) == 0 for process in simulator.arrivals)
+
+# Computes the log of the simulation and writes it to the simulator's log sink, leaving the simulator finished.
+# Returns False without logging anything if the CPU would idle for too long, so that the caller falls back to the per-tick path.
+def run_fast_path(simulator) -> bool:
+    # Processes in pid order: simulator.arrivals is latest first and the simulator pops it from the end.
+    processes = simulator.arrivals[::-1]
+    if type(simulator.kernel.scheduler) is FirstComeFirstServe:
+        records = fcfs_records(processes)
+    else:
+        records = RoundRobinTimeline(processes, simulator.kernel.scheduler.quantum, simulator.kernel.timer_interrupt_interval).run()
+    if records is None:
+        return False
+
+    last_time = None
+    for time, kind, pid, arg in records:
+        if last_time is not None and time != last_time:
+            simulator.log_sink.write_spacing()
+        simulator.log_sink.write_event(time, kind, pid, arg)
+        last_time = time
+    simulator.log_sink.write_spacing()
+
+    simulator.arrivals.clear()
+    simulator.next_pid = len(processes) + 1
+    simulator.current_process = 0
+    simulator.elapsed_time = last_time + 1
+    return True
+
+# Log events are (time, kind, pid, arg) tuples, as passed to LogSink.write_event.
+def arrival_event(time: MICRO_S, pid: int, process) -> tuple:
+    return time, LOG_ARRIVAL_KINDS[process.process_type], pid, process.priority
+
+def exit_event(time: MICRO_S, pid: int) -> tuple:
+    return time, LOG_EXIT, pid, 0
+
+def switch_event(time: MICRO_S, pid: int) -> tuple:
+    return time, LOG_SWITCH, pid, 0
+
+# Start and finish times of the processes run back to back in pid order.
+# A process switched to at s runs its first microsecond in the next step, so it finishes at s + duration.
+# NumPy is optional: without it the schedule is computed with a plain Python scan.
+# It is only imported here, as importing it takes longer than most simulations.
+def fcfs_schedule(arrivals: list[MICRO_S], durations: list[MICRO_S]) -> tuple[list[MICRO_S], list[MICRO_S]]:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        arrival = np.array(arrivals, dtype=np.int64)
+        duration = np.array(durations, dtype=np.int64)
+        # finish[i] = max(finish[i - 1], arrival[i]) + duration[i] unrolls into a running maximum over the total work.
+        work = np.cumsum(duration)
+        finish = work + np.maximum.accumulate(arrival - (work - duration))
+        return (finish - duration).tolist(), finish.tolist()
+
+    finishes = list(accumulate(zip(arrivals, durations), lambda finish, process: max(finish, process[0]) + process[1], initial=0))[1:]
+    return [finish - duration for finish, duration in zip(finishes, durations)], finishes
+
+# The FCFS log. In each microsecond the exiting process logs before the arrivals.
+# An arriving process is switched to if the CPU is free, and an exiting one hands over to the next process if it has arrived.
+def fcfs_records(processes: list) -> list[tuple] | None:
+    arrivals = [process.arrival for process in processes]
+    starts, finishes = fcfs_schedule(arrivals, [max(process.total_cpu_time, 1) for process in processes])
+
+    # The idle process runs from the first step until the first arrival, and from each exit until the next start.
+    if arrivals[0] + 1 >= IDLE_LIMIT:
+        return None
+    for i in range(1, len(processes)):
+        if starts[i] - finishes[i - 1] >= IDLE_LIMIT:
+            return None
+
+    records = []
+    arriving = 0
+    for exiting in range(len(processes) + 1):
+        time = finishes[exiting] if exiting < len(processes) else math.inf
+        while arriving < len(processes) and arrivals[arriving] < time:
+            records.append(arrival_event(arrivals[arriving], arriving + 1, processes[arriving]))
+            if starts[arriving] == arrivals[arriving]:
+                records.append(switch_event(arrivals[arriving], arriving + 1))
+            arriving += 1
+        if exiting == len(processes):
+            break
+        records.append(exit_event(time, exiting + 1))
+        has_next = exiting + 1 < len(processes) and arrivals[exiting + 1] < time
+        records.append(switch_event(time, exiting + 2 if has_next else 0))
+    return records
+
+# The RR log, computed by jumping between arrivals, exits and quantum expiries and following RoundRobin.choose_next_process.
+# Timer interrupts in between change nothing, as the quantum has not expired or the CPU is idle with nothing ready.
+# Processes are referred to by index, pid - 1, and -1 is the idle process.
+class RoundRobinTimeline:
+    def __init__(self, processes: list, quantum: MICRO_S, interval: MICRO_S):
+        self.processes = processes
+        self.quantum = quantum
+        self.interval = interval
+        self.remaining = [max(process.total_cpu_time, 1) for process in processes]
+        self.ready = deque()
+        self.records = []
+        self.running = -1
+        # When the running process, or the idle process, was switched to. The idle process runs from the first step.
+        self.since = -1
+        self.last_time_checked = -1000
+
+    def switch(self, time: MICRO_S, new: int):
+        if self.running >= 0:
+            self.remaining[self.running] -= time - self.since
+        if new != self.running:
+            self.records.append(switch_event(time, new + 1))
+        self.running = new
+        self.since = time
+
+    # choose_next_process at kernel time k after an arrival or timer interrupt.
+    def choose(self, time: MICRO_S, k: MICRO_S):
+        if self.running >= 0 and k - self.last_time_checked < self.quantum:
+            return
+        self.last_time_checked = k
+        if self.running >= 0:
+            self.ready.append(self.running)
+        self.switch(time, self.ready.popleft() if len(self.ready) > 0 else -1)
+
+    # choose_next_process after the running process exited, which restarts the quantum either way.
+    def exit(self, time: MICRO_S, k: MICRO_S):
+        self.records.append(exit_event(time, self.running + 1))
+        self.last_time_checked = k
+        self.switch(time, self.ready.popleft() if len(self.ready) > 0 else -1)
+
+    def run(self) -> list[tuple] | None:
+        processes = self.processes
+        interval = self.interval
+        # A sentinel arrival after the last one saves bounds checks.
+        arrivals = [process.arrival for process in processes] + [math.inf]
+        arriving = 0
+        exited = 0
+        time = -1
+        while exited < len(processes):
+            if self.running >= 0:
+                next_exit = self.since + self.remaining[self.running]
+                # The first timer interrupt after this microsecond that is at least a quantum after the last check.
+                next_expiry = max(-(-(self.last_time_checked + self.quantum) // interval) * interval, (time // interval + 1) * interval)
+                time = min(arrivals[arriving], next_exit, next_expiry)
+            else:
+                if arrivals[arriving] - self.since >= IDLE_LIMIT:
+                    return None
+                next_exit = None
+                time = arrivals[arriving]
+
+            # The kernel's clock during syscalls and arrivals, before this microsecond's timer interrupt.
+            k = (time - 1) // interval * interval if time > 0 else 0
+            if time == next_exit:
+                self.exit(time, k)
+                exited += 1
+            while arrivals[arriving] == time:
+                self.records.append(arrival_event(time, arriving + 1, processes[arriving]))
+                self.ready.append(arriving)
+                arriving += 1
+                self.choose(time, k)
+            if time != 0 and time % interval == 0:
+                self.choose(time, time)
+        return self.records
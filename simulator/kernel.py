@@ -5,13 +5,26 @@
 
 
 from collections import deque
+from dataclasses import dataclass
 
 # PID is just an integer, but it is used to make it clear when a integer is expected to be a valid PID.
 PID = int
 
+# The tunable constants of the kernel. The defaults are the values the expected outputs were produced with.
+@dataclass(frozen=True)
+class KernelConfig:
+    # The simulator raises a timer interrupt every timer_interrupt_interval microseconds.
+    timer_interrupt_interval: int = 10
+    # The round robin quantum, used by RR and the Multilevel foreground level.
+    quantum: int = 40
+    # How long a Multilevel level keeps the CPU. A level whose process is exiting gives it up one timer interrupt sooner.
+    level_time_slice: int = 200
+
 # This class represents the PCB of processes.
 # It is only here for your convinience and can be modified however you see fit.
 class PCB:
+    # There is one PCB per process, so avoid a per-instance __dict__.
+    __slots__ = ("pid", "priority", "should_exit")
     pid: PID
 
     def __init__(self, pid: PID, priority: int = float('inf')):
@@ -23,10 +36,470 @@ class PCB:
         return f"PCB(pid={self.pid}, priority={self.priority}, should_exit={self.should_exit})"
 
 
+# Binary min-heap of PCBs ordered by key(pcb), with ties going to the PCB that was queued first.
+# Each PCB's position is indexed by pid so that a queued PCB can be removed in O(log n).
+# Only the running process changes priority, and it is never queued, so keys never change while a PCB is queued.
+class PCBHeap:
+    def __init__(self, key):
+        self.key = key
+        # Entries are (key(pcb), insertion number, pcb); insertion numbers are unique so PCBs are never compared.
+        self.heap: list[tuple] = []
+        self.index: dict[PID, int] = {}
+        self.insertions = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    # Iterates in the order the PCBs were queued, like the deque this replaces.
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap, key=lambda entry: entry[1]))
+
+    # Student logs print the queues, so they keep reading exactly like the deque this replaces.
+    def __repr__(self):
+        return f"deque({list(self)})"
+
+    # Named like deque.append so syscall handlers can queue a PCB regardless of the structure behind the queue.
+    def append(self, pcb: PCB):
+        self.heap.append((self.key(pcb), self.insertions, pcb))
+        self.insertions += 1
+        self.index[pcb.pid] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def peek(self) -> PCB:
+        return self.heap[0][2]
+
+    def pop(self) -> PCB:
+        return self.remove(self.heap[0][2])
+
+    def remove(self, pcb: PCB) -> PCB:
+        i = self.index.pop(pcb.pid)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.index[last[2].pid] = i
+            self._sift_up(i)
+            self._sift_down(self.index[last[2].pid])
+        return pcb
+
+    def _swap(self, i: int, j: int):
+        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.index[self.heap[i][2].pid] = i
+        self.index[self.heap[j][2].pid] = j
+
+    def _sift_up(self, i: int):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[i] >= self.heap[parent]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int):
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self.heap) and self.heap[child] < self.heap[smallest]:
+                    smallest = child
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+
+def pid_key(pcb: PCB):
+    return pcb.pid
+
+def priority_key(pcb: PCB):
+    return (pcb.priority, pcb.pid)
+
+def priority_only_key(pcb: PCB):
+    return pcb.priority
+
+
+# Remembers the last decision of a timer interrupt that left the running process running.
+# The decision holds as long as nothing but the time changes: every entry point other than timer_interrupt may queue,
+# block or exit a process, so each one invalidates it.
+# Its fingerprint (the policy, the time since the last quantum or level check, whether the running process is exiting
+# and which queues are empty) fixes when the policy would next decide otherwise, so that time is all that is kept.
+# It is the scheduler's next_timer_interrupt, which tickless mode trusts in the same way.
+class DecisionCache:
+    __slots__ = ("valid_until", "hits", "misses")
+    # Kernel time before which a timer interrupt keeps the running process. -1 when no decision is cached.
+    valid_until: float
+    hits: int
+    misses: int
+
+    def __init__(self):
+        self.valid_until = -1
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"DecisionCache(valid_until={self.valid_until}, hits={self.hits}, misses={self.misses})"
+
+
 class Semaphore:
-    def __init__(self, initial_value: int):
+    def __init__(self, initial_value: int, blocked_queue: deque[PCB] | PCBHeap):
         self.value = initial_value
-        self.blocked_queue = deque()
+        self.blocked_queue = blocked_queue
+
+
+# Scheduling policies by the name used for scheduling_algorithm in simulation descriptions.
+# A policy is added with the register_scheduler decorator, without changing the Kernel.
+SCHEDULERS: dict[str, type["Scheduler"]] = {}
+
+def register_scheduler(name: str):
+    def register(scheduler: type["Scheduler"]) -> type["Scheduler"]:
+        SCHEDULERS[name] = scheduler
+        return scheduler
+    return register
+
+
+# A scheduling policy picks the process the kernel runs.
+# It owns the queues ready processes wait in and decides which blocked process v() and unlock() wake up.
+# The kernel keeps the state shared by every policy: running, idle_pcb, time and the logger.
+class Scheduler:
+    kernel: "Kernel"
+    ready_queue: deque[PCB] | PCBHeap
+    # Whether v() reschedules. If not, the process calling v() keeps running.
+    reschedules_on_semaphore_v = True
+    # Whether unlock() hands the mutex to a waiting process. The simulator stops a policy that doesn't before it has to.
+    wakes_mutex_waiters = True
+
+    def __init__(self, kernel: "Kernel"):
+        self.kernel = kernel
+        self.ready_queue = deque()
+
+    # Queues a process that has just arrived.
+    def add_process(self, pcb: PCB, process_type: str):
+        self.ready_queue.append(pcb)
+
+    # Queues a process that v() or unlock() woke up.
+    def make_ready(self, pcb: PCB):
+        self.ready_queue.append(pcb)
+
+    # Called on every timer interrupt, after kernel.time has advanced by interval.
+    def timer_tick(self, interval: int):
+        pass
+
+    # Updates kernel.running to the process that should run now and returns its pid.
+    def choose_next_process(self) -> PID:
+        raise NotImplementedError()
+
+    # Returns the kernel time of the next timer interrupt this policy needs, or None if it needs none before the next
+    # syscall or arrival. In tickless mode the interrupts before then are skipped, so they must not change anything
+    # but the time. By default every interrupt is needed.
+    def next_timer_interrupt(self) -> int | None:
+        return self.kernel.time + self.kernel.timer_interrupt_interval
+
+    # Processes blocked on a semaphore wait in a heap whose top is the process v() wakes up.
+    def new_semaphore_queue(self) -> deque[PCB] | PCBHeap:
+        return PCBHeap(pid_key)
+
+    def new_mutex_queue(self) -> deque[PCB] | PCBHeap:
+        return PCBHeap(pid_key)
+
+    # Returns the blocked process v() wakes up, or None to leave it blocked.
+    def semaphore_waiter_to_wake(self, blocked_queue: deque[PCB] | PCBHeap) -> PCB | None:
+        return blocked_queue.pop()
+
+    def mutex_waiter_to_wake(self, waiting_queue: deque[PCB] | PCBHeap) -> PCB:
+        return waiting_queue.pop()
+
+    # Number of processes waiting to run, which the SMP simulator balances across cores.
+    def ready_count(self) -> int:
+        return len(self.ready_queue)
+
+    # Removes a waiting process for another core to run, or returns None if none is waiting.
+    # A deque gives up its most recently queued process, a heap its best one.
+    def steal(self) -> PCB | None:
+        return self.ready_queue.pop() if len(self.ready_queue) > 0 else None
+
+
+@register_scheduler("FCFS")
+class FirstComeFirstServe(Scheduler):
+    reschedules_on_semaphore_v = False
+
+    def choose_next_process(self):
+        kernel = self.kernel
+        # If there is no process running or if the current process has finished, replace it with the next process
+        if (kernel.running == kernel.idle_pcb) or kernel.running.should_exit:
+            kernel.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else kernel.idle_pcb
+            return kernel.running.pid
+        return kernel.running.pid
+
+    # The running process is never preempted, so an interrupt only matters when the CPU is free and someone is waiting.
+    def next_timer_interrupt(self):
+        kernel = self.kernel
+        if kernel.running.should_exit or (kernel.running == kernel.idle_pcb and len(self.ready_queue) > 0):
+            return kernel.time + kernel.timer_interrupt_interval
+        return None
+
+
+@register_scheduler("Priority")
+class Priority(Scheduler):
+    def __init__(self, kernel: "Kernel"):
+        super().__init__(kernel)
+        self.ready_queue = PCBHeap(priority_key)
+
+    # Processes blocked on a semaphore are woken by lowest (priority, pid).
+    def new_semaphore_queue(self) -> PCBHeap:
+        return PCBHeap(priority_key)
+
+    # Processes waiting on a mutex are woken by lowest priority, ties going to the process that has waited longest.
+    def new_mutex_queue(self) -> PCBHeap:
+        return PCBHeap(priority_only_key)
+
+    def choose_next_process(self):
+        kernel = self.kernel
+        # If the current process has finished, stop it and remove from consideration
+        if kernel.running.should_exit:
+            kernel.running = kernel.idle_pcb
+
+        # The ready queue is a heap on (priority, pid), so its top is the best waiting process.
+        # The running process keeps the CPU unless that process beats it.
+        if len(self.ready_queue) == 0:
+            return kernel.running.pid
+        if kernel.running != kernel.idle_pcb:
+            if priority_key(kernel.running) < priority_key(self.ready_queue.peek()):
+                return kernel.running.pid
+            self.ready_queue.append(kernel.running)
+
+        kernel.running = self.ready_queue.pop()
+        return kernel.running.pid
+
+    # Priorities only change in syscalls, so an interrupt only matters if the running process no longer beats the heap top.
+    def next_timer_interrupt(self):
+        kernel = self.kernel
+        if not kernel.running.should_exit:
+            if len(self.ready_queue) == 0:
+                return None
+            if kernel.running != kernel.idle_pcb and priority_key(kernel.running) < priority_key(self.ready_queue.peek()):
+                return None
+        return kernel.time + kernel.timer_interrupt_interval
+
+
+@register_scheduler("RR")
+class RoundRobin(Scheduler):
+    def __init__(self, kernel: "Kernel"):
+        super().__init__(kernel)
+        self.quantum = kernel.config.quantum
+        self.last_time_checked = -1000
+
+    def choose_next_process(self):
+        kernel = self.kernel
+        # Don't do anything if the quantum hasn't passed yet
+        if kernel.time - self.last_time_checked < self.quantum:
+            if kernel.running.should_exit or kernel.running == kernel.idle_pcb:
+                kernel.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else kernel.idle_pcb
+                self.last_time_checked = kernel.time - kernel.time % kernel.timer_interrupt_interval
+            return kernel.running.pid
+        
+        self.last_time_checked = kernel.time
+
+        # Case: If current process is running and it hasn't finished add it back to the ready queue
+        if not kernel.running == kernel.idle_pcb and not kernel.running.should_exit:
+            self.ready_queue.append(kernel.running)
+        
+        # Get next process from ready queue
+        kernel.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else kernel.idle_pcb
+        return kernel.running.pid
+
+    # A running process needs the interrupt that ends its quantum.
+    # While the CPU is idle the quantum start does not matter: whichever call picks the next process restarts it.
+    def next_timer_interrupt(self):
+        kernel = self.kernel
+        if kernel.running.should_exit:
+            return kernel.time + kernel.timer_interrupt_interval
+        if kernel.running == kernel.idle_pcb:
+            return kernel.time + kernel.timer_interrupt_interval if len(self.ready_queue) > 0 else None
+        return max(self.last_time_checked + self.quantum, kernel.time + kernel.timer_interrupt_interval)
+
+
+@register_scheduler("Multilevel")
+class Multilevel(Scheduler):
+    wakes_mutex_waiters = False
+
+    # Multilevel is a state machine over current_level: None until the first process arrives,
+    # then "Foreground" (round robin) or "Background" (FCFS).
+    # Rather than the last times a level or quantum started, it keeps the deadlines at which they end,
+    # so a call before both deadlines that finds the running process still running is an O(1) no-op.
+    def __init__(self, kernel: "Kernel"):
+        super().__init__(kernel)
+        # A level keeps the CPU for level_time_slice of kernel time, or exiting_level_time_slice when its process is exiting.
+        self.level_time_slice = kernel.config.level_time_slice
+        self.exiting_level_time_slice = kernel.config.level_time_slice - kernel.config.timer_interrupt_interval
+        # Foreground processes are round robin scheduled with a quantum of foreground time.
+        self.foreground_quantum = kernel.config.quantum
+        self.foreground_queue = deque()
+        self.background_queue = deque()
+        self.current_level = None
+        # Kernel time at which the current level's slice ends.
+        self.level_deadline = -1000 + self.level_time_slice
+        # Time spent at each level, advanced by timer interrupts.
+        self.foreground_time = 0
+        self.background_time = 0
+        # Foreground time at which the current foreground quantum ends.
+        self.quantum_deadline = -1000 + self.foreground_quantum
+
+    def add_process(self, pcb: PCB, process_type: str):
+        if process_type == "Foreground":
+            self.foreground_queue.append(pcb)
+        else:
+            self.background_queue.append(pcb)
+
+    def timer_tick(self, interval: int):
+        if self.current_level == "Foreground":
+            self.foreground_time += interval
+        elif self.current_level == "Background":
+            self.background_time += interval
+
+    def choose_next_process(self) -> PID:
+        kernel = self.kernel
+        running = kernel.running
+        if not kernel.logger.enabled and running != kernel.idle_pcb and not running.should_exit and kernel.time < self.level_deadline \
+                and (self.current_level == "Background" or self.foreground_time < self.quantum_deadline):
+            return running.pid
+        x = self.schedule()
+        if kernel.logger.enabled:
+            kernel.logger.log(x)
+        return x
+
+    # Without student logs an interrupt only matters at a deadline, or while the CPU is free and a level has been picked.
+    def next_timer_interrupt(self):
+        kernel = self.kernel
+        if kernel.logger.enabled or kernel.running.should_exit:
+            return kernel.time + kernel.timer_interrupt_interval
+        if kernel.running == kernel.idle_pcb:
+            return kernel.time + kernel.timer_interrupt_interval if self.current_level is not None else None
+        deadline = self.level_deadline
+        if self.current_level == "Foreground":
+            # Foreground time advances with kernel time while the foreground level runs.
+            deadline = min(deadline, kernel.time + self.quantum_deadline - self.foreground_time)
+        return max(deadline, kernel.time + kernel.timer_interrupt_interval)
+
+    # Multilevel does not wake processes blocked on a semaphore, so they simply wait in a deque.
+    def new_semaphore_queue(self) -> deque[PCB]:
+        return deque()
+
+    def new_mutex_queue(self) -> deque[PCB]:
+        return deque()
+
+    def semaphore_waiter_to_wake(self, blocked_queue: deque[PCB]) -> None:
+        return None
+
+    def ready_count(self) -> int:
+        return len(self.foreground_queue) + len(self.background_queue)
+
+    # Background processes are given up first, as they are the last to run here.
+    # switch_level may have queued the idle process, which stays with its core.
+    def steal(self) -> PCB | None:
+        for queue in (self.background_queue, self.foreground_queue):
+            for i in range(len(queue) - 1, -1, -1):
+                if queue[i] is not self.kernel.idle_pcb:
+                    pcb = queue[i]
+                    del queue[i]
+                    return pcb
+        return None
+
+    def schedule(self) -> PID:
+        kernel = self.kernel
+        # Formatting the queues is the expensive part of these logs, so skip it entirely when they are discarded.
+        if kernel.logger.enabled:
+            kernel.logger.log(f"Current level: {self.current_level}")
+            kernel.logger.log(f"Foreground queue: {self.foreground_queue}")
+            kernel.logger.log(f"Background queue: {self.background_queue}")
+            kernel.logger.log(f"Foreground time: {self.foreground_time}")
+            kernel.logger.log(f"Background time: {self.background_time}")
+
+        if self.current_level is None:
+            self.enter_first_level()
+            if self.current_level is None:
+                return kernel.running.pid
+
+        if kernel.logger.enabled:
+            last_time_level_changed = self.level_deadline - self.level_time_slice
+            kernel.logger.log(f"Time: {kernel.time}, Last level changed: {last_time_level_changed}, Time - Last level changed: {kernel.time - last_time_level_changed}")
+
+        if self.level_slice_over():
+            self.switch_level()
+
+        if self.current_level == "Foreground":
+            return self.schedule_foreground()
+        return self.schedule_background()
+
+    # Nothing has run yet: start at the level of the first waiting process.
+    def enter_first_level(self):
+        kernel = self.kernel
+        if len(self.foreground_queue) > 0:
+            self.current_level = "Foreground"
+            kernel.running = self.foreground_queue.popleft()
+        elif len(self.background_queue) > 0:
+            self.current_level = "Background"
+            kernel.running = self.background_queue.popleft()
+        if kernel.logger.enabled:
+            kernel.logger.log(f"Current level: {self.current_level}")
+
+    def level_slice_over(self) -> bool:
+        kernel = self.kernel
+        if kernel.running.should_exit:
+            current_queue = self.foreground_queue if self.current_level == "Foreground" else self.background_queue
+            return kernel.time >= self.level_deadline - self.level_time_slice + self.exiting_level_time_slice or len(current_queue) == 0
+        return kernel.time >= self.level_deadline or kernel.running == kernel.idle_pcb
+
+    # Hands the CPU to the other level if it has processes waiting, and starts a new level slice either way.
+    def switch_level(self):
+        kernel = self.kernel
+        if self.current_level == "Foreground" and len(self.background_queue) > 0:
+            self.current_level = "Background"
+            if not kernel.running.should_exit:
+                # A process preempted mid-quantum resumes first when the foreground level comes back.
+                if self.foreground_time < self.quantum_deadline:
+                    self.foreground_queue.appendleft(kernel.running)
+                else:
+                    self.foreground_queue.append(kernel.running)
+            if kernel.logger.enabled:
+                kernel.logger.log("Moving to background")
+            kernel.running = kernel.idle_pcb
+        elif self.current_level == "Background" and len(self.foreground_queue) > 0:
+            self.current_level = "Foreground"
+            if not kernel.running.should_exit:
+                self.background_queue.appendleft(kernel.running)
+            if kernel.logger.enabled:
+                kernel.logger.log("Moving to foreground")
+            kernel.running = kernel.idle_pcb
+
+        self.level_deadline = kernel.time + self.level_time_slice
+
+    # Round robin on foreground time.
+    def schedule_foreground(self) -> PID:
+        kernel = self.kernel
+        if kernel.logger.enabled:
+            kernel.logger.log(f"Foreground time: {self.foreground_time}, Last time foreground checked: {self.quantum_deadline - self.foreground_quantum}")
+        # Don't do anything if the quantum hasn't passed yet
+        if self.foreground_time < self.quantum_deadline:
+            if kernel.running.should_exit or kernel.running == kernel.idle_pcb:
+                if kernel.running != kernel.idle_pcb:
+                    self.quantum_deadline = self.foreground_time - self.foreground_time % kernel.timer_interrupt_interval + self.foreground_quantum
+                kernel.running = self.foreground_queue.popleft() if len(self.foreground_queue) > 0 else kernel.idle_pcb
+            return kernel.running.pid
+
+        self.quantum_deadline = self.foreground_time + self.foreground_quantum
+
+        # Case: If current process is running and it hasn't finished add it back to the ready queue
+        if not kernel.running == kernel.idle_pcb and not kernel.running.should_exit:
+            self.foreground_queue.append(kernel.running)
+
+        # Get next process from ready queue
+        kernel.running = self.foreground_queue.popleft() if len(self.foreground_queue) > 0 else kernel.idle_pcb
+        return kernel.running.pid
+
+    # FCFS: the running process keeps the CPU until it exits or blocks.
+    def schedule_background(self) -> PID:
+        kernel = self.kernel
+        if kernel.running.should_exit or kernel.running == kernel.idle_pcb:
+            kernel.running = self.background_queue.popleft() if len(self.background_queue) > 0 else kernel.idle_pcb
+        return kernel.running.pid
 
 
 # This class represents the Kernel of the simulation.
@@ -34,238 +507,76 @@ class Semaphore:
 # DO NOT modify the name of this class or remove it.
 class Kernel:
     scheduling_algorithm: str
-    ready_queue: deque[PCB]
-    waiting_queue: deque[PCB]
+    config: KernelConfig
+    timer_interrupt_interval: int
+    scheduler: Scheduler
     running: PCB
     idle_pcb: PCB
     semaphores: dict[int, Semaphore]
+    decision_cache: DecisionCache
 
     # Called before the simulation begins.
     # Use this method to initilize any variables you need throughout the simulation.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def __init__(self, scheduling_algorithm: str, logger):
         self.scheduling_algorithm = scheduling_algorithm
-        self.ready_queue: deque[PCB] = deque()
-        self.waiting_queue = deque()
         self.idle_pcb = PCB(0)
         self.running = self.idle_pcb
         self.logger = logger
         self.time = 0
-        self.last_time_checked = -1000
 
         # For mutexes and semaphores
         self.mutexes = {}
         self.semaphores = {}
+        self.decision_cache = DecisionCache()
 
-        # For multilevel only
-        self.foreground_queue = deque()
-        self.background_queue = deque()
-        self.current_level = None
-        self.last_time_level_changed = -1000
-        self.foreground_time = 0
-        self.background_time = 0
-        self.last_time_foreground_checked = -1000
-        self.last_time_background_checked = -1000
+        if scheduling_algorithm not in SCHEDULERS:
+            raise NotImplementedError(f"Invalid scheduling algorithm: {scheduling_algorithm}")
+        self.configure(KernelConfig())
+
+    # Replaces the tunable constants. The scheduling policy is rebuilt, so this must happen before the first process arrives.
+    def configure(self, config: KernelConfig):
+        self.config = config
+        self.timer_interrupt_interval = config.timer_interrupt_interval
+        self.scheduler = SCHEDULERS[self.scheduling_algorithm](self)
+        self.invalidate_decision()
+
+        # This is where the next process to run is selected.
+        # It is bound to the scheduling policy once here, so no call has to dispatch on scheduling_algorithm.
+        self.choose_next_process = self.scheduler.choose_next_process
 
     # This method is triggered every time a new process has arrived.
     # new_process is this process's PID.
     # priority is the priority of new_process.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def new_process_arrived(self, new_process: PID, priority: int, process_type: str) -> PID:
-        if self.scheduling_algorithm == "Multilevel":
-            if process_type == "Foreground":
-                self.foreground_queue.append(PCB(new_process, priority))
-            else:
-                self.background_queue.append(PCB(new_process, priority))
-        else:
-            self.ready_queue.append(PCB(new_process, priority))
+        self.decision_cache.valid_until = -1
+        self.scheduler.add_process(PCB(new_process, priority), process_type)
         return self.choose_next_process()
 
     # This method is triggered every time the current process performs an exit syscall.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_exit(self) -> PID:
+        self.decision_cache.valid_until = -1
         self.running.should_exit = True
         return self.choose_next_process()
 
     # This method is triggered when the currently running process requests to change its priority.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_set_priority(self, new_priority: int) -> PID:
+        self.decision_cache.valid_until = -1
         self.running.priority = new_priority
         return self.choose_next_process()
 
-
-    # This is where you can select the next process to run.
-    # This method is not directly called by the simulator and is purely for your convinience.
-    # Feel free to modify this method as you see fit.
-    # It is not required to actually use this method but it is recommended.
-    def choose_next_process(self):
-        match self.scheduling_algorithm:
-            case "FCFS":
-                return self.first_come_first_serve()
-            case "Priority":
-                return self.priority()
-            case "RR":
-                x = self.round_robin()
-                return x
-            case "Multilevel":
-                x = self.multilevel()
-                self.logger.log(x)
-                return x
-            case _:
-                raise NotImplementedError(f"Invalid scheduling algorithm: {self.scheduling_algorithm}")
-    
-    def first_come_first_serve(self):
-        # If there is no process running or if the current process has finished, replace it with the next process
-        if (self.running == self.idle_pcb) or self.running.should_exit:
-            self.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else self.idle_pcb
-            return self.running.pid
-        return self.running.pid
-    
-    def priority(self):
-        # If the current process has finished, stop it and remove from consideration
-        if self.running.should_exit:
-            self.running = self.idle_pcb
-
-        # Find the process with the highest priority and min pid (for tie breaking)
-        min_priority = float('inf')
-        min_pid = float('inf')
-        min_pcb = None
-        for process in [i for i in self.ready_queue] + [self.running]: # Also consider the current running process
-            if process.priority < min_priority:
-                min_priority = process.priority
-                min_pid = process.pid
-                min_pcb = process
-            elif process.priority == min_priority and process.pid < min_pid:
-                min_priority = process.priority
-                min_pid = process.pid
-                min_pcb = process
-        
-        # If the current running process is the one with highest priority, do nothing
-        if self.running.pid == min_pid:
-            return self.running.pid
-        
-        # Add the current running process back to the ready queue
-        self.ready_queue.append(self.running)
-        
-        # Set the new running process to the one with highest priority and remove it from the ready queue
-        self.running = min_pcb
-        self.ready_queue.remove(min_pcb)
-
-        # Return the new running process
-        return self.running.pid
-    
-    def round_robin(self):
-        # Don't do anything if the quantum hasn't passed yet
-        if self.time - self.last_time_checked < 40:
-            if self.running.should_exit or self.running == self.idle_pcb:
-                self.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else self.idle_pcb
-                self.last_time_checked = self.time - self.time % 10
-            return self.running.pid
-        
-        self.last_time_checked = self.time
-
-        # Case: If current process is running and it hasn't finished add it back to the ready queue
-        if not self.running == self.idle_pcb and not self.running.should_exit:
-            self.ready_queue.append(self.running)
-        
-        # Get next process from ready queue
-        self.running = self.ready_queue.popleft() if len(self.ready_queue) > 0 else self.idle_pcb
-        return self.running.pid
-    
-    def multilevel(self):
-        self.logger.log(f"Current level: {self.current_level}")
-        self.logger.log(f"Foreground queue: {self.foreground_queue}")
-        self.logger.log(f"Background queue: {self.background_queue}")
-        self.logger.log(f"Foreground time: {self.foreground_time}")
-        self.logger.log(f"Background time: {self.background_time}")
-
-        # If nothing has ran yet
-        if self.current_level is None:
-            if len(self.foreground_queue) > 0:
-                self.current_level = "Foreground"
-                self.running = self.foreground_queue.popleft()
-                self.logger.log(f"Current level: {self.current_level}")
-            elif len(self.background_queue) > 0:
-                self.current_level = "Background"
-                self.running = self.background_queue.popleft()
-                self.logger.log(f"Current level: {self.current_level}")
-            else:
-                self.current_level = None
-                self.logger.log(f"Current level: {self.current_level}")
-                return self.running.pid
-            
-
-        self.logger.log(f"Time: {self.time}, Last level changed: {self.last_time_level_changed}, Time - Last level changed: {self.time - self.last_time_level_changed}")
-
-        # Check to see if we need to change levels
-        current_queue = self.foreground_queue if self.current_level == "Foreground" else self.background_queue
-        if (self.time - self.last_time_level_changed >= (200 if not self.running.should_exit else 190)) or (len(current_queue) == 0 and self.running.should_exit) or (self.running == self.idle_pcb):
-            if self.current_level == "Foreground" and len(self.background_queue) > 0:
-                self.current_level = "Background"
-                if not self.running.should_exit:
-                    if self.foreground_time - self.last_time_foreground_checked < 40:
-                        self.foreground_queue.appendleft(self.running)
-                    else:
-                        self.foreground_queue.append(self.running)
-                self.logger.log("Moving to background")
-                self.running = self.idle_pcb
-            elif self.current_level == "Background" and len(self.foreground_queue) > 0:
-                self.current_level = "Foreground"
-                if not self.running.should_exit:
-                    self.background_queue.appendleft(self.running)
-                self.logger.log("Moving to foreground")
-                self.running = self.idle_pcb
-
-            self.last_time_level_changed = self.time
-
-
-        if self.current_level == "Foreground":
-            ############## ROUND ROBIN ##############
-            # Don't do anything if the quantum hasn't passed yet
-            self.logger.log(f"Foreground time: {self.foreground_time}, Last time foreground checked: {self.last_time_foreground_checked}")
-            if self.foreground_time - self.last_time_foreground_checked < 40:
-                if self.running.should_exit or self.running == self.idle_pcb:
-                    if self.running != self.idle_pcb:
-                        self.last_time_foreground_checked = self.foreground_time - self.foreground_time % 10
-                    self.running = self.foreground_queue.popleft() if len(self.foreground_queue) > 0 else self.idle_pcb
-
-                return self.running.pid
-            
-            self.last_time_foreground_checked = self.foreground_time
-
-            # Case: If current process is running and it hasn't finished add it back to the ready queue
-            if not self.running == self.idle_pcb and not self.running.should_exit:
-                self.foreground_queue.append(self.running)
-            
-            # Get next process from ready queue
-            self.running = self.foreground_queue.popleft() if len(self.foreground_queue) > 0 else self.idle_pcb
-            return self.running.pid
-            ############## ROUND ROBIN ##############
-        
-        elif self.current_level == "Background":
-            ############## FCFS ##############
-            if self.running.should_exit or self.running == self.idle_pcb:
-                self.running = self.background_queue.popleft() if len(self.background_queue) > 0 else self.idle_pcb
-                return self.running.pid
-            ############## FCFS ##############
-        
-        else:
-            raise Exception("Invalid level")
-        
-    
-
-                
-
-        return self.running.pid
-
     # This method is triggered when the currently running process requests to initialize a new semaphore.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_init_semaphore(self, semaphore_id: int, initial_value: int):
-        self.semaphores[semaphore_id] = Semaphore(initial_value)
+        self.semaphores[semaphore_id] = Semaphore(initial_value, self.scheduler.new_semaphore_queue())
     
     # This method is triggered when the currently running process calls p() on an existing semaphore.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_semaphore_p(self, semaphore_id: int) -> PID:
+        self.decision_cache.valid_until = -1
         semaphore = self.semaphores[semaphore_id]
         semaphore.value -= 1
 
@@ -279,35 +590,16 @@ class Kernel:
     # This method is triggered when the currently running process calls v() on an existing semaphore.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_semaphore_v(self, semaphore_id: int) -> PID:
+        self.decision_cache.valid_until = -1
         semaphore = self.semaphores[semaphore_id]
         semaphore.value += 1
 
-        if semaphore.value <= 0:
-            if len(semaphore.blocked_queue) > 0:
-                unblocked_pcb = None
-                if self.scheduling_algorithm in ["FCFS", "RR"]:
-                    min_pid = float('inf')
-                    for pcb in semaphore.blocked_queue:
-                        if pcb.pid < min_pid:
-                            min_pid = pcb.pid
-                            unblocked_pcb = pcb
-                elif self.scheduling_algorithm == "Priority":
-                    min_priority = float('inf')
-                    min_pid = float('inf')
-                    for pcb in semaphore.blocked_queue:
-                        if pcb.priority < min_priority:
-                            min_priority = pcb.priority
-                            min_pid = pcb.pid
-                            unblocked_pcb = pcb
-                        elif pcb.priority == min_priority and pcb.pid < min_pid:
-                            min_pid = pcb.pid
-                            unblocked_pcb = pcb
-
-                if unblocked_pcb:
-                    semaphore.blocked_queue.remove(unblocked_pcb)
-                    self.ready_queue.append(unblocked_pcb)
-
-        if self.scheduling_algorithm == "FCFS":
+        if semaphore.value <= 0 and len(semaphore.blocked_queue) > 0:
+            unblocked_pcb = self.scheduler.semaphore_waiter_to_wake(semaphore.blocked_queue)
+            if unblocked_pcb:
+                self.scheduler.make_ready(unblocked_pcb)
+
+        if not self.scheduler.reschedules_on_semaphore_v:
             return self.running.pid
         else:
             return self.choose_next_process()
@@ -316,12 +608,14 @@ class Kernel:
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_init_mutex(self, mutex_id: int):
         if mutex_id not in self.mutexes:
-            self.mutexes[mutex_id] = {"locked": False, "owner": None, "waiting_queue": deque()}
-        self.logger.log(self.mutexes)
+            self.mutexes[mutex_id] = {"locked": False, "owner": None, "waiting_queue": self.scheduler.new_mutex_queue()}
+        if self.logger.enabled:
+            self.logger.log(self.mutexes)
 
     # This method is triggered when the currently running process calls lock() on an existing mutex.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_mutex_lock(self, mutex_id: int) -> PID:
+        self.decision_cache.valid_until = -1
         mutex = self.mutexes[mutex_id]
         if mutex["locked"]:
             mutex["waiting_queue"].append(self.running)
@@ -330,40 +624,55 @@ class Kernel:
         else:
             mutex["locked"] = True
             mutex["owner"] = self.running.pid
-        self.logger.log(self.mutexes)
+        if self.logger.enabled:
+            self.logger.log(self.mutexes)
         return self.choose_next_process()
 
     # This method is triggered when the currently running process calls unlock() on an existing mutex.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def syscall_mutex_unlock(self, mutex_id: int) -> PID:
+        self.decision_cache.valid_until = -1
         mutex = self.mutexes[mutex_id]
         mutex["locked"] = False
         mutex["owner"] = None
 
-        if len(mutex["waiting_queue"]) > 0:
-            if self.scheduling_algorithm == "FCFS" or self.scheduling_algorithm == "RR":
-                released_process = min(mutex["waiting_queue"], key=lambda p: p.pid)
-            elif self.scheduling_algorithm == "Priority":
-                released_process = min(mutex["waiting_queue"], key=lambda p: p.priority)
-            else:
-                pass 
-            
-            mutex["waiting_queue"].remove(released_process)
-            self.ready_queue.append(released_process)
+        if len(mutex["waiting_queue"]) > 0 and self.scheduler.wakes_mutex_waiters:
+            released_process = self.scheduler.mutex_waiter_to_wake(mutex["waiting_queue"])
+            self.scheduler.make_ready(released_process)
             mutex["locked"] = True
             mutex["owner"] = released_process.pid
-        self.logger.log(self.mutexes)
+        if self.logger.enabled:
+            self.logger.log(self.mutexes)
         return self.choose_next_process()
 
     # This function represents the hardware timer interrupt.
-    # It is triggered every 10 microseconds and is the only way a kernel can track passing time.
+    # It is triggered every timer_interrupt_interval (10 by default) microseconds and is the only way a kernel can track passing time.
     # Do not use real time to track how much time has passed as time is simulated.
     # DO NOT rename or delete this method. DO NOT change its arguments.
     def timer_interrupt(self) -> PID:
-        self.time += 10
-        if self.current_level == "Foreground":
-            self.foreground_time += 10
-        elif self.current_level == "Background":
-            self.background_time += 10
+        self.time += self.timer_interrupt_interval
+        self.scheduler.timer_tick(self.timer_interrupt_interval)
+        cache = self.decision_cache
+        if self.time < cache.valid_until:
+            cache.hits += 1
+            return self.running.pid
+        cache.misses += 1
         self.choose_next_process()
-        return self.running.pid
\ No newline at end of file
+        next_interrupt = self.scheduler.next_timer_interrupt()
+        cache.valid_until = float('inf') if next_interrupt is None else next_interrupt
+        return self.running.pid
+
+    # Forgets the cached timer interrupt decision. Code that changes the scheduler's queues or kernel.running
+    # without going through an entry point, like the SMP simulator's work stealing, must call it.
+    def invalidate_decision(self):
+        self.decision_cache.valid_until = -1
+
+    # Tickless mode: returns the kernel time at which the next timer interrupt is needed,
+    # or None if none is needed before the next syscall or arrival.
+    def next_timer_interrupt(self) -> int | None:
+        return self.scheduler.next_timer_interrupt()
+
+    # Tickless mode: accounts for timer interrupts the simulator skipped because next_timer_interrupt did not need them.
+    def skip_timer_interrupts(self, count: int):
+        self.time += count * self.timer_interrupt_interval
+        self.scheduler.timer_tick(count * self.timer_interrupt_interval)
\ No newline at end of file
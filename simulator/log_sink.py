@@ -0,0 +1,299 @@
+import os
+import struct
+from io import BufferedIOBase, BytesIO, StringIO, TextIOBase
+from typing import Iterator
+
+MICRO_S = int
+
+# Number of log lines held in memory before they are written to the file in one call.
+DEFAULT_BUFFER_LINES = 65536
+# Number of records RecordLogSink holds in memory before it writes them out as one block.
+DEFAULT_BUFFER_RECORDS = 16384
+
+SIMULATOR_DELIMITER = ':'
+STUDENT_DELIMITER = '#'
+
+# Kinds of structured simulator log events, each logged with a pid and an integer argument.
+# Init events have no process: pid holds the semaphore or mutex id, and arg the initial value.
+LOG_FOREGROUND_ARRIVAL = 0
+LOG_BACKGROUND_ARRIVAL = 1
+LOG_EXIT = 2
+LOG_SWITCH = 3
+LOG_SET_PRIORITY = 4
+LOG_SEMAPHORE_P = 5
+LOG_SEMAPHORE_V = 6
+LOG_MUTEX_LOCK = 7
+LOG_MUTEX_UNLOCK = 8
+LOG_SEMAPHORE_INIT = 9
+LOG_MUTEX_INIT = 10
+
+# The text of each kind of event, by kind.
+LOG_MESSAGES = (
+    "Foreground process {pid} arrived with priority {arg}",
+    "Background process {pid} arrived with priority {arg}",
+    "Process {pid} has finished execution and is exiting",
+    "Context switching to pid: {pid}",
+    "Process {pid} set priority to {arg}",
+    "Process {pid} called p on semaphore {arg}",
+    "Process {pid} called v on semaphore {arg}",
+    "Process {pid} called lock on mutex {arg}",
+    "Process {pid} called unlock on mutex {arg}",
+    "Semaphore {pid} initilized with value {arg}",
+    "Mutex {pid} initilized",
+)
+
+# RecordLogSink records that are messages rather than structured events. Their encoded text follows the records of their block.
+RECORD_STUDENT_TEXT = 254
+RECORD_SIMULATOR_TEXT = 255
+# record count, text bytes; followed by the records and then the text of the message records
+RECORD_BLOCK = struct.Struct("<qq")
+# time, arg, pid, kind
+RECORD = struct.Struct("<qqiB3x")
+
+LOG_ARRIVAL_KINDS = {"Foreground": LOG_FOREGROUND_ARRIVAL, "Background": LOG_BACKGROUND_ARRIVAL}
+
+
+# Times are shown in milliseconds, e.g. 1.234ms, in the log and in the simulator's diagnostics.
+def format_time(time: MICRO_S) -> str:
+    return f"{time / 1000:.3f}ms"
+
+def format_prefix(time: MICRO_S, delimiter: str) -> str:
+    return f"{format_time(time)} {delimiter} "
+
+
+# A log sink receives the simulator's log events and is responsible for getting them into the log file.
+# Every event logged during one simulated microsecond is followed by a single spacing call.
+class LogSink:
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        raise NotImplementedError()
+
+    # A structured simulator event. Sinks that only keep text write its message.
+    def write_event(self, time: MICRO_S, kind: int, pid: int, arg: int):
+        self.write(time, SIMULATOR_DELIMITER, LOG_MESSAGES[kind].format(pid=pid, arg=arg))
+
+    def write_spacing(self):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+
+# Writes the text log format directly, buffering lines in memory and writing them out in bulk.
+# The timestamp prefix is only formatted once per simulated microsecond.
+# Without a path the log is kept in memory and can be read back with getvalue().
+class TextLogSink(LogSink):
+    logfile_path: str | None
+    # None after being restored from a checkpoint until the log file is reopened.
+    file: TextIOBase | None
+    # Length of the log file when the checkpoint this sink was restored from was taken.
+    checkpoint_offset: int
+    buffer: list[str]
+    buffer_lines: int
+    prefix_time: MICRO_S
+    prefixes: dict[str, str]
+
+    def __init__(self, logfile_path: str | None = None, buffer_lines: int = DEFAULT_BUFFER_LINES):
+        self.logfile_path = logfile_path
+        self.file = open(logfile_path, 'w') if logfile_path is not None else StringIO()
+        self.buffer = []
+        self.buffer_lines = buffer_lines
+        self.prefix_time = -1
+        self.prefixes = dict()
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        if time != self.prefix_time:
+            self.prefix_time = time
+            self.prefixes.clear()
+        prefix = self.prefixes.get(delimiter)
+        if prefix is None:
+            prefix = self.prefixes[delimiter] = format_prefix(time, delimiter)
+        self.buffer.append(f"{prefix}{message}\n")
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def write_spacing(self):
+        self.buffer.append("\n")
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.file is None:
+            self.reopen()
+        self.file.write("".join(self.buffer))
+        self.buffer.clear()
+
+    def getvalue(self) -> str:
+        self.flush()
+        return self.file.getvalue()
+
+    def close(self):
+        self.flush()
+        if self.logfile_path is not None:
+            self.file.close()
+
+    # A checkpoint keeps how much of the log file was written rather than the open file.
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        if self.logfile_path is not None:
+            state["file"] = self.file.tell()
+        return state
+
+    # The log file is only reopened once the restored sink is written to,
+    # so a checkpoint restored with a different sink leaves the original log alone.
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.logfile_path is not None:
+            self.checkpoint_offset = self.file
+            self.file = None
+
+    # Reopens the log file and drops anything written after the checkpoint was taken.
+    def reopen(self):
+        self.file = open(self.logfile_path, 'r+')
+        self.file.seek(self.checkpoint_offset)
+        self.file.truncate()
+
+
+# Records events compactly and only renders them to the text format when closed.
+# Records are buffered and written in blocks to <log>.records, so memory stays bounded however long the run is.
+# The records file is removed once the log is rendered, unless a checkpoint was taken, which needs it to resume.
+# Without a path the blocks are kept in memory.
+# Spacing is implied: every event of one microsecond shares a timestamp, so a blank line follows each run of equal times.
+# Only the final blank line is tracked explicitly, as a simulation that raised mid-microsecond never wrote it.
+class RecordLogSink(LogSink):
+    logfile_path: str | None
+    records_path: str | None
+    # None after being restored from a checkpoint until the records file is reopened.
+    file: BufferedIOBase | None
+    # Length of the records file when the checkpoint this sink was restored from was taken.
+    checkpoint_offset: int
+    buffer: bytearray
+    # Encoded text of the buffered records that are messages rather than structured events.
+    text: bytearray
+    buffer_records: int
+    buffered: int
+    count: int
+    spaced: int
+    checkpointed: bool
+
+    def __init__(self, logfile_path: str | None = None, buffer_records: int = DEFAULT_BUFFER_RECORDS):
+        self.logfile_path = logfile_path
+        self.records_path = f"{logfile_path}.records" if logfile_path is not None else None
+        self.file = open(self.records_path, 'w+b') if logfile_path is not None else BytesIO()
+        self.buffer = bytearray()
+        self.text = bytearray()
+        self.buffer_records = buffer_records
+        self.buffered = 0
+        self.count = 0
+        self.spaced = 0
+        self.checkpointed = False
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        # Student logs may pass live kernel objects, so they have to be formatted now rather than when rendered.
+        text = f"{message}".encode()
+        self.text += text
+        self.write_event(time, RECORD_STUDENT_TEXT if delimiter == STUDENT_DELIMITER else RECORD_SIMULATOR_TEXT, 0, len(text))
+
+    # Message records hold the length of their text in arg.
+    def write_event(self, time: MICRO_S, kind: int, pid: int, arg: int):
+        self.buffer += RECORD.pack(time, arg, pid, kind)
+        self.buffered += 1
+        self.count += 1
+        if self.buffered >= self.buffer_records:
+            self.flush()
+
+    def write_spacing(self):
+        self.spaced = self.count
+
+    def flush(self):
+        if self.file is None:
+            self.reopen()
+        if self.buffered == 0:
+            return
+        self.file.write(RECORD_BLOCK.pack(self.buffered, len(self.text)) + self.buffer + self.text)
+        self.buffer.clear()
+        self.text.clear()
+        self.buffered = 0
+
+    def __len__(self):
+        return self.count
+
+    # Yields (time, delimiter, message) of every record in log order, reading the blocks back one at a time.
+    def records(self) -> Iterator[tuple[MICRO_S, str, str]]:
+        self.flush()
+        end = self.file.tell()
+        self.file.seek(0)
+        try:
+            while self.file.tell() < end:
+                records, text_bytes = RECORD_BLOCK.unpack(self.file.read(RECORD_BLOCK.size))
+                block = self.file.read(records * RECORD.size)
+                text = self.file.read(text_bytes)
+                offset = 0
+                for time, arg, pid, kind in RECORD.iter_unpack(block):
+                    if kind < len(LOG_MESSAGES):
+                        yield time, SIMULATOR_DELIMITER, LOG_MESSAGES[kind].format(pid=pid, arg=arg)
+                    else:
+                        yield time, STUDENT_DELIMITER if kind == RECORD_STUDENT_TEXT else SIMULATOR_DELIMITER, \
+                            text[offset:offset + arg].decode()
+                        offset += arg
+        finally:
+            self.file.seek(end)
+
+    # Renders the records in the same format TextLogSink writes.
+    def render(self, sink: LogSink):
+        last_time = None
+        for time, delimiter, message in self.records():
+            if last_time is not None and time != last_time:
+                sink.write_spacing()
+            sink.write(time, delimiter, message)
+            last_time = time
+        if last_time is not None and self.spaced == self.count:
+            sink.write_spacing()
+
+    def close(self):
+        if self.logfile_path is not None:
+            # The rendered lines are flushed as often as records are, so rendering holds no more in memory than recording.
+            text_sink = TextLogSink(self.logfile_path, self.buffer_records)
+            self.render(text_sink)
+            text_sink.close()
+            self.file.close()
+            if not self.checkpointed:
+                os.remove(self.records_path)
+
+    # A checkpoint keeps how many bytes of records were written rather than the open file.
+    def __getstate__(self):
+        self.flush()
+        self.checkpointed = True
+        state = self.__dict__.copy()
+        if self.records_path is not None:
+            state["file"] = self.file.tell()
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.records_path is not None:
+            self.checkpoint_offset = self.file
+            self.file = None
+
+    # Reopens the records file and drops any records written after the checkpoint was taken.
+    def reopen(self):
+        self.file = open(self.records_path, 'r+b')
+        self.file.seek(self.checkpoint_offset)
+        self.file.truncate()
+
+
+# Discards the log and only counts events, for measuring the simulator without log I/O.
+class CountingLogSink(LogSink):
+    events: int
+
+    def __init__(self):
+        self.events = 0
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        self.events += 1
+
+    def write_spacing(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,216 @@
+import csv
+import json
+import time
+from dataclasses import dataclass, asdict
+
+from kernel import DecisionCache
+
+MICRO_S = int
+PID = int
+
+# Every method the simulator calls on the kernel.
+KERNEL_ENTRY_POINTS = (
+    "new_process_arrived",
+    "syscall_exit",
+    "syscall_set_priority",
+    "syscall_init_semaphore",
+    "syscall_semaphore_p",
+    "syscall_semaphore_v",
+    "syscall_init_mutex",
+    "syscall_mutex_lock",
+    "syscall_mutex_unlock",
+    "timer_interrupt",
+    "next_timer_interrupt",
+    "skip_timer_interrupts",
+)
+
+@dataclass(slots=True)
+class ProcessMetrics:
+    pid: PID
+    process_type: str
+    priority: int
+    arrival: MICRO_S
+    cpu_time: MICRO_S
+    first_run: MICRO_S | None = None
+    exit: MICRO_S | None = None
+    # Number of times the process was switched to.
+    dispatches: int = 0
+    # Time spent waiting on semaphores and mutexes.
+    sync_wait: MICRO_S = 0
+
+    def turnaround(self) -> MICRO_S | None:
+        return None if self.exit is None else self.exit - self.arrival
+
+    # Time the process existed without running, whether it was ready or blocked.
+    def waiting(self) -> MICRO_S | None:
+        return None if self.exit is None else self.exit - self.arrival - self.cpu_time
+
+    def response(self) -> MICRO_S | None:
+        return None if self.first_run is None else self.first_run - self.arrival
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "turnaround": self.turnaround(), "waiting": self.waiting(), "response": self.response()}
+
+@dataclass(slots=True)
+class SyncMetrics:
+    kind: str
+    id: int
+    waits: int = 0
+    total_wait: MICRO_S = 0
+    max_wait: MICRO_S = 0
+
+
+# Collects scheduling metrics from the simulator's view of a run: arrivals, exits and context switches.
+# A process waits on a semaphore or mutex from a p() or lock() call that takes the CPU away from it until it runs again.
+class MetricsCollector:
+    processes: dict[PID, ProcessMetrics]
+    sync: dict[tuple[str, int], SyncMetrics]
+    # (kind, id, start time) of each process currently waiting on a semaphore or mutex.
+    sync_waiting: dict[PID, tuple[str, int, MICRO_S]]
+    context_switches: int
+    idle_time: MICRO_S
+    idle_since: MICRO_S | None
+    end_time: MICRO_S
+
+    def __init__(self):
+        self.processes = dict()
+        self.sync = dict()
+        self.sync_waiting = dict()
+        self.context_switches = 0
+        self.idle_time = 0
+        # The idle process runs from the start of the simulation.
+        self.idle_since = 0
+        self.end_time = 0
+
+    def process_arrived(self, pid: PID, time: MICRO_S, cpu_time: MICRO_S, priority: int, process_type: str):
+        self.processes[pid] = ProcessMetrics(pid, process_type, priority, time, cpu_time)
+
+    def process_exited(self, pid: PID, time: MICRO_S):
+        self.processes[pid].exit = time
+        self.end_time = time
+
+    def process_switched(self, old_pid: PID, new_pid: PID, time: MICRO_S):
+        self.context_switches += 1
+        if old_pid == 0:
+            self.idle_time += time - self.idle_since
+            self.idle_since = None
+        if new_pid == 0:
+            self.idle_since = time
+            return
+
+        process = self.processes[new_pid]
+        process.dispatches += 1
+        if process.first_run is None:
+            process.first_run = time
+        if new_pid in self.sync_waiting:
+            kind, id, start = self.sync_waiting.pop(new_pid)
+            sync = self.sync.get((kind, id))
+            if sync is None:
+                sync = self.sync[(kind, id)] = SyncMetrics(kind, id)
+            sync.waits += 1
+            sync.total_wait += time - start
+            sync.max_wait = max(sync.max_wait, time - start)
+            process.sync_wait += time - start
+
+    # Called after a p() or lock() call that switched away from pid.
+    def sync_wait_started(self, kind: str, id: int, pid: PID, time: MICRO_S):
+        self.sync_waiting[pid] = (kind, id, time)
+
+    def aggregate(self) -> dict:
+        finished = [process for process in self.processes.values() if process.exit is not None]
+        aggregate = {"processes": len(self.processes), "finished": len(finished)}
+        for name in ("turnaround", "waiting", "response"):
+            values = [getattr(process, name)() for process in finished]
+            aggregate[f"mean_{name}"] = sum(values) / len(values) if len(values) > 0 else None
+            aggregate[f"max_{name}"] = max(values, default=None)
+        aggregate["context_switches"] = self.context_switches
+        aggregate["idle_time"] = self.idle_time
+        aggregate["end_time"] = self.end_time
+        return aggregate
+
+    def report(self) -> dict:
+        return {
+            "aggregate": self.aggregate(),
+            "processes": [process.as_dict() for process in self.processes.values()],
+            "sync_waits": [asdict(sync) for sync in sorted(self.sync.values(), key=lambda sync: (sync.kind, sync.id))],
+        }
+
+    def write_json(self, path: str, profiler: "KernelProfiler | None" = None):
+        report = self.report()
+        if profiler is not None:
+            report["profile"] = profiler.report()
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    # Writes every statistic as a (scope, id, metric, value) row so that one table holds all of them.
+    def write_csv(self, path: str, profiler: "KernelProfiler | None" = None):
+        report = self.report()
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["scope", "id", "metric", "value"])
+            for metric, value in report["aggregate"].items():
+                writer.writerow(["aggregate", "", metric, value])
+            for process in report["processes"]:
+                for metric, value in process.items():
+                    if metric != "pid":
+                        writer.writerow(["process", process["pid"], metric, value])
+            for sync in report["sync_waits"]:
+                for metric in ("waits", "total_wait", "max_wait"):
+                    writer.writerow([sync["kind"], sync["id"], metric, sync[metric]])
+            if profiler is not None:
+                for entry_point, stats in profiler.report().items():
+                    for metric, value in stats.items():
+                        writer.writerow(["profile", entry_point, metric, value])
+
+
+# Times each kernel entry point in wall-clock nanoseconds.
+# It shadows the entry points of one kernel instance with timed wrappers, so kernels that are not profiled pay nothing.
+class KernelProfiler:
+    calls: dict[str, int]
+    total_ns: dict[str, int]
+    # The profiled kernel's, whose hits and misses are reported with timer_interrupt.
+    decision_cache: DecisionCache | None
+
+    def __init__(self):
+        self.calls = dict.fromkeys(KERNEL_ENTRY_POINTS, 0)
+        self.total_ns = dict.fromkeys(KERNEL_ENTRY_POINTS, 0)
+        self.decision_cache = None
+
+    def attach(self, kernel):
+        for name in KERNEL_ENTRY_POINTS:
+            setattr(kernel, name, TimedEntryPoint(self, name, getattr(kernel, name)))
+        self.decision_cache = kernel.decision_cache
+
+    def report(self) -> dict:
+        report = {name: {"calls": self.calls[name], "total_ns": self.total_ns[name],
+                         "mean_ns": self.total_ns[name] / self.calls[name] if self.calls[name] > 0 else None}
+                  for name in KERNEL_ENTRY_POINTS}
+        if self.decision_cache is not None:
+            report["timer_interrupt"]["decision_cache_hits"] = self.decision_cache.hits
+            report["timer_interrupt"]["decision_cache_misses"] = self.decision_cache.misses
+        return report
+
+    def print_report(self):
+        for name, stats in self.report().items():
+            if stats["calls"] > 0:
+                print(f"{name:>22}: {stats['calls']:10} calls, {stats['total_ns'] / 1e6:10.3f}ms total, {stats['mean_ns']:8.0f}ns mean")
+        if self.decision_cache is not None and self.calls["timer_interrupt"] > 0:
+            print(f"{'decision cache':>22}: {self.decision_cache.hits:10} hits, {self.decision_cache.misses:10} misses")
+
+
+# A callable rather than a closure so that profiled kernels can still be checkpointed.
+class TimedEntryPoint:
+    __slots__ = ("profiler", "name", "method")
+
+    def __init__(self, profiler: KernelProfiler, name: str, method):
+        self.profiler = profiler
+        self.name = name
+        self.method = method
+
+    def __call__(self, *args):
+        start = time.perf_counter_ns()
+        try:
+            return self.method(*args)
+        finally:
+            self.profiler.total_ns[self.name] += time.perf_counter_ns() - start
+            self.profiler.calls[self.name] += 1
@@ -0,0 +1,218 @@
+from typing import Callable
+
+# Validates parsed JSON against a schema and reports every problem with its JSON path, e.g.
+# "$.processes[3].semaphore[0].p: expected an integer, got string". Unlike asserts, it still runs under python -O.
+# A schema is built from the functions at the bottom and compiled once with compile_schema into a single Python
+# function that walks the document in one pass and only answers whether it is valid. Most documents are, so the
+# slower walk that collects the errors with their paths only runs once that function has found one.
+JSONPath = str | tuple
+
+JSON_TYPE_NAMES = {type(None): "null", bool: "boolean", int: "integer", float: "number", str: "string", list: "array", dict: "object"}
+# Types of the values one_of can compare against. Others may be unhashable.
+SCALAR_TYPES = frozenset(JSON_TYPE_NAMES) - {list, dict}
+
+
+class ValidationError(ValueError):
+    # Each error formatted as "<JSON path>: <message>".
+    errors: list[str]
+
+    def __init__(self, errors: list[str]):
+        self.errors = errors
+        super().__init__(f"Invalid simulation description ({len(errors)} error{'s' if len(errors) != 1 else ''}):\n" + "\n".join(errors))
+
+
+# Paths are (parent, key) pairs down from a root string, which are cheap to build and only formatted for errors.
+def format_path(path: JSONPath) -> str:
+    keys = []
+    while type(path) is tuple:
+        path, key = path
+        keys.append(f"[{key}]" if type(key) is int else f".{key}")
+    return path + "".join(reversed(keys))
+
+def json_type_name(value: object) -> str:
+    return JSON_TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+# Generates the source of a compiled schema. Objects the source refers to are passed in as named constants.
+class Compiler:
+    constants: dict[str, object]
+    variables: int
+
+    def __init__(self):
+        self.constants = {"SCALAR_TYPES": SCALAR_TYPES}
+        self.variables = 0
+
+    def constant(self, value: object) -> str:
+        name = f"c{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def variable(self) -> str:
+        self.variables += 1
+        return f"v{self.variables}"
+
+def indent(lines: list[str]) -> list[str]:
+    return ["    " + line for line in lines]
+
+
+class Schema:
+    # Appends (path, message) to errors for each problem with value and returns whether it is valid.
+    def check(self, value: object, path: JSONPath, errors: list) -> bool:
+        raise NotImplementedError()
+
+    # Returns statements that return False from the compiled function unless the value in var is valid.
+    def compile(self, var: str, compiler: Compiler) -> list[str]:
+        raise NotImplementedError()
+
+# Booleans are rejected, as JSON tells them apart from numbers.
+class Integer(Schema):
+    def check(self, value, path, errors):
+        if type(value) is int:
+            return True
+        errors.append((path, f"expected an integer, got {json_type_name(value)}"))
+        return False
+
+    def compile(self, var, compiler):
+        return [f"if type({var}) is not int: return False"]
+
+class OneOf(Schema):
+    values: frozenset
+
+    def __init__(self, values: set):
+        self.values = frozenset(values)
+
+    def check(self, value, path, errors):
+        if type(value) in SCALAR_TYPES and value in self.values:
+            return True
+        errors.append((path, f"expected one of {', '.join(sorted(map(repr, self.values)))}, got {value!r}"))
+        return False
+
+    def compile(self, var, compiler):
+        return [f"if type({var}) not in SCALAR_TYPES or {var} not in {compiler.constant(self.values)}: return False"]
+
+class ListOf(Schema):
+    item: Schema
+
+    def __init__(self, item: Schema):
+        self.item = item
+
+    def check(self, value, path, errors):
+        if type(value) is not list:
+            errors.append((path, f"expected an array, got {json_type_name(value)}"))
+            return False
+        valid = True
+        for i, entry in enumerate(value):
+            if not self.item.check(entry, (path, i), errors):
+                valid = False
+        return valid
+
+    def compile(self, var, compiler):
+        item = compiler.variable()
+        return [f"if type({var}) is not list: return False", f"for {item} in {var}:"] + indent(self.item.compile(item, compiler))
+
+# Keys not in required or optional are ignored. any_of lists keys of which at least one must be present.
+class ObjectOf(Schema):
+    required: dict[str, Schema]
+    optional: dict[str, Schema]
+    any_of: tuple[str, ...]
+
+    def __init__(self, required: dict[str, Schema], optional: dict[str, Schema] | None = None, any_of: tuple[str, ...] = ()):
+        self.required = required
+        self.optional = optional or {}
+        self.any_of = any_of
+
+    def check(self, value, path, errors):
+        if type(value) is not dict:
+            errors.append((path, f"expected an object, got {json_type_name(value)}"))
+            return False
+        valid = True
+        for key, field in self.required.items():
+            if key not in value:
+                errors.append((path, f"missing required key {key!r}"))
+                valid = False
+            elif not field.check(value[key], (path, key), errors):
+                valid = False
+        for key, field in self.optional.items():
+            if key in value and not field.check(value[key], (path, key), errors):
+                valid = False
+        if len(self.any_of) > 0 and not any(key in value for key in self.any_of):
+            errors.append((path, f"expected at least one of the keys {', '.join(map(repr, self.any_of))}"))
+            valid = False
+        return valid
+
+    def compile(self, var, compiler):
+        lines = [f"if type({var}) is not dict: return False"]
+        for key, field in self.required.items():
+            field_var = compiler.variable()
+            lines += [f"if {key!r} not in {var}: return False", f"{field_var} = {var}[{key!r}]"]
+            lines += field.compile(field_var, compiler)
+        for key, field in self.optional.items():
+            field_var = compiler.variable()
+            lines += [f"if {key!r} in {var}:", f"    {field_var} = {var}[{key!r}]"]
+            lines += indent(field.compile(field_var, compiler))
+        if len(self.any_of) > 0:
+            lines.append(f"if {' and '.join(f'{key!r} not in {var}' for key in self.any_of)}: return False")
+        return lines
+
+# Adds a rule that spans several fields, checked by extra.
+# extra also runs on a value with other errors, so that one pass reports every problem, and skips the parts of it of the wrong type.
+# is_valid is a faster form of extra for the compiled function, which only runs it once the rest of the value is valid,
+# and by default runs extra and drops its errors.
+class Refined(Schema):
+    schema: Schema
+    extra: Callable[[object, JSONPath, list], bool]
+    is_valid: Callable[[object], bool]
+
+    def __init__(self, schema: Schema, extra: Callable[[object, JSONPath, list], bool], is_valid: Callable[[object], bool] | None = None):
+        self.schema = schema
+        self.extra = extra
+        self.is_valid = is_valid if is_valid is not None else lambda value: extra(value, "$", [])
+
+    def check(self, value, path, errors):
+        valid = self.schema.check(value, path, errors)
+        return self.extra(value, path, errors) and valid
+
+    def compile(self, var, compiler):
+        return self.schema.compile(var, compiler) + [f"if not {compiler.constant(self.is_valid)}({var}): return False"]
+
+
+class CompiledSchema:
+    schema: Schema
+    is_valid: Callable[[object], bool]
+
+    def __init__(self, schema: Schema):
+        compiler = Compiler()
+        lines = ["def is_valid(v0):"] + indent(schema.compile("v0", compiler) + ["return True"])
+        namespace = dict(compiler.constants)
+        exec("\n".join(lines), namespace)
+        self.schema = schema
+        self.is_valid = namespace["is_valid"]
+
+    # Raises a ValidationError listing every problem with value. root names the document in the paths.
+    def validate(self, value: object, root: str = "$"):
+        if self.is_valid(value):
+            return
+        errors = []
+        if self.schema.check(value, root, errors) or len(errors) == 0:
+            # The compiled function and the checks disagree, which is a bug in the schema. The value is still rejected.
+            errors.append((root, "rejected by the compiled schema, but no check reports why"))
+        raise ValidationError([f"{format_path(path)}: {message}" for path, message in errors])
+
+
+def compile_schema(schema: Schema) -> CompiledSchema:
+    return CompiledSchema(schema)
+
+def integer() -> Schema:
+    return Integer()
+
+def one_of(values: set) -> Schema:
+    return OneOf(values)
+
+def list_of(item: Schema) -> Schema:
+    return ListOf(item)
+
+def object_of(required: dict[str, Schema], optional: dict[str, Schema] | None = None, any_of: tuple[str, ...] = ()) -> Schema:
+    return ObjectOf(required, optional, any_of)
+
+def refined(schema: Schema, extra: Callable[[object, JSONPath, list], bool], is_valid: Callable[[object], bool] | None = None) -> Schema:
+    return Refined(schema, extra, is_valid)
@@ -1,19 +1,36 @@
 from io import TextIOWrapper
+import hashlib
 import json
+import math
+import pickle
+import struct
 from dataclasses import dataclass
 from pathlib import Path
 import sys
-
-from kernel import Kernel
+from typing import Iterator
+
+from kernel import Kernel, KernelConfig, SCHEDULERS
+from log_sink import LogSink, TextLogSink, RecordLogSink, SIMULATOR_DELIMITER, STUDENT_DELIMITER, LOG_ARRIVAL_KINDS, LOG_EXIT, \
+    LOG_SWITCH, LOG_SET_PRIORITY, LOG_SEMAPHORE_P, LOG_SEMAPHORE_V, LOG_MUTEX_LOCK, LOG_MUTEX_UNLOCK, LOG_SEMAPHORE_INIT, LOG_MUTEX_INIT
+from metrics import MetricsCollector, KernelProfiler
+from fast_path import fast_path_applies, run_fast_path
+from binary_trace import BinaryTraceSink
+from watchdog import Watchdog
+from workload_cache import WorkloadRecords, PROCESS_TYPES, WORKLOAD_CACHE_DIR, cache_path, read_workload, write_workload, remove_stale_entries
+from schema import ValidationError, JSONPath, format_path, compile_schema, integer, one_of, list_of, object_of, refined
 
 MICRO_S = int
 PID = int
 
 NUM_MICRO_IN_SEC: MICRO_S = 1000000
-TIMER_INTERRUPT_INTERVAL: MICRO_S = 10
 
-VALID_SCHEDULING_ALGORITHMS = {"FCFS", "Priority", "RR", "Multilevel"}
+VALID_SCHEDULING_ALGORITHMS = set(SCHEDULERS)
 VALID_PROCESS_TYPES = {"Foreground", "Background"}
+VALID_OPTIONS = {"--no-student-logs", "--event-driven", "--compact-log", "--tickless", "--metrics", "--metrics-csv", "--profile",
+                 "--checkpoint-every", "--resume", "--no-fast-path", "--binary-trace",
+                 "--detect-deadlocks", "--starvation-limit", "--workload-cache", "--rebuild-workload-cache"}
+# Every other option is already part of a checkpoint, so a resumed run only takes these.
+VALID_RESUME_OPTIONS = {"--resume", "--checkpoint-every", "--metrics", "--metrics-csv"}
 
 PROCESSES: str = "processes"
 ARRIVAL: str = "arrival"
@@ -41,20 +58,31 @@ DEFAULT_PRIORITY = 32
 class SimulationError(Exception):
     pass
 
-@dataclass
-class PriorityChangeEvent:
+# Schedulers that never hand an unlocked mutex to a waiting process would leave the waiters blocked for good,
+# so the unlock is refused while anyone waits.
+def check_mutex_unlock(kernel: Kernel, pid: PID, mutex_id: int):
+    waiting = kernel.mutexes[mutex_id]["waiting_queue"]
+    if not kernel.scheduler.wakes_mutex_waiters and len(waiting) > 0:
+        raise SimulationError(f"Process {pid} unlocked mutex {mutex_id} while pids {', '.join(str(pcb.pid) for pcb in waiting)} "
+                              f"wait on it, but {type(kernel.scheduler).__name__} scheduling never wakes processes waiting on a mutex")
+
+# Kinds of process events, in the order the simulator handles events that fire in the same microsecond.
+EVENT_PRIORITY_CHANGE = 0
+EVENT_SEMAPHORE_P = 1
+EVENT_SEMAPHORE_V = 2
+EVENT_MUTEX_LOCK = 3
+EVENT_MUTEX_UNLOCK = 4
+
+# value is the new priority for priority changes and the semaphore/mutex id otherwise.
+@dataclass(slots=True)
+class ProcessEvent:
     arrival: MICRO_S
-    new_priority: int
+    kind: int
+    value: int
 
-@dataclass
-class SemaphoreCallEvent:
-    arrival: MICRO_S
-    id: int
-
-@dataclass
-class MutexEvent:
-    arrival: MICRO_S
-    id: int
+    # A process checks its events after running each microsecond, so events at or before 1us all fire after the first one.
+    def fires_at(self) -> MICRO_S:
+        return max(self.arrival, 1)
 
 @dataclass
 class Semaphore:
@@ -65,35 +93,102 @@ class Semaphore:
 class Mutex:
     initilized: bool
 
-@dataclass
+@dataclass(slots=True)
 class Process:
     arrival: MICRO_S
     total_cpu_time: MICRO_S
     elapsed_cpu_time: MICRO_S
     priority: int
-    priority_change_events: list[PriorityChangeEvent]
-    semaphore_p_events: list[SemaphoreCallEvent]
-    semaphore_v_events: list[SemaphoreCallEvent]
-    mutex_lock_events: list[MutexEvent]
-    mutex_unlock_events: list[MutexEvent]
+    # All events of the process in the order they fire.
+    events: list[ProcessEvent]
     process_type: str
+    # Index into events of the next event to fire.
+    next_event: int = 0
+    # The elapsed_cpu_time at which this process next makes a syscall or exits.
+    next_event_at: MICRO_S = 0
+
+    # Puts events that fire after the first microsecond of execution in kind order and positions the cursor on the first event.
+    def prepare_timeline(self):
+        first_microsecond = 0
+        while first_microsecond < len(self.events) and self.events[first_microsecond].fires_at() == 1:
+            first_microsecond += 1
+        self.events[:first_microsecond] = sorted(self.events[:first_microsecond], key=lambda e: e.kind)
+        self.next_event = 0
+        self.update_next_event_at()
+
+    def update_next_event_at(self):
+        if self.next_event < len(self.events):
+            self.next_event_at = min(self.events[self.next_event].fires_at(), self.total_cpu_time)
+        else:
+            self.next_event_at = self.total_cpu_time
+
+    def pop_event(self) -> ProcessEvent:
+        event = self.events[self.next_event]
+        self.next_event += 1
+        self.update_next_event_at()
+        return event
+
+    # Returns a copy that has not run yet. Events are never modified after parsing, so copies share them.
+    def copy(self) -> "Process":
+        process = Process(self.arrival, self.total_cpu_time, 0, self.priority, self.events, self.process_type)
+        process.update_next_event_at()
+        return process
+
+# A parsed simulation description. It is never modified, so one workload can be simulated any number of times,
+# in this process or shipped to others, without parsing and validating it again.
+@dataclass(frozen=True)
+class Workload:
+    scheduling_algorithm: str
+    # (id, init_val) of each semaphore.
+    semaphores: tuple[tuple[int, int], ...]
+    mutexes: tuple[int, ...]
+    # Processes that have not run, latest arrival first like Simulator.arrivals.
+    processes: tuple[Process, ...]
 
 class Simulator:
     elapsed_time: MICRO_S
     current_process: PID
     processes: dict[PID, Process]
+    # Processes that have not arrived yet, latest first.
+    # When streaming, this only holds the next group of processes to arrive.
     arrivals: list[Process]
+    arrival_stream: Iterator[Process] | None
+    next_streamed_arrival: Process | None
+    description_path: Path | None
+    # The streamed description, or None once it has been read or when the description was loaded at once.
+    description_file: TextIOWrapper | None
     kernel: Kernel
     next_pid: PID
-    simlog: TextIOWrapper
+    log_sink: LogSink
     needs_spacing: False
     process_0_runtime: MICRO_S
     semaphores: dict[int, Semaphore]
     mutexes: dict[int, Mutex]
     student_logs: "StudentLogger"
-
-    def __init__(self, emulation_description_path: Path, logfile_path: str, student_logs: bool):
+    event_driven: bool
+    # In tickless mode only the timer interrupts the kernel asks for are raised.
+    tickless: bool
+    timer_interrupt_interval: MICRO_S
+    # Timer interrupts the kernel has accounted for, whether raised or skipped.
+    timer_interrupts: int
+    metrics: MetricsCollector | None
+    profiler: KernelProfiler | None
+    # Aborts the run early on deadlocks and, if given a limit, on starvation.
+    watchdog: Watchdog | None
+    # Whether workloads without syscalls may be simulated by the analytic fast path in fast_path.py.
+    fast_path: bool
+    # Periodic checkpoints are saved to checkpoint_path, formatted with the simulated time, every checkpoint_interval.
+    checkpoint_path: str | None
+    checkpoint_interval: MICRO_S | None
+    next_checkpoint: MICRO_S
+
+    def __init__(self, emulation_description_path: "Path | Workload", logfile_path: str | None, student_logs: bool, event_driven: bool = False, \
+                 log_sink: LogSink | None = None, tickless: bool = False, metrics: MetricsCollector | None = None, \
+                 profiler: KernelProfiler | None = None, kernel_config: KernelConfig | None = None, watchdog: Watchdog | None = None):
         self.elapsed_time = 0
+        self.event_driven = event_driven
+        self.tickless = tickless
+        self.timer_interrupts = 0
         self.current_process = 0
         self.processes = dict()
         self.arrivals = []
@@ -102,119 +197,192 @@ class Simulator:
         self.process_0_runtime = 0
         self.semaphores = dict()
         self.mutexes = dict()
+        self.checkpoint_path = None
+        self.checkpoint_interval = None
+        self.next_checkpoint = 0
+        self.fast_path = True
         if student_logs:
             self.student_logs = StudentLogger(self)
         else:
             self.student_logs = StudentLogger(None)
 
-        emulation_json = None
-        with open(emulation_description_path, 'r') as file:
-            emulation_json = json.load(file)
-
-        if SEMAPHORES in emulation_json:
-            assert(type(emulation_json[SEMAPHORES]) is list)
-            for semaphore in emulation_json[SEMAPHORES]:
-                assert(SEMAPHORE_ID in semaphore and type(semaphore[SEMAPHORE_ID]) is int)
-                assert(SEMAPHORE_INIT_VAL in semaphore and type(semaphore[SEMAPHORE_INIT_VAL]) is int)
-                assert(semaphore[SEMAPHORE_ID] not in self.semaphores)
-                self.semaphores[semaphore[SEMAPHORE_ID]] = Semaphore(semaphore[SEMAPHORE_INIT_VAL], False)
-        
-        if MUTEXES in emulation_json:
-            assert(type(emulation_json[MUTEXES]) is list)
-            for mutex_id in emulation_json[MUTEXES]:
-                assert(type(mutex_id) is int)
-                self.mutexes[mutex_id] = Mutex(False)
-
-        assert(PROCESSES in emulation_json and type(emulation_json[PROCESSES]) is list)
-        for process in emulation_json[PROCESSES]:
-            assert(ARRIVAL in process and type(process[ARRIVAL]) is MICRO_S)
-            assert(TOTAL_CPU_TIME in process and type(process[TOTAL_CPU_TIME]) is MICRO_S)
-            
-            priority = DEFAULT_PRIORITY
-            if PRIORITY in process:
-                assert(type(process[PRIORITY]) is int)
-                priority = process[PRIORITY]
-
-            priority_changes = []
-            if PRIORITY_CHANGES in process:
-                assert(type(process[PRIORITY_CHANGES]) is list)
-                for change in process[PRIORITY_CHANGES]:
-                    assert(EVENT_ARRIVAL in change and type(change[EVENT_ARRIVAL]) is int)
-                    assert(NEW_PRIORITY in change and type(change[NEW_PRIORITY]) is int)
-                    priority_changes.append(PriorityChangeEvent(change[EVENT_ARRIVAL], change[NEW_PRIORITY]))
-
-            semaphore_p_events = list()
-            semaphore_v_events = list()
-            if PROCESS_SEMAPHORE in process:
-                assert(type(process[PROCESS_SEMAPHORE]) is list)
-                for event in process[PROCESS_SEMAPHORE]:
-                    assert(PROCESSES_SEMA_ID in event and type(event[PROCESSES_SEMA_ID]) is int)
-                    id = event[PROCESSES_SEMA_ID]
-                    assert(PROCESS_SEMA_P in event or PROCESS_SEMA_V in event)
-                    if PROCESS_SEMA_P in event:
-                        assert(type(event[PROCESS_SEMA_P]) is int)
-                        semaphore_p_events.append(SemaphoreCallEvent(event[PROCESS_SEMA_P], id))
-                    elif PROCESS_SEMA_V in event:
-                        assert(type(event[PROCESS_SEMA_V]) is int)
-                        semaphore_v_events.append(SemaphoreCallEvent(event[PROCESS_SEMA_V], id))
-
-            mutex_lock_events = list()
-            mutex_unlock_events = list()
-            if PROCESS_MUTEX in process:
-                assert(type(process[PROCESS_MUTEX]) is list)
-                for event in process[PROCESS_MUTEX]:
-                    assert(PROCESSES_MUTEX_ID in event and type(event[PROCESSES_MUTEX_ID]) is int)
-                    id = event[PROCESSES_MUTEX_ID]
-                    assert(PROCESS_MUTEX_LOCK in event or PROCESS_MUTEX_UNLOCK in event)
-                    if PROCESS_MUTEX_LOCK in event:
-                        assert(type(event[PROCESS_MUTEX_LOCK]) is int)
-                        mutex_lock_events.append(MutexEvent(event[PROCESS_MUTEX_LOCK], id))
-                    elif PROCESS_MUTEX_UNLOCK in event:
-                        assert(type(event[PROCESS_MUTEX_UNLOCK]) is int)
-                        mutex_unlock_events.append(MutexEvent(event[PROCESS_MUTEX_UNLOCK], id))
-
-            # Sort all event lists such that their last element is always the next event
-            for event_list in [priority_changes, semaphore_p_events, semaphore_v_events, mutex_lock_events, mutex_unlock_events]:
-                event_list.sort(key=lambda c: c.arrival, reverse=True)
-
-            process_type = "Foreground"
-            if PROCESS_TYPE in process:
-                assert(process[PROCESS_TYPE] in VALID_PROCESS_TYPES)
-                process_type = process[PROCESS_TYPE]
-
-            process = Process(process[ARRIVAL], process[TOTAL_CPU_TIME], 0, priority, priority_changes, \
-                              semaphore_p_events, semaphore_v_events, mutex_lock_events, mutex_unlock_events, process_type)
-            assert_events_are_valid_and_not_at_same_time(process)
-            self.arrivals.append(process)
-        # Sort arrivals so earliest arrivals are at the end.
-        self.arrivals.sort(key=lambda p: p.arrival, reverse=True)
-
-        assert("scheduling_algorithm" in emulation_json and emulation_json["scheduling_algorithm"] in VALID_SCHEDULING_ALGORITHMS)
-        self.kernel = Kernel(emulation_json["scheduling_algorithm"], self.student_logs)
-
-        self.simlog = open(logfile_path, 'w')
+        self.description_file = None
+        self.arrival_stream = None
+        self.next_streamed_arrival = None
+        if isinstance(emulation_description_path, Workload):
+            # A workload may be simulated many times, so every simulation runs its own copies of the processes.
+            self.description_path = None
+            workload = emulation_description_path
+            self.arrivals = [process.copy() for process in workload.processes]
+        elif Path(emulation_description_path).suffix == ".jsonl":
+            # A .jsonl description is streamed: its first line holds everything but the processes,
+            # and each following line holds one process, ordered by arrival.
+            self.description_path = emulation_description_path
+            self.description_file = open(emulation_description_path, 'r')
+            workload = parse_workload(json.loads(self.description_file.readline()), with_processes=False)
+            self.arrival_stream = stream_processes(self.description_file)
+            self.next_streamed_arrival = next(self.arrival_stream, None)
+            self.load_next_arrivals()
+        else:
+            self.description_path = emulation_description_path
+            workload = load_workload(emulation_description_path)
+            self.arrivals = list(workload.processes)
+
+        for id, init_val in workload.semaphores:
+            self.semaphores[id] = Semaphore(init_val, False)
+        for mutex_id in workload.mutexes:
+            self.mutexes[mutex_id] = Mutex(False)
+
+        self.kernel = Kernel(workload.scheduling_algorithm, self.student_logs)
+        if kernel_config is not None:
+            self.kernel.configure(kernel_config)
+        self.timer_interrupt_interval = self.kernel.timer_interrupt_interval
+        if profiler is not None:
+            profiler.attach(self.kernel)
+        self.profiler = profiler
+        self.metrics = metrics
+        self.watchdog = watchdog
+
+        self.log_sink = log_sink if log_sink is not None else TextLogSink(logfile_path)
 
     
     def run_simulator(self):
-        # Emulation ends when all processes have finished.
-        while len(self.processes) + len(self.arrivals) > 0:
-            if self.current_process == 0:
-                self.process_0_runtime += 1
-            if self.process_0_runtime >= NUM_MICRO_IN_SEC:
-                raise SimulationError( \
+        try:
+            if fast_path_applies(self) and run_fast_path(self):
+                return
+            # Emulation ends when all processes have finished.
+            while len(self.processes) + len(self.arrivals) > 0:
+                if self.checkpoint_interval is not None and self.elapsed_time >= self.next_checkpoint:
+                    self.save_checkpoint(self.checkpoint_path.format(time=self.elapsed_time))
+                    self.next_checkpoint = (self.elapsed_time // self.checkpoint_interval + 1) * self.checkpoint_interval
+                if self.event_driven:
+                    self.skip_to_next_event()
+                self.step()
+        finally:
+            self.log_sink.close()
+
+    # Saves a checkpoint every interval of simulated time to path, which may contain {time}, e.g. "run.{time}.ckpt".
+    # The first one is saved before the first step.
+    def checkpoint_every(self, interval: MICRO_S, path: str):
+        assert(interval > 0)
+        self.checkpoint_interval = interval
+        self.checkpoint_path = path
+        self.next_checkpoint = self.elapsed_time
+
+    # Pickles the complete simulator, kernel included, between two steps.
+    # The log sink flushes itself and keeps only its position in the log.
+    def save_checkpoint(self, path: str):
+        with open(path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Restores a simulator saved by save_checkpoint, possibly in another process; run_simulator() continues the run.
+    # The log is truncated to where the checkpoint was taken, so the resumed run writes the same log as an uninterrupted one.
+    # A log_sink given here receives only the rest of the run instead, e.g. to fork what-if runs from a shared prefix.
+    @staticmethod
+    def load_checkpoint(path: str, log_sink: LogSink | None = None) -> "Simulator":
+        with open(path, 'rb') as file:
+            simulator = pickle.load(file)
+        if log_sink is not None:
+            simulator.log_sink = log_sink
+        return simulator
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Generators and open files can't be pickled, so only the position in the streamed description is kept.
+        state["arrival_stream"] = None
+        state["description_file"] = None if self.description_file is None else self.description_file.tell()
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.description_file is not None:
+            offset = self.description_file
+            self.description_file = open(self.description_path, 'r')
+            self.description_file.seek(offset)
+            last_arrival = None if self.next_streamed_arrival is None else self.next_streamed_arrival.arrival
+            self.arrival_stream = stream_processes(self.description_file, last_arrival)
+
+    # Simulates a single microsecond.
+    def step(self):
+        if self.tickless:
+            self.sync_kernel_time()
+        if self.current_process == 0:
+            self.process_0_runtime += 1
+        if self.process_0_runtime >= NUM_MICRO_IN_SEC:
+            raise SimulationError( \
                 """Process 0 (idle process) has been running for 1 second straight. 
                 This will not happen in tested simulations and is likely a bug in the kernel.""")
-            
-            self.advance_current_process()
+        if self.watchdog is not None:
+            self.check_watchdog(self.watchdog.check_starvation(self.elapsed_time))
+
+        self.advance_current_process()
 
-            self.check_for_arrival()
+        self.check_for_arrival()
 
-            if self.elapsed_time != 0 and self.elapsed_time % TIMER_INTERRUPT_INTERVAL == 0:
+        if self.elapsed_time != 0 and self.elapsed_time % self.timer_interrupt_interval == 0:
+            if not self.tickless:
                 self.switch_process(self.kernel.timer_interrupt())
+            else:
+                next_interrupt = self.kernel.next_timer_interrupt()
+                if next_interrupt is not None and next_interrupt <= self.elapsed_time:
+                    self.timer_interrupts += 1
+                    self.switch_process(self.kernel.timer_interrupt())
+
+        self.log_add_spacing()
+        self.elapsed_time += 1
+
+    # Tickless mode: hands the kernel the timer interrupts skipped since it last ran,
+    # so its clock reads the same as if every interrupt before this microsecond had been raised.
+    def sync_kernel_time(self):
+        skipped = max(self.elapsed_time - 1, 0) // self.timer_interrupt_interval - self.timer_interrupts
+        if skipped > 0:
+            self.kernel.skip_timer_interrupts(skipped)
+            self.timer_interrupts += skipped
+
+    # Returns the next microsecond at which step() would do anything other than
+    # advance the running process (or the idle counter) by one.
+    def next_event_time(self) -> MICRO_S:
+        interval = self.timer_interrupt_interval
+        if self.elapsed_time == 0:
+            next_event = interval
+        else:
+            next_event = -(-self.elapsed_time // interval) * interval
+
+        # In tickless mode only the interrupt the kernel asked for is interesting.
+        # Its clock may lag behind, which only makes the request earlier than needed.
+        if self.tickless:
+            next_interrupt = self.kernel.next_timer_interrupt()
+            if next_interrupt is None:
+                next_event = math.inf
+            else:
+                next_event = max(next_event, -(-next_interrupt // interval) * interval)
+
+        if len(self.arrivals) > 0:
+            next_event = min(next_event, self.arrivals[len(self.arrivals) - 1].arrival)
+
+        if self.watchdog is not None:
+            next_event = min(next_event, self.watchdog.next_starvation())
+
+        # The step that increments the counter onto its target is the interesting one.
+        if self.current_process == 0:
+            next_event = min(next_event, self.elapsed_time + NUM_MICRO_IN_SEC - self.process_0_runtime - 1)
+        else:
+            current_process = self.processes[self.current_process]
+            next_event = min(next_event, self.elapsed_time + current_process.next_event_at - current_process.elapsed_cpu_time - 1)
 
-            self.log_add_spacing()
-            self.elapsed_time += 1
-        self.simlog.close()
+        return max(next_event, self.elapsed_time)
+
+    # Fast forwards through the steps before the next interesting instant.
+    # Those steps only advance a counter, so the log is identical to stepping through them.
+    def skip_to_next_event(self):
+        skipped = self.next_event_time() - self.elapsed_time
+        if skipped == 0:
+            return
+        if self.current_process == 0:
+            self.process_0_runtime += skipped
+        else:
+            self.processes[self.current_process].elapsed_cpu_time += skipped
+        self.elapsed_time += skipped
 
     def advance_current_process(self):
         if self.current_process == 0:
@@ -222,11 +390,15 @@ class Simulator:
         
         current_process = self.processes[self.current_process]
         current_process.elapsed_cpu_time += 1
+        if current_process.elapsed_cpu_time < current_process.next_event_at:
+            return
 
         # If the current_process has finished execution
         if current_process.total_cpu_time <= current_process.elapsed_cpu_time:
             exiting_process = self.current_process
-            self.log(f"Process {exiting_process} has finished execution and is exiting")
+            self.log_event(LOG_EXIT, exiting_process)
+            if self.metrics is not None:
+                self.metrics.process_exited(exiting_process, self.elapsed_time)
             new_process = self.kernel.syscall_exit()
             if new_process == exiting_process:
                 raise SimulationError(f"Attempted to continue execution of exiting process (pid = {exiting_process})")
@@ -234,62 +406,97 @@ class Simulator:
             del self.processes[exiting_process]
             
             self.switch_process(new_process)
+            if self.watchdog is not None:
+                self.check_watchdog(self.watchdog.process_exited(exiting_process, self.elapsed_time, len(self.arrivals) > 0))
             return
 
 
-        event_list = current_process.priority_change_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            priority_change = event_list.pop()
-            self.log(f"Process {self.current_process} set priority to {priority_change.new_priority}")
-            self.switch_process(self.kernel.syscall_set_priority(priority_change.new_priority))
-
-
-        event_list = current_process.semaphore_p_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            semaphore_p = event_list.pop()
-            self.check_semaphore_inited(semaphore_p.id)
-            self.log(f"Process {self.current_process} called p on semaphore {semaphore_p.id}")
-            self.switch_process(self.kernel.syscall_semaphore_p(semaphore_p.id))
-        
-        event_list = current_process.semaphore_v_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            semaphore_v = event_list.pop()
-            self.check_semaphore_inited(semaphore_v.id)
-            self.log(f"Process {self.current_process} called v on semaphore {semaphore_v.id}")
-            self.switch_process(self.kernel.syscall_semaphore_v(semaphore_v.id))
-
-
-        event_list = current_process.mutex_lock_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            mutex_lock = event_list.pop()
-            self.check_mutex_inited(mutex_lock.id)
-            self.log(f"Process {self.current_process} called lock on mutex {mutex_lock.id}")
-            self.switch_process(self.kernel.syscall_mutex_lock(mutex_lock.id))
-        
-        event_list = current_process.mutex_unlock_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            mutex_unlock = event_list.pop()
-            self.check_mutex_inited(mutex_unlock.id)
-            self.log(f"Process {self.current_process} called unlock on mutex {mutex_unlock.id}")
-            self.switch_process(self.kernel.syscall_mutex_unlock(mutex_unlock.id))
+        while current_process.next_event_at <= current_process.elapsed_cpu_time:
+            event = current_process.pop_event()
+            if event.kind == EVENT_PRIORITY_CHANGE:
+                self.log_event(LOG_SET_PRIORITY, self.current_process, event.value)
+                self.switch_process(self.kernel.syscall_set_priority(event.value))
+            elif event.kind == EVENT_SEMAPHORE_P:
+                self.check_semaphore_inited(event.value)
+                self.log_event(LOG_SEMAPHORE_P, self.current_process, event.value)
+                caller = self.current_process
+                new_process = self.kernel.syscall_semaphore_p(event.value)
+                diagnostic = None if self.watchdog is None else \
+                    self.watchdog.semaphore_p(caller, event.value, self.elapsed_time, len(self.arrivals) > 0)
+                self.switch_process(new_process)
+                if self.metrics is not None and self.current_process != caller:
+                    self.metrics.sync_wait_started("semaphore", event.value, caller, self.elapsed_time)
+                self.check_watchdog(diagnostic)
+            elif event.kind == EVENT_SEMAPHORE_V:
+                self.check_semaphore_inited(event.value)
+                self.log_event(LOG_SEMAPHORE_V, self.current_process, event.value)
+                caller = self.current_process
+                new_process = self.kernel.syscall_semaphore_v(event.value)
+                if self.watchdog is not None:
+                    self.watchdog.semaphore_v(caller, event.value, self.kernel.semaphores[event.value].blocked_queue, self.elapsed_time)
+                self.switch_process(new_process)
+            elif event.kind == EVENT_MUTEX_LOCK:
+                self.check_mutex_inited(event.value)
+                self.log_event(LOG_MUTEX_LOCK, self.current_process, event.value)
+                caller = self.current_process
+                new_process = self.kernel.syscall_mutex_lock(event.value)
+                diagnostic = None if self.watchdog is None else \
+                    self.watchdog.mutex_lock(caller, event.value, self.elapsed_time, len(self.arrivals) > 0)
+                self.switch_process(new_process)
+                if self.metrics is not None and self.current_process != caller:
+                    self.metrics.sync_wait_started("mutex", event.value, caller, self.elapsed_time)
+                self.check_watchdog(diagnostic)
+            elif event.kind == EVENT_MUTEX_UNLOCK:
+                self.check_mutex_inited(event.value)
+                self.log_event(LOG_MUTEX_UNLOCK, self.current_process, event.value)
+                check_mutex_unlock(self.kernel, self.current_process, event.value)
+                caller = self.current_process
+                new_process = self.kernel.syscall_mutex_unlock(event.value)
+                if self.watchdog is not None:
+                    self.watchdog.mutex_unlock(caller, event.value, self.kernel.mutexes[event.value]["waiting_queue"], self.elapsed_time)
+                self.switch_process(new_process)
 
     def check_semaphore_inited(self, id: int):
         if not self.semaphores[id].initilized:
-            self.log(f"Semaphore {id} initilized with value {self.semaphores[id].init_val}")
+            self.log_event(LOG_SEMAPHORE_INIT, id, self.semaphores[id].init_val)
             self.kernel.syscall_init_semaphore(id, self.semaphores[id].init_val)
+            if self.watchdog is not None:
+                self.watchdog.semaphore_inited(id, self.semaphores[id].init_val)
             self.semaphores[id].initilized = True
 
     def check_mutex_inited(self, id: int):
         if not self.mutexes[id].initilized:
-            self.log(f"Mutex {id} initilized")
+            self.log_event(LOG_MUTEX_INIT, id)
             self.kernel.syscall_init_mutex(id)
+            if self.watchdog is not None:
+                self.watchdog.mutex_inited(id)
             self.mutexes[id].initilized = True
 
+    # Reads the next group of processes that arrive at the same time from the arrival stream.
+    # Processes with equal arrival times get pids in the same order as when the whole description is loaded at once.
+    def load_next_arrivals(self):
+        if self.next_streamed_arrival is None:
+            return
+        arrival = self.next_streamed_arrival.arrival
+        while self.next_streamed_arrival is not None and self.next_streamed_arrival.arrival == arrival:
+            self.arrivals.append(self.next_streamed_arrival)
+            self.next_streamed_arrival = next(self.arrival_stream, None)
+        # The stream closes the file once it is exhausted.
+        if self.next_streamed_arrival is None:
+            self.description_file = None
+
     def check_for_arrival(self):
         while len(self.arrivals) > 0 and self.arrivals[len(self.arrivals) - 1].arrival == self.elapsed_time:
             new_process = self.arrivals.pop()
+            if len(self.arrivals) == 0:
+                self.load_next_arrivals()
             self.processes[self.next_pid] = new_process
-            self.log(f"{new_process.process_type} process {self.next_pid} arrived with priority {new_process.priority}")
+            self.log_event(LOG_ARRIVAL_KINDS[new_process.process_type], self.next_pid, new_process.priority)
+            if self.metrics is not None:
+                self.metrics.process_arrived(self.next_pid, self.elapsed_time, new_process.total_cpu_time, new_process.priority,
+                                             new_process.process_type)
+            if self.watchdog is not None:
+                self.watchdog.process_arrived(self.next_pid, self.elapsed_time)
             self.switch_process(self.kernel.new_process_arrived(self.next_pid, new_process.priority, new_process.process_type))
             self.next_pid += 1
 
@@ -301,80 +508,340 @@ class Simulator:
             self.process_0_runtime = 0
 
         if new_process != self.current_process:
-            self.log(f"Context switching to pid: {new_process}")
+            self.log_event(LOG_SWITCH, new_process)
+            if self.metrics is not None:
+                self.metrics.process_switched(self.current_process, new_process, self.elapsed_time)
+            if self.watchdog is not None:
+                self.watchdog.process_switched(self.current_process, new_process, self.elapsed_time)
         self.current_process = new_process
 
+    def check_watchdog(self, diagnostic: str | None):
+        if diagnostic is not None:
+            raise SimulationError(diagnostic)
+
     def log(self, str: str, student_log = False):
         if student_log:
-            delimiter = '#'
+            delimiter = STUDENT_DELIMITER
         else:
-            delimiter = ':'
-        self.simlog.write(f"{self.elapsed_time / 1000:.3f}ms {delimiter} {str}\n")
+            delimiter = SIMULATOR_DELIMITER
+        self.log_sink.write(self.elapsed_time, delimiter, str)
+        self.needs_spacing = True
+
+    # Logs one of the simulator's own events, which sinks such as BinaryTraceSink store without formatting it.
+    def log_event(self, kind: int, pid: int, arg: int = 0):
+        self.log_sink.write_event(self.elapsed_time, kind, pid, arg)
         self.needs_spacing = True
     
     def log_add_spacing(self):
         if self.needs_spacing:
-            self.simlog.write("\n")
+            self.log_sink.write_spacing()
             self.needs_spacing = False
 
 class StudentLogger:
     __simluator: Simulator
+    # False when student logs are discarded (--no-student-logs).
+    # The kernel checks this before building a log message so the disabled path costs nothing.
+    enabled: bool
 
     def __init__(self, simulator: Simulator | None):
         self.__simluator = simulator
+        self.enabled = simulator is not None
 
     def log(self, str: str):
-        if self.__simluator is not None:
+        if self.enabled:
             self.__simluator.log(str, student_log=True)
 
 # Having events at the same time as other events in the same process could cause a desync between what the simulator thinks is running and what the handler does.
-# This assert ensures the process does not have this issue.
+# This check ensures the process does not have this issue.
 # Additionally ensures that all events will happen before the process exits.
-def assert_events_are_valid_and_not_at_same_time(process: Process):
-    event_arrivals = set()
-    for event in process.priority_change_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.semaphore_p_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.semaphore_v_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-
-    for event in process.mutex_lock_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.mutex_unlock_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-
-    for event_arrival in event_arrivals:
-        assert(event_arrival < process.total_cpu_time)
+def check_process_timeline(process: dict, path: JSONPath, errors: list) -> bool:
+    if type(process) is not dict:
+        return False
+    total_cpu_time = process.get(TOTAL_CPU_TIME)
+    valid = True
+    first_event_at = dict()
+    for arrival, event_path in process_event_arrivals(process, path):
+        if arrival in first_event_at:
+            errors.append((event_path, f"happens at {arrival}us like {format_path(first_event_at[arrival])}"))
+            valid = False
+        else:
+            first_event_at[arrival] = event_path
+        if type(total_cpu_time) is int and arrival >= total_cpu_time:
+            errors.append((event_path, f"happens at {arrival}us, not before the process exits at {total_cpu_time}us"))
+            valid = False
+    return valid
+
+# check_process_timeline for the compiled schema, which only needs to know whether the timeline is valid.
+def process_timeline_is_valid(process: dict) -> bool:
+    arrivals = set()
+    events = 0
+    for change in process.get(PRIORITY_CHANGES, ()):
+        arrivals.add(change[EVENT_ARRIVAL])
+        events += 1
+    for event in process.get(PROCESS_SEMAPHORE, ()):
+        arrivals.add(event[PROCESS_SEMA_P] if PROCESS_SEMA_P in event else event[PROCESS_SEMA_V])
+        events += 1
+    for event in process.get(PROCESS_MUTEX, ()):
+        arrivals.add(event[PROCESS_MUTEX_LOCK] if PROCESS_MUTEX_LOCK in event else event[PROCESS_MUTEX_UNLOCK])
+        events += 1
+    return events == 0 or (len(arrivals) == events and max(arrivals) < process[TOTAL_CPU_TIME])
+
+# (arrival, JSON path) of each event of a process, taking the same keys as parse_process.
+# Events without an integer arrival, or in a list of the wrong type, are left out.
+def process_event_arrivals(process: dict, path: JSONPath) -> list[tuple[MICRO_S, JSONPath]]:
+    arrivals = []
+    for key, arrival_keys in ((PRIORITY_CHANGES, (EVENT_ARRIVAL,)), (PROCESS_SEMAPHORE, (PROCESS_SEMA_P, PROCESS_SEMA_V)),
+                              (PROCESS_MUTEX, (PROCESS_MUTEX_LOCK, PROCESS_MUTEX_UNLOCK))):
+        events = process.get(key, ())
+        if type(events) is not list:
+            continue
+        for i, event in enumerate(events):
+            if type(event) is not dict:
+                continue
+            arrival_key = next((arrival_key for arrival_key in arrival_keys if arrival_key in event), None)
+            if arrival_key is not None and type(event[arrival_key]) is int:
+                arrivals.append((event[arrival_key], (((path, key), i), arrival_key)))
+    return arrivals
+
+# Semaphores without an integer id are left to the schema.
+def check_unique_semaphore_ids(semaphores: list, path: JSONPath, errors: list) -> bool:
+    if type(semaphores) is not list:
+        return False
+    valid = True
+    first = dict()
+    for i, semaphore in enumerate(semaphores):
+        if type(semaphore) is not dict or type(semaphore.get(SEMAPHORE_ID)) is not int:
+            continue
+        if semaphore[SEMAPHORE_ID] in first:
+            errors.append((((path, i), SEMAPHORE_ID), f"semaphore {semaphore[SEMAPHORE_ID]} is already declared at {format_path((path, first[semaphore[SEMAPHORE_ID]]))}"))
+            valid = False
+        else:
+            first[semaphore[SEMAPHORE_ID]] = i
+    return valid
+
+# The schema of simulation descriptions. Keys it does not list are ignored.
+PROCESS_FIELDS = refined(object_of(
+    required={ARRIVAL: integer(), TOTAL_CPU_TIME: integer()},
+    optional={
+        PRIORITY: integer(),
+        PRIORITY_CHANGES: list_of(object_of({EVENT_ARRIVAL: integer(), NEW_PRIORITY: integer()})),
+        # An event with both p and v is a p.
+        PROCESS_SEMAPHORE: list_of(object_of({PROCESSES_SEMA_ID: integer()}, {PROCESS_SEMA_P: integer(), PROCESS_SEMA_V: integer()},
+                                             any_of=(PROCESS_SEMA_P, PROCESS_SEMA_V))),
+        PROCESS_MUTEX: list_of(object_of({PROCESSES_MUTEX_ID: integer()}, {PROCESS_MUTEX_LOCK: integer(), PROCESS_MUTEX_UNLOCK: integer()},
+                                         any_of=(PROCESS_MUTEX_LOCK, PROCESS_MUTEX_UNLOCK))),
+        PROCESS_TYPE: one_of(VALID_PROCESS_TYPES),
+    }), check_process_timeline, process_timeline_is_valid)
+
+DESCRIPTION_FIELDS = {"scheduling_algorithm": one_of(VALID_SCHEDULING_ALGORITHMS)}
+DESCRIPTION_OPTIONAL_FIELDS = {
+    SEMAPHORES: refined(list_of(object_of({SEMAPHORE_ID: integer(), SEMAPHORE_INIT_VAL: integer()})), check_unique_semaphore_ids),
+    MUTEXES: list_of(integer()),
+}
+DESCRIPTION_SCHEMA = compile_schema(object_of({**DESCRIPTION_FIELDS, PROCESSES: list_of(PROCESS_FIELDS)}, DESCRIPTION_OPTIONAL_FIELDS))
+# A streamed description holds everything but the processes on its first line, then one process per line.
+STREAMED_DESCRIPTION_SCHEMA = compile_schema(object_of(DESCRIPTION_FIELDS, DESCRIPTION_OPTIONAL_FIELDS))
+PROCESS_SCHEMA = compile_schema(PROCESS_FIELDS)
+
+# SHA-256 digests of the description files this process has validated, so that loading one again only parses it.
+validated_descriptions: set[bytes] = set()
+
+# Parses a simulation description, validating it first unless it is known to be valid.
+# Streamed descriptions are parsed without their processes.
+def parse_workload(emulation_json: dict, with_processes: bool = True, validate: bool = True) -> Workload:
+    if validate:
+        (DESCRIPTION_SCHEMA if with_processes else STREAMED_DESCRIPTION_SCHEMA).validate(emulation_json)
+
+    semaphores = dict()
+    for semaphore in emulation_json.get(SEMAPHORES, ()):
+        semaphores[semaphore[SEMAPHORE_ID]] = semaphore[SEMAPHORE_INIT_VAL]
+    mutexes = tuple(emulation_json.get(MUTEXES, ()))
+
+    processes = []
+    if with_processes:
+        for process in emulation_json[PROCESSES]:
+            processes.append(parse_process(process))
+        # Sort arrivals so earliest arrivals are at the end.
+        processes.sort(key=lambda p: p.arrival, reverse=True)
+
+    return Workload(emulation_json["scheduling_algorithm"], tuple(semaphores.items()), mutexes, tuple(processes))
+
+# Parses a whole .json or .jsonl simulation description into a workload.
+# Validation is skipped for a file whose content this process has already validated.
+# With use_cache the workload is loaded from the on-disk workload cache, and compiled into it on a miss,
+# which removes the entries of the description's earlier versions.
+# rebuild_cache compiles it again even if it is cached.
+def load_workload(emulation_description_path: Path, use_cache: bool = False, rebuild_cache: bool = False) -> Workload:
+    with open(emulation_description_path, 'rb') as description_file:
+        content = description_file.read()
+    digest = hashlib.sha256(content).digest()
+    if use_cache and not rebuild_cache:
+        records = read_workload(cache_path(emulation_description_path, digest), digest, ProcessEvent)
+        if records is not None:
+            validated_descriptions.add(digest)
+            return workload_from_records(records)
+
+    if Path(emulation_description_path).suffix != ".jsonl":
+        emulation_json = json.loads(content)
+    else:
+        lines = content.splitlines()
+        emulation_json = json.loads(lines[0])
+        emulation_json[PROCESSES] = [json.loads(line) for line in lines[1:] if line.strip() != b""]
+    workload = parse_workload(emulation_json, validate=digest not in validated_descriptions)
+    validated_descriptions.add(digest)
+    if use_cache:
+        try:
+            write_workload(cache_path(emulation_description_path, digest), digest, workload_records(workload))
+            remove_stale_entries(emulation_description_path, digest)
+        except (OSError, struct.error):
+            # An unwritable directory or values too large for the records only cost the speedup.
+            pass
+    return workload
+
+# Flattens a workload for the workload cache. Processes are stored as they are ready to run, events in firing order.
+def workload_records(workload: Workload) -> WorkloadRecords:
+    processes = []
+    events = []
+    for process in workload.processes:
+        processes.append((process.arrival, process.total_cpu_time, process.priority, process.next_event_at, len(events),
+                          len(process.events), PROCESS_TYPES.index(process.process_type)))
+        events += [(event.arrival, event.kind, event.value) for event in process.events]
+    return WorkloadRecords(workload.scheduling_algorithm, list(workload.semaphores), list(workload.mutexes), processes, events)
+
+def workload_from_records(records: WorkloadRecords) -> Workload:
+    events = records.events
+    processes = tuple(Process(arrival, total_cpu_time, 0, priority, events[first_event:first_event + event_count], PROCESS_TYPES[process_type],
+                              0, next_event_at)
+                      for arrival, total_cpu_time, priority, next_event_at, first_event, event_count, process_type in records.processes)
+    return Workload(records.scheduling_algorithm, tuple(records.semaphores), tuple(records.mutexes), processes)
+
+# Parses one entry of the processes list of a validated simulation description.
+def parse_process(process: dict) -> Process:
+    priority = process.get(PRIORITY, DEFAULT_PRIORITY)
+
+    events = []
+    for change in process.get(PRIORITY_CHANGES, ()):
+        events.append(ProcessEvent(change[EVENT_ARRIVAL], EVENT_PRIORITY_CHANGE, change[NEW_PRIORITY]))
+    for event in process.get(PROCESS_SEMAPHORE, ()):
+        if PROCESS_SEMA_P in event:
+            events.append(ProcessEvent(event[PROCESS_SEMA_P], EVENT_SEMAPHORE_P, event[PROCESSES_SEMA_ID]))
+        else:
+            events.append(ProcessEvent(event[PROCESS_SEMA_V], EVENT_SEMAPHORE_V, event[PROCESSES_SEMA_ID]))
+    for event in process.get(PROCESS_MUTEX, ()):
+        if PROCESS_MUTEX_LOCK in event:
+            events.append(ProcessEvent(event[PROCESS_MUTEX_LOCK], EVENT_MUTEX_LOCK, event[PROCESSES_MUTEX_ID]))
+        else:
+            events.append(ProcessEvent(event[PROCESS_MUTEX_UNLOCK], EVENT_MUTEX_UNLOCK, event[PROCESSES_MUTEX_ID]))
+
+    # Merge all events into a single timeline ordered by arrival.
+    events.sort(key=lambda e: e.arrival)
+
+    process = Process(process[ARRIVAL], process[TOTAL_CPU_TIME], 0, priority, events, process.get(PROCESS_TYPE, "Foreground"))
+    process.prepare_timeline()
+    return process
+
+# Validates and yields the processes of a streamed description, one line at a time.
+# Lines are read with readline, as iterating over the file would stop tell() from working for checkpoints.
+# Errors are located by the offset of their line, which stays exact when a checkpoint resumes the stream.
+def stream_processes(file: TextIOWrapper, last_arrival: MICRO_S | None = None):
+    while True:
+        offset = file.tell()
+        line = file.readline()
+        if line == "":
+            break
+        if line.strip() == "":
+            continue
+        root = f"line at byte {offset}: $"
+        process_json = json.loads(line)
+        PROCESS_SCHEMA.validate(process_json, root)
+        process = parse_process(process_json)
+        if last_arrival is not None and process.arrival < last_arrival:
+            raise ValidationError([f"{root}.{ARRIVAL}: arrives at {process.arrival}us, before the previous line's {last_arrival}us; "
+                                   f"streamed processes must be ordered by arrival"])
+        last_arrival = process.arrival
+        yield process
+    file.close()
+
+def usage_error(message: str):
+    print(f"Error: {message}")
+    print_usage()
+
+# Returns the value of an option that takes a positive number of microseconds, e.g. --checkpoint-every=1000.
+def microseconds_option(options: dict[str, str], name: str) -> MICRO_S:
+    value = options[name]
+    if not value.isascii() or not value.isdigit() or int(value) == 0:
+        usage_error(f"{name} takes a positive number of microseconds, e.g. {name}=1000, not {value!r}")
+    return int(value)
 
 def print_usage():
-    print("Usage: python simulator.py <simulation_description_path> <log_path> <optional --no-student-logs>")
+    print("Usage: python simulator.py <simulation_description_path (.json or .jsonl)> <log_path> <optional --no-student-logs> <optional --event-driven> <optional --compact-log> <optional --tickless> <optional --metrics> <optional --metrics-csv> <optional --profile> <optional --checkpoint-every=<us>> <optional --resume=<checkpoint_path>> <optional --no-fast-path> <optional --binary-trace> <optional --detect-deadlocks> <optional --starvation-limit=<us>> <optional --workload-cache> <optional --rebuild-workload-cache>")
+    print("With --binary-trace the log is written as a binary trace, which binary_trace.py queries and converts to text.")
+    print("With --compact-log the log is recorded in <log_path>.records and rendered to text when the run ends. The records are kept if checkpoints were taken.")
+    print("With --resume the run continues from the checkpoint, which already holds the description and every other option.")
+    print("It only takes --checkpoint-every, and --metrics or --metrics-csv if the checkpoint was taken with metrics, and <log_path> must be the checkpoint's log.")
+    print(f"With --workload-cache a .json description is compiled into {WORKLOAD_CACHE_DIR}/ next to it and loaded from there while it is unchanged.")
+    print("Compiling an edited description removes the entry of its previous version. --rebuild-workload-cache compiles it again, and implies --workload-cache.")
     sys.exit(1)
 
 
 if __name__ == "__main__":
-    student_logs = True
-    if len(sys.argv) <= 2 or len(sys.argv) >= 5:
+    if len(sys.argv) <= 2 or len(sys.argv) >= 3 + len(VALID_OPTIONS) + 1:
         print_usage()
     if type(sys.argv[1]) is not str or type(sys.argv[2]) is not str:
         print_usage()
-    if len(sys.argv) == 4:
-        if sys.argv[3] != "--no-student-logs":
+    options = dict()
+    for option in sys.argv[3:]:
+        name, _, value = option.partition("=")
+        if name not in VALID_OPTIONS:
             print_usage()
-        else:
-            student_logs = False
-
-
+        options[name] = value
+    student_logs = "--no-student-logs" not in options
+    event_driven = "--event-driven" in options
+    tickless = "--tickless" in options
+    # Metrics are written next to the log, e.g. output.metrics.json for output.txt.
+    metrics = MetricsCollector() if "--metrics" in options or "--metrics-csv" in options else None
+    profiler = KernelProfiler() if "--profile" in options else None
+    watchdog = None
+    if "--detect-deadlocks" in options or "--starvation-limit" in options:
+        watchdog = Watchdog(microseconds_option(options, "--starvation-limit") if "--starvation-limit" in options else None)
+
+    checkpoint_interval = microseconds_option(options, "--checkpoint-every") if "--checkpoint-every" in options else None
 
     sim_description = Path(sys.argv[1])
     log_path = Path(sys.argv[2])
-    simulator = Simulator(sim_description, log_path, student_logs)
-    simulator.run_simulator()
\ No newline at end of file
+    if "--resume" in options:
+        if options["--resume"] == "":
+            usage_error("--resume takes the path of a checkpoint, e.g. --resume=output.1000.ckpt")
+        if not set(options) <= VALID_RESUME_OPTIONS:
+            usage_error(f"{', '.join(sorted(set(options) - VALID_RESUME_OPTIONS))} can't be used with --resume")
+        simulator = Simulator.load_checkpoint(options["--resume"])
+        metrics = simulator.metrics
+        if metrics is None and ("--metrics" in options or "--metrics-csv" in options):
+            usage_error(f"{options['--resume']} was taken without metrics, so the resumed run has none to write")
+        # The resumed run keeps writing the checkpoint's log, and metrics and checkpoints go next to it.
+        resumed_log = getattr(simulator.log_sink, "logfile_path", None) or getattr(simulator.log_sink, "trace_path", None)
+        if resumed_log is not None and Path(resumed_log).resolve() != log_path.resolve():
+            usage_error(f"{options['--resume']} writes its log to {resumed_log}, not {log_path}")
+    else:
+        log_sink = None
+        if "--binary-trace" in options:
+            log_sink = BinaryTraceSink(log_path)
+        elif "--compact-log" in options:
+            log_sink = RecordLogSink(log_path)
+        # A .jsonl description is streamed instead, which loading it whole from the cache would defeat.
+        workload = sim_description
+        if sim_description.suffix != ".jsonl" and ("--workload-cache" in options or "--rebuild-workload-cache" in options):
+            workload = load_workload(sim_description, use_cache=True, rebuild_cache="--rebuild-workload-cache" in options)
+        simulator = Simulator(workload, log_path, student_logs, event_driven, log_sink, tickless, metrics, profiler,
+                              None, watchdog)
+        simulator.fast_path = "--no-fast-path" not in options
+    if checkpoint_interval is not None:
+        # Checkpoints are saved next to the log, e.g. output.1000.ckpt for output.txt at 1ms.
+        simulator.checkpoint_every(checkpoint_interval, str(log_path.with_suffix(".{time}.ckpt")))
+    simulator.run_simulator()
+    if "--metrics" in options:
+        metrics.write_json(log_path.with_suffix(".metrics.json"), profiler)
+    if "--metrics-csv" in options:
+        metrics.write_csv(log_path.with_suffix(".metrics.csv"), profiler)
+    if profiler is not None:
+        profiler.print_report()
\ No newline at end of file
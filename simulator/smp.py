@@ -0,0 +1,288 @@
+import argparse
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from kernel import Kernel, KernelConfig
+from log_sink import LogSink, TextLogSink, SIMULATOR_DELIMITER, STUDENT_DELIMITER, LOG_MESSAGES, LOG_ARRIVAL_KINDS, LOG_EXIT, \
+    LOG_SWITCH, LOG_SET_PRIORITY, LOG_SEMAPHORE_P, LOG_SEMAPHORE_V, LOG_MUTEX_LOCK, LOG_MUTEX_UNLOCK, LOG_SEMAPHORE_INIT, LOG_MUTEX_INIT
+from simulator import MICRO_S, PID, NUM_MICRO_IN_SEC, SimulationError, check_mutex_unlock, Semaphore, Mutex, Process, Workload, load_workload, \
+    EVENT_PRIORITY_CHANGE, EVENT_SEMAPHORE_P, EVENT_SEMAPHORE_V, EVENT_MUTEX_LOCK, EVENT_MUTEX_UNLOCK
+
+
+# The student logger of one core. Its messages are tagged with the core like the simulator's own.
+class CoreLogger:
+    enabled: bool
+
+    def __init__(self, simulator: "SMPSimulator | None", cpu: int):
+        self.simulator = simulator
+        self.cpu = cpu
+        self.enabled = simulator is not None
+
+    def log(self, str: str):
+        if self.enabled:
+            self.simulator.log(self.cpu, str, student_log=True)
+
+@dataclass(slots=True)
+class CoreStats:
+    cpu: int
+    # Microseconds spent running a process rather than the idle process.
+    busy_time: MICRO_S = 0
+    context_switches: int = 0
+    # Processes that ran here after last running on another core.
+    migrations_in: int = 0
+    # Processes this core took from another core's ready queue.
+    steals: int = 0
+
+
+# Simulates a workload on several cores. Each core is a Kernel of its own, with its own running process,
+# ready queues and timer interrupts, but all cores share the semaphores and mutexes.
+# Every simulated microsecond advances the process on each core, then delivers arrivals and timer interrupts.
+# Balancing:
+# - A new process is queued on the core with the fewest processes.
+# - A process woken by v() or unlock() is queued on the core that woke it.
+# - A core with nothing to run steals a waiting process from the core with the most waiting.
+# With one core the log is the single-core log with every line tagged "[cpu 0]".
+class SMPSimulator:
+    elapsed_time: MICRO_S
+    cpus: int
+    cores: list[Kernel]
+    # The pid running on each core, 0 for its idle process.
+    current_processes: list[PID]
+    processes: dict[PID, Process]
+    # Processes that have not arrived yet, latest first.
+    arrivals: list
+    process_types: dict[PID, str]
+    # The core each process last ran on.
+    last_cpu: dict[PID, int]
+    stats: list[CoreStats]
+    next_pid: PID
+    log_sink: LogSink
+    needs_spacing: bool
+    # How long every core has been idle.
+    idle_runtime: MICRO_S
+    semaphores: dict[int, Semaphore]
+    mutexes: dict[int, Mutex]
+    timer_interrupt_interval: MICRO_S
+
+    def __init__(self, emulation_description_path: "Path | Workload", logfile_path: str | None, student_logs: bool, cpus: int, \
+                 log_sink: LogSink | None = None, kernel_config: KernelConfig | None = None):
+        assert(cpus > 0)
+        workload = emulation_description_path if isinstance(emulation_description_path, Workload) else load_workload(emulation_description_path)
+        self.elapsed_time = 0
+        self.cpus = cpus
+        self.current_processes = [0] * cpus
+        self.processes = dict()
+        self.arrivals = [process.copy() for process in workload.processes]
+        self.process_types = dict()
+        self.last_cpu = dict()
+        self.stats = [CoreStats(cpu) for cpu in range(cpus)]
+        self.next_pid = 1
+        self.needs_spacing = False
+        self.idle_runtime = 0
+        self.semaphores = {id: Semaphore(init_val, False) for id, init_val in workload.semaphores}
+        self.mutexes = {id: Mutex(False) for id in workload.mutexes}
+
+        self.cores = []
+        for cpu in range(cpus):
+            core = Kernel(workload.scheduling_algorithm, CoreLogger(self if student_logs else None, cpu))
+            if kernel_config is not None:
+                core.configure(kernel_config)
+            if cpu > 0:
+                # Sharing the dicts lets a core wake a process that blocked on another one.
+                core.semaphores = self.cores[0].semaphores
+                core.mutexes = self.cores[0].mutexes
+            self.cores.append(core)
+        self.timer_interrupt_interval = self.cores[0].timer_interrupt_interval
+
+        self.log_sink = log_sink if log_sink is not None else TextLogSink(logfile_path)
+
+    def run_simulator(self):
+        try:
+            # Emulation ends when all processes have finished.
+            while len(self.processes) + len(self.arrivals) > 0:
+                self.step()
+        finally:
+            self.log_sink.close()
+
+    # Simulates a single microsecond on every core.
+    def step(self):
+        if not any(self.current_processes):
+            self.idle_runtime += 1
+        if self.idle_runtime >= NUM_MICRO_IN_SEC:
+            raise SimulationError("Every core has been idle for 1 second straight. This is likely a bug in the kernel.")
+
+        self.advance_current_processes()
+
+        self.check_for_arrival()
+
+        if self.elapsed_time != 0 and self.elapsed_time % self.timer_interrupt_interval == 0:
+            for cpu in range(self.cpus):
+                self.switch_process(cpu, self.cores[cpu].timer_interrupt())
+
+        self.balance()
+
+        self.log_add_spacing()
+        self.elapsed_time += 1
+
+    def advance_current_processes(self):
+        for cpu in range(self.cpus):
+            self.advance_current_process(cpu)
+
+    def advance_current_process(self, cpu: int):
+        pid = self.current_processes[cpu]
+        if pid == 0:
+            return
+        core = self.cores[cpu]
+        current_process = self.processes[pid]
+        current_process.elapsed_cpu_time += 1
+        self.stats[cpu].busy_time += 1
+        if current_process.elapsed_cpu_time < current_process.next_event_at:
+            return
+
+        if current_process.total_cpu_time <= current_process.elapsed_cpu_time:
+            self.log_event(cpu, LOG_EXIT, pid)
+            new_process = core.syscall_exit()
+            if new_process == pid:
+                raise SimulationError(f"Attempted to continue execution of exiting process (pid = {pid}) on cpu {cpu}")
+            del self.processes[pid]
+            self.switch_process(cpu, new_process)
+            return
+
+        while current_process.next_event_at <= current_process.elapsed_cpu_time:
+            event = current_process.pop_event()
+            if event.kind == EVENT_PRIORITY_CHANGE:
+                self.log_event(cpu, LOG_SET_PRIORITY, self.current_processes[cpu], event.value)
+                self.switch_process(cpu, core.syscall_set_priority(event.value))
+            elif event.kind == EVENT_SEMAPHORE_P:
+                self.check_semaphore_inited(cpu, event.value)
+                self.log_event(cpu, LOG_SEMAPHORE_P, self.current_processes[cpu], event.value)
+                self.switch_process(cpu, core.syscall_semaphore_p(event.value))
+            elif event.kind == EVENT_SEMAPHORE_V:
+                self.check_semaphore_inited(cpu, event.value)
+                self.log_event(cpu, LOG_SEMAPHORE_V, self.current_processes[cpu], event.value)
+                self.switch_process(cpu, core.syscall_semaphore_v(event.value))
+            elif event.kind == EVENT_MUTEX_LOCK:
+                self.check_mutex_inited(cpu, event.value)
+                self.log_event(cpu, LOG_MUTEX_LOCK, self.current_processes[cpu], event.value)
+                self.switch_process(cpu, core.syscall_mutex_lock(event.value))
+            elif event.kind == EVENT_MUTEX_UNLOCK:
+                self.check_mutex_inited(cpu, event.value)
+                self.log_event(cpu, LOG_MUTEX_UNLOCK, self.current_processes[cpu], event.value)
+                check_mutex_unlock(core, self.current_processes[cpu], event.value)
+                self.switch_process(cpu, core.syscall_mutex_unlock(event.value))
+
+    # Semaphores and mutexes are initialized once, by whichever core uses them first.
+    def check_semaphore_inited(self, cpu: int, id: int):
+        if not self.semaphores[id].initilized:
+            self.log_event(cpu, LOG_SEMAPHORE_INIT, id, self.semaphores[id].init_val)
+            self.cores[cpu].syscall_init_semaphore(id, self.semaphores[id].init_val)
+            self.semaphores[id].initilized = True
+
+    def check_mutex_inited(self, cpu: int, id: int):
+        if not self.mutexes[id].initilized:
+            self.log_event(cpu, LOG_MUTEX_INIT, id)
+            self.cores[cpu].syscall_init_mutex(id)
+            self.mutexes[id].initilized = True
+
+    # A new process is queued on the core with the fewest processes, its running one included. Ties go to the lowest cpu.
+    def least_loaded_cpu(self) -> int:
+        return min(range(self.cpus), key=lambda cpu: self.cores[cpu].scheduler.ready_count() + (self.current_processes[cpu] != 0))
+
+    def check_for_arrival(self):
+        while len(self.arrivals) > 0 and self.arrivals[len(self.arrivals) - 1].arrival == self.elapsed_time:
+            new_process = self.arrivals.pop()
+            cpu = self.least_loaded_cpu()
+            self.processes[self.next_pid] = new_process
+            self.process_types[self.next_pid] = new_process.process_type
+            self.log_event(cpu, LOG_ARRIVAL_KINDS[new_process.process_type], self.next_pid, new_process.priority)
+            self.switch_process(cpu, self.cores[cpu].new_process_arrived(self.next_pid, new_process.priority, new_process.process_type))
+            self.next_pid += 1
+
+    # Work stealing: a core with nothing running or waiting takes a waiting process from the core with the most waiting.
+    def balance(self):
+        if all(self.current_processes):
+            return
+        for cpu, core in enumerate(self.cores):
+            if self.current_processes[cpu] != 0 or core.scheduler.ready_count() > 0:
+                continue
+            victim = max(range(self.cpus), key=lambda other: self.cores[other].scheduler.ready_count())
+            if self.cores[victim].scheduler.ready_count() == 0:
+                return
+            pcb = self.cores[victim].scheduler.steal()
+            if pcb is None:
+                continue
+            core.scheduler.add_process(pcb, self.process_types[pcb.pid])
+            self.cores[victim].invalidate_decision()
+            core.invalidate_decision()
+            self.stats[cpu].steals += 1
+            self.log(cpu, f"Stole pid: {pcb.pid} from cpu {victim}")
+            self.switch_process(cpu, core.choose_next_process())
+
+    def switch_process(self, cpu: int, new_process: PID):
+        if new_process != 0:
+            if new_process not in self.processes:
+                raise SimulationError(f"Attempted to switch to unkown PID {new_process} on cpu {cpu}")
+            last_cpu = self.last_cpu.get(new_process, cpu)
+            if last_cpu != cpu and self.current_processes[last_cpu] == new_process:
+                raise SimulationError(f"Attempted to run PID {new_process} on cpu {cpu} while it runs on cpu {last_cpu}")
+            self.idle_runtime = 0
+
+        if new_process != self.current_processes[cpu]:
+            self.log_event(cpu, LOG_SWITCH, new_process)
+            self.stats[cpu].context_switches += 1
+            if new_process != 0:
+                if self.last_cpu.get(new_process, cpu) != cpu:
+                    self.stats[cpu].migrations_in += 1
+                self.last_cpu[new_process] = cpu
+        self.current_processes[cpu] = new_process
+
+    def log(self, cpu: int, str: str, student_log = False):
+        self.log_sink.write(self.elapsed_time, STUDENT_DELIMITER if student_log else SIMULATOR_DELIMITER, f"[cpu {cpu}] {str}")
+        self.needs_spacing = True
+
+    def log_event(self, cpu: int, kind: int, pid: int, arg: int = 0):
+        self.log(cpu, LOG_MESSAGES[kind].format(pid=pid, arg=arg))
+
+    def log_add_spacing(self):
+        if self.needs_spacing:
+            self.log_sink.write_spacing()
+            self.needs_spacing = False
+
+    def report(self) -> dict:
+        cores = []
+        for stats in self.stats:
+            core = asdict(stats)
+            core["utilisation"] = stats.busy_time / self.elapsed_time if self.elapsed_time > 0 else None
+            cores.append(core)
+        return {"cpus": self.cpus, "end_time": self.elapsed_time,
+                "utilisation": sum(stats.busy_time for stats in self.stats) / (self.cpus * self.elapsed_time) if self.elapsed_time > 0 else None,
+                "migrations": sum(stats.migrations_in for stats in self.stats),
+                "steals": sum(stats.steals for stats in self.stats),
+                "cores": cores}
+
+def format_report(report: dict) -> str:
+    lines = [f"{'cpu':>4} {'busy':>10} {'util':>7} {'switches':>9} {'migrations':>10} {'steals':>7}"]
+    for core in report["cores"]:
+        lines.append(f"{core['cpu']:>4} {core['busy_time']:>10} {core['utilisation'] or 0:>7.1%} {core['context_switches']:>9} "
+                     f"{core['migrations_in']:>10} {core['steals']:>7}")
+    lines.append(f"{'all':>4} {'':>10} {report['utilisation'] or 0:>7.1%} {'':>9} {report['migrations']:>10} {report['steals']:>7}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a workload on several cores with per-core run queues and work stealing.")
+    parser.add_argument("description", help="simulation description (.json or .jsonl)")
+    parser.add_argument("log", help="path of the log to write; every line is tagged with its cpu")
+    parser.add_argument("--cpus", type=int, default=2)
+    parser.add_argument("--no-student-logs", action="store_true")
+    parser.add_argument("--stats", help="JSON file the per-core statistics are also written to")
+    args = parser.parse_args()
+
+    simulator = SMPSimulator(Path(args.description), args.log, not args.no_student_logs, args.cpus)
+    simulator.run_simulator()
+    report = simulator.report()
+    print(format_report(report))
+    if args.stats is not None:
+        with open(args.stats, 'w') as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,121 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, fields, replace
+
+from batch import worker_pool, worker_shared
+from kernel import KernelConfig
+from log_sink import CountingLogSink
+from metrics import MetricsCollector
+from simulator import Simulator, Workload, load_workload, VALID_SCHEDULING_ALGORITHMS
+
+DEFAULT_CONFIG = KernelConfig()
+
+# The KernelConfig fields each policy reads besides the timer interrupt interval.
+# Sweeping a field a policy ignores would only repeat the same run, so those points are dropped.
+TUNED_FIELDS = {"FCFS": (), "Priority": (), "RR": ("quantum",), "Multilevel": ("quantum", "level_time_slice")}
+
+# Aggregate metrics shown in the comparison table, by column title.
+TABLE_METRICS = {"turnaround": "mean_turnaround", "waiting": "mean_waiting", "response": "mean_response",
+                 "switches": "context_switches", "idle": "idle_time", "end": "end_time"}
+
+@dataclass(frozen=True)
+class SweepPoint:
+    scheduling_algorithm: str
+    config: KernelConfig
+
+# Returns every combination of the given values, leaving out repeats that only differ in fields the policy ignores.
+# Raises ValueError for a value no kernel can run with.
+def sweep_grid(algorithms: list[str], quanta: list[int], level_time_slices: list[int], timer_interrupt_intervals: list[int]) -> list[SweepPoint]:
+    for quantum in quanta:
+        if quantum <= 0:
+            raise ValueError(f"Invalid quantum: {quantum}us, it must be positive")
+    for interval in timer_interrupt_intervals:
+        if interval <= 0:
+            raise ValueError(f"Invalid timer interrupt interval: {interval}us, it must be positive")
+    for level_time_slice, interval in itertools.product(level_time_slices, timer_interrupt_intervals):
+        if level_time_slice <= interval:
+            raise ValueError(f"Invalid level time slice: {level_time_slice}us, it must be longer than the {interval}us timer interrupt interval")
+
+    all_fields = tuple(field.name for field in fields(KernelConfig) if field.name != "timer_interrupt_interval")
+    points = []
+    for algorithm, quantum, level_time_slice, interval in itertools.product(algorithms, quanta, level_time_slices, timer_interrupt_intervals):
+        config = KernelConfig(interval, quantum, level_time_slice)
+        # Fields the policy ignores are reset to their defaults, which makes the repeats equal.
+        ignored = {name: getattr(DEFAULT_CONFIG, name) for name in all_fields if name not in TUNED_FIELDS.get(algorithm, all_fields)}
+        point = SweepPoint(algorithm, replace(config, **ignored))
+        if point not in points:
+            points.append(point)
+    return points
+
+# Simulates the workload at one point of the sweep and returns the aggregate metrics.
+def run_point(workload: Workload, point: SweepPoint) -> dict:
+    result = {"scheduling_algorithm": point.scheduling_algorithm, **asdict(point.config)}
+    metrics = MetricsCollector()
+    start = time.perf_counter()
+    try:
+        simulator = Simulator(replace(workload, scheduling_algorithm=point.scheduling_algorithm), None, False, True,
+                              CountingLogSink(), True, metrics, None, point.config)
+        simulator.run_simulator()
+    except Exception as e:
+        # Only the first line, so that the error fits in the table.
+        message = str(e).strip().splitlines()
+        result["error"] = type(e).__name__ + (f": {message[0]}" if len(message) > 0 else "")
+    result["run_time_s"] = time.perf_counter() - start
+    result.update(metrics.aggregate())
+    return result
+
+# Runs a point in a worker_pool that shares the workload.
+def run_worker_point(point: SweepPoint) -> dict:
+    return run_point(worker_shared(), point)
+
+# Runs every point of the sweep on the same parsed workload, in parallel when workers > 1.
+# Results are in the order of points.
+def run_sweep(workload: Workload, points: list[SweepPoint], workers: int = 1) -> list[dict]:
+    if workers == 1:
+        return [run_point(workload, point) for point in points]
+    with worker_pool(workers, workload) as executor:
+        return list(executor.map(run_worker_point, points))
+
+def format_table(results: list[dict]) -> str:
+    header = f"{'algorithm':>10} {'quantum':>7} {'slice':>5} {'tick':>4} " + " ".join(f"{title:>10}" for title in TABLE_METRICS)
+    lines = [header, "-" * len(header)]
+    for result in results:
+        tuned = TUNED_FIELDS.get(result["scheduling_algorithm"], ("quantum", "level_time_slice"))
+        quantum = result["quantum"] if "quantum" in tuned else "-"
+        level_time_slice = result["level_time_slice"] if "level_time_slice" in tuned else "-"
+        line = f"{result['scheduling_algorithm']:>10} {quantum:>7} {level_time_slice:>5} {result['timer_interrupt_interval']:>4} "
+        if "error" in result:
+            line += result["error"]
+        else:
+            values = [result[metric] for metric in TABLE_METRICS.values()]
+            line += " ".join(f"{value:>10.1f}" if type(value) is float else f"{value:>10}" for value in values)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate one workload under a grid of kernel configurations and compare the metrics.")
+    parser.add_argument("description", help="simulation description (.json or .jsonl); its scheduling_algorithm is ignored")
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(VALID_SCHEDULING_ALGORITHMS),
+                        default=sorted(VALID_SCHEDULING_ALGORITHMS))
+    parser.add_argument("--quanta", nargs="+", type=int, default=[DEFAULT_CONFIG.quantum])
+    parser.add_argument("--level-time-slices", nargs="+", type=int, default=[DEFAULT_CONFIG.level_time_slice])
+    parser.add_argument("--timer-interrupt-intervals", nargs="+", type=int, default=[DEFAULT_CONFIG.timer_interrupt_interval])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", help="JSON file the results are also written to")
+    args = parser.parse_args()
+
+    try:
+        points = sweep_grid(args.algorithms, args.quanta, args.level_time_slices, args.timer_interrupt_intervals)
+    except ValueError as e:
+        parser.error(str(e))
+    workload = load_workload(args.description)
+    results = run_sweep(workload, points, args.workers)
+    print(format_table(results))
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,206 @@
+import math
+from collections import deque
+from typing import Collection
+
+from log_sink import format_time
+
+MICRO_S = int
+PID = int
+
+SEMAPHORE = "semaphore"
+MUTEX = "mutex"
+
+# Processes listed in a starvation report, longest waiting first.
+STARVATION_REPORT_PROCESSES = 10
+
+
+# The watchdog's model of a semaphore or mutex, following the kernel's semantics.
+class Resource:
+    __slots__ = ("kind", "id", "value", "owner", "waiters")
+    kind: str
+    id: int
+    # Semaphores only.
+    value: int
+    # Mutexes only. A mutex stays locked while its owner lives, and after it exited holding the mutex.
+    owner: PID | None
+    # Processes blocked on the resource that the kernel has not woken, in the order they blocked.
+    waiters: dict[PID, None]
+
+    def __init__(self, kind: str, id: int, value: int = 0):
+        self.kind = kind
+        self.id = id
+        self.value = value
+        self.owner = None
+        self.waiters = dict()
+
+    def __repr__(self):
+        if self.kind == SEMAPHORE:
+            return f"semaphore {self.id} (value {self.value})"
+        return f"mutex {self.id} held by process {self.owner}" if self.owner is not None else f"mutex {self.id}"
+
+
+# Watches a run for deadlocks and starvation so that it can be aborted with a diagnostic
+# long before the idle process has run for a second.
+# A wait-for graph is kept from the simulator's semaphore and mutex syscalls. Each blocking call checks:
+# - whether the caller closed a cycle of processes waiting on mutexes held by the next one, and
+# - whether every remaining process is blocked with no arrival left to wake them.
+# v() and unlock() only wake the process the kernel took off the resource's queue, which is then ready to run,
+# so a policy that never wakes waiters still ends in a detected deadlock.
+# With a starvation_limit, a process that stays ready that long without running is reported too.
+# Methods return a diagnostic when the run should be aborted, and None otherwise.
+class Watchdog:
+    starvation_limit: MICRO_S | None
+    resources: dict[tuple[str, int], Resource]
+    live: set[PID]
+    waiting_on: dict[PID, Resource]
+    # Semaphores a process acquired and has not released, and mutexes it owns.
+    holding: dict[PID, list[Resource]]
+    running: PID
+    # When each process that is neither running nor blocked was last switched out, or arrived.
+    ready_since: dict[PID, MICRO_S]
+    # (ready_since, pid) in the order processes became ready. Entries of processes that ran since are dropped lazily.
+    ready_order: deque[tuple[MICRO_S, PID]]
+
+    def __init__(self, starvation_limit: MICRO_S | None = None):
+        assert(starvation_limit is None or starvation_limit > 0)
+        self.starvation_limit = starvation_limit
+        self.resources = dict()
+        self.live = set()
+        self.waiting_on = dict()
+        self.holding = dict()
+        self.running = 0
+        self.ready_since = dict()
+        self.ready_order = deque()
+
+    def semaphore_inited(self, id: int, init_val: int):
+        self.resources[(SEMAPHORE, id)] = Resource(SEMAPHORE, id, init_val)
+
+    def mutex_inited(self, id: int):
+        self.resources[(MUTEX, id)] = Resource(MUTEX, id)
+
+    def process_arrived(self, pid: PID, time: MICRO_S):
+        self.live.add(pid)
+        self.holding[pid] = []
+        self.became_ready(pid, time)
+
+    # The semaphores and mutexes the process still holds stay held.
+    def process_exited(self, pid: PID, time: MICRO_S, arrivals_remaining: bool) -> str | None:
+        self.live.discard(pid)
+        self.ready_since.pop(pid, None)
+        del self.holding[pid]
+        return self.check_all_blocked(time, arrivals_remaining)
+
+    def process_switched(self, old_pid: PID, new_pid: PID, time: MICRO_S):
+        if old_pid != 0 and old_pid in self.live and old_pid not in self.waiting_on:
+            self.became_ready(old_pid, time)
+        self.running = new_pid
+        self.ready_since.pop(new_pid, None)
+
+    # Called after the kernel handled p(), before switching away from the caller.
+    def semaphore_p(self, pid: PID, id: int, time: MICRO_S, arrivals_remaining: bool) -> str | None:
+        semaphore = self.resources[(SEMAPHORE, id)]
+        semaphore.value -= 1
+        if semaphore.value >= 0:
+            self.holding[pid].append(semaphore)
+            return None
+        return self.block(pid, semaphore, time, arrivals_remaining)
+
+    # Called after the kernel handled v(), with the processes it still keeps blocked on the semaphore.
+    def semaphore_v(self, pid: PID, id: int, blocked_queue: Collection, time: MICRO_S):
+        semaphore = self.resources[(SEMAPHORE, id)]
+        semaphore.value += 1
+        if semaphore in self.holding[pid]:
+            self.holding[pid].remove(semaphore)
+        self.wake(semaphore, blocked_queue, time)
+
+    def mutex_lock(self, pid: PID, id: int, time: MICRO_S, arrivals_remaining: bool) -> str | None:
+        mutex = self.resources[(MUTEX, id)]
+        if mutex.owner is None:
+            mutex.owner = pid
+            self.holding[pid].append(mutex)
+            return None
+        return self.block(pid, mutex, time, arrivals_remaining)
+
+    # Called after the kernel handled unlock(), with the processes it still keeps waiting on the mutex.
+    def mutex_unlock(self, pid: PID, id: int, waiting_queue: Collection, time: MICRO_S):
+        mutex = self.resources[(MUTEX, id)]
+        if mutex.owner in self.holding:
+            self.holding[mutex.owner].remove(mutex)
+        mutex.owner = self.wake(mutex, waiting_queue, time)
+
+    # Hands the resource to the waiter the kernel took off its queue, if it woke one, and returns its pid.
+    def wake(self, resource: Resource, queue: Collection, time: MICRO_S) -> PID | None:
+        if len(queue) == len(resource.waiters):
+            return None
+        still_waiting = {pcb.pid for pcb in queue}
+        pid = next((pid for pid in resource.waiters if pid not in still_waiting), None)
+        if pid is None:
+            return None
+        del resource.waiters[pid]
+        del self.waiting_on[pid]
+        self.holding[pid].append(resource)
+        self.became_ready(pid, time)
+        return pid
+
+    def block(self, pid: PID, resource: Resource, time: MICRO_S, arrivals_remaining: bool) -> str | None:
+        resource.waiters[pid] = None
+        self.waiting_on[pid] = resource
+        self.ready_since.pop(pid, None)
+        cycle = self.mutex_cycle(pid)
+        if cycle is not None:
+            return self.diagnose(f"Deadlock at {format_time(time)}: processes {', '.join(map(str, cycle))} wait for each other's mutexes.", cycle)
+        return self.check_all_blocked(time, arrivals_remaining)
+
+    # Follows the chain of mutex owners from a process that just blocked on a mutex.
+    # Returns the processes on it if it leads back to that process.
+    def mutex_cycle(self, pid: PID) -> list[PID] | None:
+        cycle = [pid]
+        resource = self.waiting_on.get(pid)
+        while resource is not None and resource.kind == MUTEX and resource.owner is not None:
+            if resource.owner == pid:
+                return cycle
+            if resource.owner in cycle:
+                return None
+            cycle.append(resource.owner)
+            resource = self.waiting_on.get(resource.owner)
+        return None
+
+    # Once every process is blocked, nothing but an arrival can call v() or unlock() again.
+    def check_all_blocked(self, time: MICRO_S, arrivals_remaining: bool) -> str | None:
+        if arrivals_remaining or len(self.live) == 0 or len(self.waiting_on) < len(self.live):
+            return None
+        blocked = sorted(self.live)
+        return self.diagnose(f"Deadlock at {format_time(time)}: every remaining process is blocked and no process is left to arrive.", blocked)
+
+    def diagnose(self, summary: str, pids: list[PID]) -> str:
+        lines = [summary]
+        for pid in pids:
+            line = f"Process {pid} waits for {self.waiting_on[pid]!r}"
+            if len(self.holding[pid]) > 0:
+                line += f" and holds {', '.join(f'{resource.kind} {resource.id}' for resource in self.holding[pid])}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def became_ready(self, pid: PID, time: MICRO_S):
+        self.ready_since[pid] = time
+        self.ready_order.append((time, pid))
+
+    # The time at which the process that has been ready the longest starves, or math.inf.
+    def next_starvation(self) -> MICRO_S:
+        if self.starvation_limit is None:
+            return math.inf
+        while len(self.ready_order) > 0 and self.ready_since.get(self.ready_order[0][1]) != self.ready_order[0][0]:
+            self.ready_order.popleft()
+        return self.ready_order[0][0] + self.starvation_limit if len(self.ready_order) > 0 else math.inf
+
+    def check_starvation(self, time: MICRO_S) -> str | None:
+        if time < self.next_starvation():
+            return None
+        waiting = sorted(self.ready_since.items(), key=lambda item: item[1])
+        lines = [f"Starvation at {format_time(time)}: process {waiting[0][0]} has been ready for {time - waiting[0][1]}us "
+                 f"without running (limit {self.starvation_limit}us).",
+                 "Running: " + ("idle process" if self.running == 0 else f"process {self.running}"),
+                 f"Ready processes ({len(waiting)}), longest waiting first:"]
+        for pid, since in waiting[:STARVATION_REPORT_PROCESSES]:
+            lines.append(f"Process {pid} ready since {format_time(since)}")
+        return "\n".join(lines)
@@ -0,0 +1,123 @@
+import glob
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from itertools import starmap
+from pathlib import Path
+from typing import Callable
+
+MICRO_S = int
+
+# A compiled workload is a parsed, validated and sorted simulation description stored next to it in
+# WORKLOAD_CACHE_DIR, so that loading the same description again only maps the file and builds the objects.
+# Entries are named by the description's file name and the SHA-256 digest of its content, so an edited description
+# misses the cache and is compiled again, and the entry of its previous version is removed then.
+# The file is a header, the scheduling algorithm padded to 8 bytes, then fixed-size records:
+# the semaphores, the mutexes, the processes latest arrival first, and the events of every process in firing order.
+WORKLOAD_CACHE_DIR = "__simcache__"
+WORKLOAD_MAGIC = b"SIMWRKLD"
+# Bumped whenever the format or the way descriptions are parsed changes, which invalidates every entry.
+WORKLOAD_VERSION = 1
+# magic, version, scheduling algorithm length, description digest, semaphore count, mutex count, process count, event count
+HEADER = struct.Struct("<8sII32sqqqq")
+# id, init_val
+SEMAPHORE = struct.Struct("<qq")
+# id
+MUTEX = struct.Struct("<q")
+# arrival, total_cpu_time, priority, next_event_at, index of the first event, event count, process type
+PROCESS = struct.Struct("<qqqqqIB3x")
+# arrival, kind, value, in the order of ProcessEvent's fields
+EVENT = struct.Struct("<qB7xq")
+
+# Process types by the index stored in PROCESS records.
+PROCESS_TYPES = ("Foreground", "Background")
+
+
+# A workload as flat records, which the simulator builds its Workload from and compiles its Workload into.
+@dataclass
+class WorkloadRecords:
+    scheduling_algorithm: str
+    # (id, init_val)
+    semaphores: list[tuple[int, int]]
+    mutexes: list[int]
+    # (arrival, total_cpu_time, priority, next_event_at, first event, event count, process type index)
+    processes: list[tuple]
+    # Built from (arrival, kind, value) by read_workload's make_event.
+    events: list
+
+
+def cache_path(description_path: Path, digest: bytes) -> Path:
+    description_path = Path(description_path)
+    return description_path.parent / WORKLOAD_CACHE_DIR / f"{description_path.name}.{digest.hex()}.workload"
+
+# Removes the entries compiled from other versions of the description, which no run reads anymore.
+# Entries of other descriptions whose name only starts like this one's have a name of a different length.
+# Entries named by the digest alone were written before entries were named by their description, and are removed too.
+def remove_stale_entries(description_path: Path, digest: bytes):
+    entry = cache_path(description_path, digest)
+    for stale in entry.parent.glob(f"{glob.escape(Path(description_path).name)}.*.workload"):
+        if stale != entry and len(stale.name) == len(entry.name):
+            stale.unlink(missing_ok=True)
+    for unnamed in entry.parent.glob("*.workload"):
+        if len(unnamed.name) == len(f"{digest.hex()}.workload"):
+            unnamed.unlink(missing_ok=True)
+
+def padded(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 8)
+
+# Writes a compiled workload. It is written to a temporary file first, so concurrent runs never read half an entry.
+# Raises struct.error for values that do not fit the records, which are then left uncached.
+def write_workload(path: Path, digest: bytes, records: WorkloadRecords):
+    algorithm = records.scheduling_algorithm.encode()
+    parts = [HEADER.pack(WORKLOAD_MAGIC, WORKLOAD_VERSION, len(algorithm), digest, len(records.semaphores), len(records.mutexes),
+                         len(records.processes), len(records.events)), padded(algorithm)]
+    parts += [SEMAPHORE.pack(*semaphore) for semaphore in records.semaphores]
+    parts += [MUTEX.pack(mutex) for mutex in records.mutexes]
+    parts += [PROCESS.pack(*process) for process in records.processes]
+    parts += [EVENT.pack(*event) for event in records.events]
+
+    path.parent.mkdir(exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, 'wb') as file:
+        file.write(b"".join(parts))
+    os.replace(temporary_path, path)
+
+# Maps a compiled workload and returns its records, or None if there is no valid entry for digest.
+# Events are built by make_event(arrival, kind, value) straight from the mapped records.
+def read_workload(path: Path, digest: bytes, make_event: Callable = tuple) -> WorkloadRecords | None:
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with file:
+        # An empty file can't be mapped.
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_workload_records(data, digest, make_event)
+
+# Returns the records of a mapped compiled workload, or None if it is not a complete entry for digest.
+def parse_workload_records(data: mmap.mmap, digest: bytes, make_event: Callable) -> WorkloadRecords | None:
+    magic, version, algorithm_length, stored_digest, semaphores, mutexes, processes, events = HEADER.unpack_from(data)
+    if magic != WORKLOAD_MAGIC or version != WORKLOAD_VERSION or stored_digest != digest:
+        return None
+    offset = HEADER.size + len(padded(bytes(algorithm_length)))
+    sections = []
+    for record, count in ((SEMAPHORE, semaphores), (MUTEX, mutexes), (PROCESS, processes), (EVENT, events)):
+        sections.append(slice(offset, offset + record.size * count))
+        offset += record.size * count
+    if offset != len(data):
+        return None
+
+    view = memoryview(data)
+    try:
+        return WorkloadRecords(
+            bytes(view[HEADER.size:HEADER.size + algorithm_length]).decode(),
+            list(SEMAPHORE.iter_unpack(view[sections[0]])),
+            [mutex for mutex, in MUTEX.iter_unpack(view[sections[1]])],
+            list(PROCESS.iter_unpack(view[sections[2]])),
+            list(starmap(make_event, EVENT.iter_unpack(view[sections[3]]))))
+    finally:
+        # The mapping can only close once no view of it is left.
+        view.release()
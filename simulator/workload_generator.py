@@ -0,0 +1,168 @@
+import argparse
+import json
+import random
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Iterator
+
+from simulator import MICRO_S, NUM_MICRO_IN_SEC, VALID_SCHEDULING_ALGORITHMS, PROCESSES, ARRIVAL, TOTAL_CPU_TIME, \
+    PRIORITY, PRIORITY_CHANGES, EVENT_ARRIVAL, NEW_PRIORITY, SEMAPHORES, SEMAPHORE_ID, SEMAPHORE_INIT_VAL, \
+    PROCESS_SEMAPHORE, PROCESSES_SEMA_ID, PROCESS_SEMA_P, PROCESS_SEMA_V, MUTEXES, PROCESS_MUTEX, PROCESSES_MUTEX_ID, \
+    PROCESS_MUTEX_LOCK, PROCESS_MUTEX_UNLOCK, PROCESS_TYPE
+
+ARRIVAL_DISTRIBUTIONS = {"poisson", "uniform", "burst"}
+
+# The simulator treats 1 second of idling as a kernel bug, so arrivals are never spaced further apart than this.
+MAX_ARRIVAL_GAP: MICRO_S = NUM_MICRO_IN_SEC // 2
+
+@dataclass
+class WorkloadConfig:
+    scheduling_algorithm: str = "FCFS"
+    num_processes: int = 1000
+    seed: int = 0
+    # poisson: exponential gaps, uniform: uniformly spread over num_processes * mean_interarrival,
+    # burst: groups of burst_size processes arriving together.
+    arrival_distribution: str = "poisson"
+    mean_interarrival: MICRO_S = 100
+    burst_size: int = 10
+    min_cpu_time: MICRO_S = 10
+    max_cpu_time: MICRO_S = 1000
+    min_priority: int = 0
+    max_priority: int = 63
+    # Expected number of priority changes per process.
+    priority_changes_per_process: float = 0.0
+    num_semaphores: int = 0
+    semaphore_init_val: int = 1
+    # Probability that a process enters one p/v critical section.
+    semaphore_usage: float = 0.0
+    num_mutexes: int = 0
+    # Probability that a process enters one lock/unlock critical section.
+    mutex_usage: float = 0.0
+    background_fraction: float = 0.0
+
+def generate_arrivals(config: WorkloadConfig, rng: random.Random) -> list[MICRO_S]:
+    if config.arrival_distribution == "poisson":
+        arrivals = []
+        time = 0.0
+        for _ in range(config.num_processes):
+            arrivals.append(int(time))
+            time += rng.expovariate(1 / config.mean_interarrival)
+    elif config.arrival_distribution == "uniform":
+        span = config.num_processes * config.mean_interarrival
+        arrivals = sorted(rng.randrange(span) for _ in range(config.num_processes))
+    elif config.arrival_distribution == "burst":
+        arrivals = []
+        time = 0.0
+        while len(arrivals) < config.num_processes:
+            arrivals.extend([int(time)] * min(config.burst_size, config.num_processes - len(arrivals)))
+            time += rng.expovariate(1 / (config.mean_interarrival * config.burst_size))
+    else:
+        raise ValueError(f"Invalid arrival distribution: {config.arrival_distribution}")
+
+    # Start at 0 and close gaps the simulator would treat as a stuck kernel.
+    clamped = []
+    for i in range(len(arrivals)):
+        if i == 0:
+            clamped.append(0)
+        else:
+            clamped.append(clamped[i - 1] + min(arrivals[i] - arrivals[i - 1], MAX_ARRIVAL_GAP))
+    return clamped
+
+# Each process holds at most one semaphore or mutex at a time and always releases it itself,
+# so generated workloads can contend heavily but never deadlock.
+def generate_process(config: WorkloadConfig, arrival: MICRO_S, rng: random.Random) -> dict:
+    total_cpu_time = rng.randint(config.min_cpu_time, config.max_cpu_time)
+    process = {ARRIVAL: arrival, TOTAL_CPU_TIME: total_cpu_time,
+               PRIORITY: rng.randint(config.min_priority, config.max_priority)}
+    if rng.random() < config.background_fraction:
+        process[PROCESS_TYPE] = "Background"
+
+    # The Multilevel kernel does not wake processes blocked on semaphores or mutexes.
+    sync_allowed = config.scheduling_algorithm != "Multilevel"
+    actions = []
+    priority_changes = int(config.priority_changes_per_process)
+    if rng.random() < config.priority_changes_per_process - priority_changes:
+        priority_changes += 1
+    actions.extend([PRIORITY_CHANGES] * priority_changes)
+    if sync_allowed and config.num_semaphores > 0 and rng.random() < config.semaphore_usage:
+        actions.append(PROCESS_SEMAPHORE)
+    if sync_allowed and config.num_mutexes > 0 and rng.random() < config.mutex_usage:
+        actions.append(PROCESS_MUTEX)
+    rng.shuffle(actions)
+
+    # Critical sections need an acquire and a release time, everything else needs one.
+    # A process with no CPU time at all has room for no events, which leaves it without actions.
+    needed_times = sum(1 if action == PRIORITY_CHANGES else 2 for action in actions)
+    while needed_times > max(total_cpu_time - 1, 0):
+        needed_times -= 1 if actions.pop() == PRIORITY_CHANGES else 2
+    times = iter(sorted(rng.sample(range(1, total_cpu_time), needed_times)))
+
+    for action in actions:
+        if action == PRIORITY_CHANGES:
+            change = {EVENT_ARRIVAL: next(times), NEW_PRIORITY: rng.randint(config.min_priority, config.max_priority)}
+            process.setdefault(PRIORITY_CHANGES, []).append(change)
+        elif action == PROCESS_SEMAPHORE:
+            id = rng.randrange(config.num_semaphores)
+            process.setdefault(PROCESS_SEMAPHORE, []).extend([
+                {PROCESSES_SEMA_ID: id, PROCESS_SEMA_P: next(times)},
+                {PROCESSES_SEMA_ID: id, PROCESS_SEMA_V: next(times)}])
+        elif action == PROCESS_MUTEX:
+            id = rng.randrange(config.num_mutexes)
+            process.setdefault(PROCESS_MUTEX, []).extend([
+                {PROCESSES_MUTEX_ID: id, PROCESS_MUTEX_LOCK: next(times)},
+                {PROCESSES_MUTEX_ID: id, PROCESS_MUTEX_UNLOCK: next(times)}])
+    return process
+
+# Returns everything in a simulation description except the processes.
+def generate_header(config: WorkloadConfig) -> dict:
+    assert(config.scheduling_algorithm in VALID_SCHEDULING_ALGORITHMS)
+    header = {"scheduling_algorithm": config.scheduling_algorithm}
+    if config.num_semaphores > 0:
+        header[SEMAPHORES] = [{SEMAPHORE_ID: id, SEMAPHORE_INIT_VAL: config.semaphore_init_val}
+                              for id in range(config.num_semaphores)]
+    if config.num_mutexes > 0:
+        header[MUTEXES] = list(range(config.num_mutexes))
+    return header
+
+# Yields the processes of the workload in arrival order.
+def generate_processes(config: WorkloadConfig) -> Iterator[dict]:
+    rng = random.Random(config.seed)
+    for arrival in generate_arrivals(config, rng):
+        yield generate_process(config, arrival, rng)
+
+# Returns a simulation description in the same format as simulator/simulations/*.json.
+def generate_workload(config: WorkloadConfig) -> dict:
+    workload = generate_header(config)
+    workload[PROCESSES] = list(generate_processes(config))
+    return workload
+
+# Writes the workload as .json, or as a streamable .jsonl description without holding every process in memory.
+def write_workload(config: WorkloadConfig, path: str):
+    with open(path, 'w') as file:
+        if Path(path).suffix == ".jsonl":
+            file.write(json.dumps(generate_header(config)) + "\n")
+            for process in generate_processes(config):
+                file.write(json.dumps(process) + "\n")
+        else:
+            json.dump(generate_workload(config), file)
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    for field in fields(WorkloadConfig):
+        if field.name == "scheduling_algorithm":
+            continue
+        choices = sorted(ARRIVAL_DISTRIBUTIONS) if field.name == "arrival_distribution" else None
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default, choices=choices)
+
+def config_from_arguments(args: argparse.Namespace, scheduling_algorithm: str) -> WorkloadConfig:
+    values = {field.name: getattr(args, field.name) for field in fields(WorkloadConfig) if field.name != "scheduling_algorithm"}
+    return WorkloadConfig(scheduling_algorithm=scheduling_algorithm, **values)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic simulation description.")
+    parser.add_argument("output", help="path of the .json or .jsonl file to write")
+    parser.add_argument("--scheduling-algorithm", choices=sorted(VALID_SCHEDULING_ALGORITHMS), default="FCFS")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    write_workload(config_from_arguments(args, args.scheduling_algorithm), args.output)
@@ -1,36 +1,724 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from io import TextIOBase
+from multiprocessing.connection import Connection
 from pathlib import Path
 
-def run_test(simulation_file):
-    simulation_path = f"simulator/simulations/{simulation_file}"
-    correct_output_path = f"simulator/correct_output/{simulation_file}".replace(".json", ".txt")
-    
-    cmd = ["python3", "simulator/simulator.py", simulation_path, "output.txt"]
-    subprocess.run(cmd)
-    
-    with open("output.txt", 'r') as f, open(correct_output_path, 'r') as f2:
-        generated = f.readlines()
-        correct = f2.readlines()
-    
-    passed = len(generated) == len(correct)
-    for i in range(min(len(generated), len(correct))):
-        if generated[i] != correct[i]:
-            print(f"Line {i+1}:")
-            print(f"Generated: {generated[i].strip()}")
-            print(f"Correct:   {correct[i].strip()}")
-            passed = False
-    return passed
+SIMULATOR_DIR = Path(__file__).parent / "simulator"
+sys.path.insert(0, str(SIMULATOR_DIR))
+
+from batch import RunOptions, iter_many
+from binary_trace import BinaryTraceSink, TraceReader
+from kernel import KernelConfig
+from log_sink import LogSink, TextLogSink, RecordLogSink, CountingLogSink, SIMULATOR_DELIMITER, STUDENT_DELIMITER, format_time
+from metrics import MetricsCollector
+from schema import CompiledSchema, ValidationError, compile_schema, integer, refined
+from simulator import Simulator, SimulationError, Workload, NUM_MICRO_IN_SEC, PROCESSES, ARRIVAL, DESCRIPTION_SCHEMA, load_workload, parse_workload
+from smp import SMPSimulator, CoreStats
+from sweep import SweepPoint, run_point
+from watchdog import Watchdog
+from workload_cache import cache_path
+from workload_generator import WorkloadConfig, generate_workload
+
+SIMULATIONS_DIR = SIMULATOR_DIR / "simulations"
+CORRECT_OUTPUT_DIR = SIMULATOR_DIR / "correct_output"
+
+# Lines of the log compared at a time. Smaller chunks stop a diverging simulation sooner.
+COMPARE_CHUNK_LINES = 4096
+# Simulated time between the checkpoints saved by --checkpoint.
+CHECKPOINT_INTERVAL = 500
+# Long enough that no expected output starves a process, short enough to cover the watchdog's starvation tracking.
+WATCHDOG_STARVATION_LIMIT = NUM_MICRO_IN_SEC // 2
+# The tag the single-core SMPSimulator puts before every line.
+CPU_0_TAG = "[cpu 0] "
+# Cores --smp also runs every simulation and generator case on.
+SMP_CPUS = (2, 4)
+# Simulations that deadlock on several cores, and why. One core runs their processes in an order that avoids it.
+SMP_DEADLOCKS = {
+    "Semaphore2.json": "processes 1 and 2 run side by side and take all three units of semaphore 0 between them before either gives one back",
+}
+
+# Runs --watchdog aborts, each a simulation description and the first line of the expected diagnostic.
+WATCHDOG_CASES = {
+    # Multilevel never wakes a process blocked on a semaphore, so process 2 is stuck once process 1 exits.
+    "multilevel semaphore": ({"scheduling_algorithm": "Multilevel", "semaphores": [{"id": 0, "init_val": 1}], "processes": [
+        {"arrival": 0, "total_cpu_time": 100, "semaphore": [{"id": 0, "p": 10}, {"id": 0, "v": 80}]},
+        {"arrival": 5, "total_cpu_time": 100, "semaphore": [{"id": 0, "p": 3}, {"id": 0, "v": 50}]}]},
+        "Deadlock at 0.103ms: every remaining process is blocked and no process is left to arrive."),
+    "mutex cycle": ({"scheduling_algorithm": "RR", "mutexes": [0, 1], "processes": [
+        {"arrival": 0, "total_cpu_time": 100, "mutex": [{"id": 0, "lock": 5}, {"id": 1, "lock": 60}, {"id": 1, "unlock": 70}, {"id": 0, "unlock": 80}]},
+        {"arrival": 1, "total_cpu_time": 100, "mutex": [{"id": 1, "lock": 2}, {"id": 0, "lock": 30}, {"id": 0, "unlock": 50}, {"id": 1, "unlock": 60}]}]},
+        "Deadlock at 0.090ms: processes 1, 2 wait for each other's mutexes."),
+    # Process 1 is woken by process 2, which outranks it and runs for much longer than the limit.
+    "woken process starves": ({"scheduling_algorithm": "Priority", "semaphores": [{"id": 0, "init_val": 0}], "processes": [
+        {"arrival": 0, "total_cpu_time": 50, "priority": 50, "semaphore": [{"id": 0, "p": 10}]},
+        {"arrival": 20, "total_cpu_time": 2 * WATCHDOG_STARVATION_LIMIT, "priority": 1, "semaphore": [{"id": 0, "v": 30}]}]},
+        f"Starvation at {format_time(50 + WATCHDOG_STARVATION_LIMIT)}: process 1 has been ready for {WATCHDOG_STARVATION_LIMIT}us "
+        f"without running (limit {WATCHDOG_STARVATION_LIMIT}us)."),
+}
+
+# Workloads --generator generates, each of which has to be the same for its seed, valid, and simulated to the end.
+GENERATOR_CASES = {
+    "FCFS poisson": WorkloadConfig("FCFS", 200, seed=1),
+    "Priority bursts with every event": WorkloadConfig("Priority", 200, seed=2, arrival_distribution="burst", priority_changes_per_process=1.5,
+                                                       num_semaphores=3, semaphore_usage=0.5, num_mutexes=2, mutex_usage=0.5),
+    # Processes of at most 3us have room for few or no events, and some have no CPU time at all.
+    "RR uniform without CPU time": WorkloadConfig("RR", 200, seed=3, arrival_distribution="uniform", min_cpu_time=0, max_cpu_time=3,
+                                                  priority_changes_per_process=1.0, num_semaphores=2, semaphore_usage=0.8),
+    "Multilevel background": WorkloadConfig("Multilevel", 200, seed=4, min_cpu_time=0, max_cpu_time=20, background_fraction=0.5,
+                                            num_semaphores=2, semaphore_usage=0.5),
+}
+
+# Streamed descriptions --jsonl runs, each of which has to fail with the expected errors, and again when resumed from the first checkpoint.
+# Processes are read one line ahead, so every bad line comes after the first two processes and is only read once the run has started.
+JSONL_CASES = {
+    "arrivals out of order": ([
+        '{"scheduling_algorithm": "FCFS"}',
+        '{"arrival": 0, "total_cpu_time": 10}',
+        '{"arrival": 10, "total_cpu_time": 10}',
+        '{"arrival": 5, "total_cpu_time": 10}'],
+        ["line at byte 108: $.arrival: arrives at 5us, before the previous line's 10us; streamed processes must be ordered by arrival"]),
+    "invalid process": ([
+        '{"scheduling_algorithm": "RR", "semaphores": [{"id": 0, "init_val": 1}]}',
+        '{"arrival": 0, "total_cpu_time": 10}',
+        '{"arrival": 10, "total_cpu_time": 10}',
+        '{"arrival": 20, "total_cpu_time": 10, "semaphore": [{"id": 0, "p": "3"}, {"id": 0, "v": 12}]}'],
+        ["line at byte 148: $.semaphore[0].p: expected an integer, got string",
+         "line at byte 148: $.semaphore[1].v: happens at 12us, not before the process exits at 10us"]),
+}
+
+# Values --schema validates, each with its schema and the errors it has to be rejected with.
+SCHEMA_CASES = {
+    "wrong type": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "RR", "processes": [
+        {"arrival": 0, "total_cpu_time": 100}, {"arrival": "5", "total_cpu_time": 100}]},
+        ["$.processes[1].arrival: expected an integer, got string"]),
+    "missing key": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "RR", "semaphores": [{"id": 0, "init_val": 1}], "processes": [
+        {"arrival": 0, "total_cpu_time": 100, "semaphore": [{"p": 10}, {"id": 0, "v": 20}]}]},
+        ["$.processes[0].semaphore[0]: missing required key 'id'"]),
+    "duplicate semaphore id": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "RR", "processes": [{"arrival": 0, "total_cpu_time": 100}],
+        "semaphores": [{"id": 0, "init_val": 1}, {"id": 1, "init_val": 1}, {"id": 0, "init_val": 2}]},
+        ["$.semaphores[2].id: semaphore 0 is already declared at $.semaphores[0]"]),
+    "duplicate event times": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "RR", "semaphores": [{"id": 0, "init_val": 1}], "mutexes": [0],
+        "processes": [{"arrival": 0, "total_cpu_time": 100},
+                      {"arrival": 0, "total_cpu_time": 100, "semaphore": [{"id": 0, "p": 10}], "mutex": [{"id": 0, "lock": 10}]}]},
+        ["$.processes[1].mutex[0].lock: happens at 10us like $.processes[1].semaphore[0].p"]),
+    "event after exit": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "RR", "processes": [
+        {"arrival": 0, "total_cpu_time": 100, "priority_change": [{"arrival": 100, "new_priority": 3}]}]},
+        ["$.processes[0].priority_change[0].arrival: happens at 100us, not before the process exits at 100us"]),
+    # The rules that span several fields still run on a process with type errors, so every problem is reported at once.
+    "several errors": (DESCRIPTION_SCHEMA, {"scheduling_algorithm": "SJF", "processes": [
+        {"arrival": 0, "total_cpu_time": 50, "priority": "high", "priority_change": [{"arrival": 20, "new_priority": 1}],
+         "semaphore": [{"id": 0, "p": 20}, {"id": 0, "v": 60}]}]},
+        ["$.scheduling_algorithm: expected one of 'FCFS', 'Multilevel', 'Priority', 'RR', got 'SJF'",
+         "$.processes[0].priority: expected an integer, got string",
+         "$.processes[0].semaphore[0].p: happens at 20us like $.processes[0].priority_change[0].arrival",
+         "$.processes[0].semaphore[1].v: happens at 60us, not before the process exits at 50us"]),
+    # A compiled schema that rejects a value its checks accept has a bug, and still has to reject the value.
+    "compiled schema disagrees": (compile_schema(refined(integer(), lambda value, path, errors: True, lambda value: False)), 1,
+        ["$: rejected by the compiled schema, but no check reports why"]),
+}
+
+@dataclass(frozen=True)
+class TestOptions:
+    event_driven: bool = False
+    tickless: bool = False
+    # Write a binary trace and compare it converted back to text.
+    binary_trace: bool = False
+    # Lines shown before and after the first divergent line.
+    context: int = 3
+    # Run the simulation in a child process that streams the log to the comparison through a pipe.
+    pipe: bool = False
+    # Save checkpoints during the run, then resume from the middle one and compare the log the resumed run completed.
+    checkpoint: bool = False
+    # Step through every simulation instead of computing the logs of those without syscalls analytically.
+    no_fast_path: bool = False
+    # Watch for deadlocks and starvation, which no expected output has.
+    watchdog: bool = False
+    # Collect metrics, which have to account for every process and match a sweep of the workload at the default configuration.
+    metrics: bool = False
+    # Run on the SMP simulator with one core, whose log is the expected output once the cpu tags are stripped.
+    # --smp also runs every simulation on several cores, see run_smp_case.
+    smp: bool = False
+    # Load each workload through a scratch workload cache, checking that it is compiled, read back, rebuilt, and replaced once edited.
+    workload_cache: bool = False
+    # Record the log with RecordLogSink and compare it once rendered to text.
+    compact_log: bool = False
+    # Stream each simulation from a .jsonl copy of its description.
+    jsonl: bool = False
+    # Run simulator.py from the command line with student logs, and compare the simulator's lines.
+    cli: bool = False
+
+class OutputMismatch(Exception):
+    pass
+
+# A check besides the log comparison that failed.
+class CheckFailed(Exception):
+    pass
+
+# Returns the last count lines of text, which ends with a newline.
+def last_lines(text: str, count: int) -> list[str]:
+    start = len(text) - 1
+    for _ in range(count):
+        start = text.rfind("\n", 0, start)
+        if start < 0:
+            break
+    return text[start + 1:].splitlines()
+
+# Compares a log against the expected output chunk by chunk as the log is written, and stops at the first divergent line.
+# Only the last few lines are kept for context, so logs of any length are compared in constant memory.
+class StreamComparator:
+    expected: TextIOBase
+    context: int
+    recent: deque[str]
+    lines: int
+    report: list[str] | None
+
+    def __init__(self, expected: TextIOBase, context: int):
+        self.expected = expected
+        self.context = context
+        self.recent = deque(maxlen=context)
+        self.lines = 0
+        self.report = None
+
+    # Compares the next chunk of the log, which ends at a line boundary. Returns False once the log has diverged.
+    def feed(self, chunk: str) -> bool:
+        expected = self.expected.read(len(chunk))
+        if expected == chunk:
+            self.lines += chunk.count("\n")
+            self.recent.extend(last_lines(chunk, self.context))
+            return True
+        self.diverged(chunk, expected)
+        return False
+
+    # Called once the whole log was fed, to check that nothing more was expected.
+    def finish(self) -> bool:
+        expected = self.expected.read(1)
+        if expected != "":
+            self.diverged("", expected)
+            return False
+        return True
+
+    def diverged(self, chunk: str, expected: str):
+        generated = chunk.splitlines()
+        # Completes the last expected line and reads the expected lines after the divergence.
+        expected += self.expected.readline()
+        for _ in range(self.context):
+            expected += self.expected.readline()
+        correct = expected.splitlines()
+
+        first = min(len(generated), len(correct))
+        for i in range(first):
+            if generated[i] != correct[i]:
+                first = i
+                break
+        before = list(self.recent) + generated[max(first - self.context, 0):first]
+        self.report = [f"Line {self.lines + first + 1}:"]
+        self.report.extend(f"           {line}" for line in before[len(before) - self.context:])
+        for title, lines, end in (("Generated: ", generated, "<end of log>"), ("Correct:   ", correct, "<end of expected output>")):
+            after = lines[first:first + self.context + 1]
+            self.report.append(title + (after[0] if len(after) > 0 else end))
+            self.report.extend(f"           {line}" for line in after[1:])
+
+
+# Feeds the log to a comparator as it is flushed, and stops the simulation once it diverges.
+class ComparingLogSink(TextLogSink):
+    comparator: StreamComparator
+
+    def __init__(self, comparator: StreamComparator):
+        super().__init__(None, COMPARE_CHUNK_LINES)
+        self.comparator = comparator
+
+    def flush(self):
+        chunk = "".join(self.buffer)
+        self.buffer.clear()
+        if not self.comparator.feed(chunk):
+            raise OutputMismatch()
+
+# Strips the cpu tag from the log of a single-core SMPSimulator.
+class UntaggingLogSink(LogSink):
+    log_sink: LogSink
+
+    def __init__(self, log_sink: LogSink):
+        self.log_sink = log_sink
+
+    def write(self, time, delimiter, message):
+        self.log_sink.write(time, delimiter, message.removeprefix(CPU_0_TAG))
+
+    def write_spacing(self):
+        self.log_sink.write_spacing()
+
+    def close(self):
+        self.log_sink.close()
+
+# Sends the log through a pipe to the process comparing it, one chunk per flush.
+class PipeLogSink(TextLogSink):
+    connection: Connection
+
+    def __init__(self, connection: Connection):
+        super().__init__(None, COMPARE_CHUNK_LINES)
+        self.connection = connection
+
+    def flush(self):
+        self.connection.send("".join(self.buffer))
+        self.buffer.clear()
+
+# Writes a text log file to log_sink, one chunk at a time.
+def replay_text_log(log_path: str, log_sink: TextLogSink):
+    with open(log_path, 'r') as file:
+        for line in file:
+            log_sink.buffer.append(line)
+            if len(log_sink.buffer) >= log_sink.buffer_lines:
+                log_sink.flush()
+    log_sink.close()
+
+# Writes the simulator's lines of a text log with student logs to log_sink, as a run without student logs writes them:
+# student lines are dropped, and so is the blank line after a microsecond that only had student lines.
+def replay_simulator_lines(log_path: str, log_sink: TextLogSink):
+    with open(log_path, 'r') as file:
+        spaced = True
+        for line in file:
+            if line == "\n":
+                if spaced:
+                    continue
+                spaced = True
+            elif line.split(" ", 2)[1] == STUDENT_DELIMITER:
+                continue
+            else:
+                spaced = False
+            log_sink.buffer.append(line)
+            if len(log_sink.buffer) >= log_sink.buffer_lines:
+                log_sink.flush()
+    log_sink.close()
+
+# Writes the description as a .jsonl description in run_dir, which the simulator streams: everything but the processes
+# on the first line, then one process per line, ordered by arrival like the simulator orders them.
+def write_jsonl_description(simulation_path: Path, run_dir: str) -> Path:
+    with open(simulation_path, 'r') as file:
+        description = json.load(file)
+    processes = sorted(description.pop(PROCESSES), key=lambda process: process[ARRIVAL])
+    jsonl_path = Path(run_dir) / simulation_path.with_suffix(".jsonl").name
+    with open(jsonl_path, 'w') as file:
+        file.write(json.dumps(description) + "\n")
+        file.writelines(json.dumps(process) + "\n" for process in processes)
+    return jsonl_path
+
+# Resumes the checkpoint saved halfway through the run in run_dir, which rewrites the second half of its log.
+def resume_middle_checkpoint(run_dir: str) -> Simulator:
+    checkpoints = sorted((f for f in os.listdir(run_dir) if f.endswith(".ckpt")), key=lambda f: int(f.split(".")[0]))
+    simulator = Simulator.load_checkpoint(os.path.join(run_dir, checkpoints[len(checkpoints) // 2]))
+    simulator.run_simulator()
+    return simulator
+
+# Loads a copy of the description three times: compiling it into the workload cache, reading it back, and rebuilding it.
+# Each has to give the workload the description parses to. Compiling an edited copy then has to replace the entry of the original.
+def load_through_workload_cache(simulation_path: Path) -> Workload:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        description_path = Path(cache_dir) / simulation_path.name
+        shutil.copyfile(simulation_path, description_path)
+        entry = cache_path(description_path, hashlib.sha256(description_path.read_bytes()).digest())
+        expected = load_workload(simulation_path)
+
+        if load_workload(description_path, use_cache=True) != expected:
+            raise CheckFailed("compiling the workload into the cache changed it")
+        if not entry.exists():
+            raise CheckFailed(f"the workload was not compiled into {entry}")
+        compiled = entry.stat()
+        workload = load_workload(description_path, use_cache=True)
+        if workload != expected:
+            raise CheckFailed("the workload read back from the cache differs from the description")
+        # os.replace gives every entry written a new inode, so an unchanged one was read rather than rewritten.
+        if (entry.stat().st_ino, entry.stat().st_mtime_ns) != (compiled.st_ino, compiled.st_mtime_ns):
+            raise CheckFailed("a cached workload was compiled again instead of being read")
+        if load_workload(description_path, use_cache=True, rebuild_cache=True) != expected:
+            raise CheckFailed("rebuilding the cached workload changed it")
+        if entry.stat().st_ino == compiled.st_ino:
+            raise CheckFailed("rebuild_cache did not compile the workload again")
+
+        # Trailing whitespace changes the digest but not the workload.
+        with open(description_path, 'a') as file:
+            file.write("\n")
+        edited_entry = cache_path(description_path, hashlib.sha256(description_path.read_bytes()).digest())
+        if load_workload(description_path, use_cache=True) != expected:
+            raise CheckFailed("the workload compiled from the edited description differs from the description")
+        if not edited_entry.exists() or entry.exists():
+            raise CheckFailed(f"compiling the edited description left {sorted(p.name for p in entry.parent.iterdir())} in the cache")
+    return workload
+
+def create_simulator(description: Workload | Path, options: TestOptions, log_sink: LogSink) -> Simulator | SMPSimulator:
+    if options.smp:
+        return SMPSimulator(description, None, False, 1, UntaggingLogSink(log_sink))
+    metrics = MetricsCollector() if options.metrics else None
+    watchdog = Watchdog(WATCHDOG_STARVATION_LIMIT) if options.watchdog else None
+    simulator = Simulator(description, None, False, options.event_driven, log_sink, options.tickless, metrics, None, None, watchdog)
+    simulator.fast_path = not options.no_fast_path
+    return simulator
+
+# The metrics of a finished run have to account for every process, and a sweep of the workload at the default
+# configuration, which runs it event-driven and tickless, has to collect the same ones.
+def check_metrics(workload: Workload, metrics: MetricsCollector):
+    aggregate = metrics.aggregate()
+    if aggregate["finished"] != len(workload.processes):
+        raise CheckFailed(f"metrics saw {aggregate['finished']} of {len(workload.processes)} processes finish")
+    swept = run_point(workload, SweepPoint(workload.scheduling_algorithm, KernelConfig()))
+    if "error" in swept:
+        raise CheckFailed(f"the sweep raised {swept['error']}")
+    differences = [f"{key} {swept[key]} instead of {value}" for key, value in aggregate.items() if swept[key] != value]
+    if len(differences) > 0:
+        raise CheckFailed(f"the sweep at the default configuration reported {', '.join(differences)}")
+
+# Runs a simulation, writing its log to log_sink, and returns how it failed, or None.
+# A divergence found while comparing the log stops the simulation with an OutputMismatch.
+def simulate(simulation_path: Path, options: TestOptions, log_sink: TextLogSink) -> str | None:
+    try:
+        workload = load_through_workload_cache(simulation_path) if options.workload_cache else load_workload(simulation_path)
+        with tempfile.TemporaryDirectory() as run_dir:
+            description = write_jsonl_description(simulation_path, run_dir) if options.jsonl else workload
+            if not options.binary_trace and not options.compact_log and not options.checkpoint:
+                simulator = create_simulator(description, options, log_sink)
+                simulator.run_simulator()
+            else:
+                log_path = os.path.join(run_dir, "log.trace" if options.binary_trace else "log.txt")
+                if options.binary_trace:
+                    file_sink = BinaryTraceSink(log_path)
+                elif options.compact_log:
+                    file_sink = RecordLogSink(log_path)
+                else:
+                    file_sink = TextLogSink(log_path)
+                simulator = create_simulator(description, options, file_sink)
+                if options.checkpoint:
+                    simulator.checkpoint_every(CHECKPOINT_INTERVAL, os.path.join(run_dir, "{time}.ckpt"))
+                simulator.run_simulator()
+                if options.checkpoint:
+                    simulator = resume_middle_checkpoint(run_dir)
+                if options.binary_trace:
+                    with TraceReader(log_path) as reader:
+                        reader.render(log_sink)
+                    log_sink.close()
+                else:
+                    replay_text_log(log_path, log_sink)
+        if options.metrics:
+            check_metrics(workload, simulator.metrics)
+    except OutputMismatch:
+        raise
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+# Runs simulator.py on the simulation in a child process, with the options that map to its command line,
+# and writes the simulator's lines of its log to log_sink. Returns how the simulation failed, or None.
+def simulate_cli(simulation_path: Path, options: TestOptions, log_sink: TextLogSink) -> str | None:
+    flags = [flag for flag, enabled in (("--event-driven", options.event_driven), ("--tickless", options.tickless),
+                                        ("--compact-log", options.compact_log), ("--no-fast-path", options.no_fast_path)) if enabled]
+    with tempfile.TemporaryDirectory() as run_dir:
+        log_path = os.path.join(run_dir, "output.txt")
+        result = subprocess.run([sys.executable, str(SIMULATOR_DIR / "simulator.py"), str(simulation_path), log_path, *flags],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            # The last line of a traceback is the exception, like the errors simulate returns.
+            output = (result.stderr or result.stdout).strip().splitlines()
+            return output[-1] if len(output) > 0 else f"simulator.py exited with code {result.returncode}"
+        replay_simulator_lines(log_path, log_sink)
+    return None
+
+def simulate_to_pipe(simulation_path: Path, options: TestOptions, connection: Connection):
+    error = simulate(simulation_path, options, PipeLogSink(connection))
+    connection.send(("end", error))
+    connection.close()
+
+# Runs the simulation in a child process and compares its log while it is being written, without a temporary file.
+# Returns how the simulation failed, or None.
+def compare_through_pipe(simulation_path: Path, options: TestOptions, comparator: StreamComparator) -> str | None:
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(target=simulate_to_pipe, args=(simulation_path, options, sender))
+    child.start()
+    sender.close()
+    try:
+        while type(message := receiver.recv()) is str:
+            if not comparator.feed(message):
+                raise OutputMismatch()
+        return message[1]
+    finally:
+        receiver.close()
+        # A child whose log diverged is stopped rather than left to finish.
+        if child.is_alive():
+            child.terminate()
+        child.join()
+
+def correct_output_path(simulation_file: str) -> Path:
+    return CORRECT_OUTPUT_DIR / simulation_file.replace(".json", ".txt")
+
+# Runs a single simulation and compares its log against the expected output as it is written.
+# Returns (passed, report lines, wall time in seconds).
+def run_test(simulation_file: str, options: TestOptions = TestOptions()):
+    simulation_path = SIMULATIONS_DIR / simulation_file
+
+    start = time.perf_counter()
+    with open(correct_output_path(simulation_file), 'r') as expected:
+        comparator = StreamComparator(expected, options.context)
+        try:
+            if options.pipe:
+                error = compare_through_pipe(simulation_path, options, comparator)
+            elif options.cli:
+                error = simulate_cli(simulation_path, options, ComparingLogSink(comparator))
+            else:
+                error = simulate(simulation_path, options, ComparingLogSink(comparator))
+            if error is not None:
+                return False, [f"Simulation raised {error}"], time.perf_counter() - start
+            comparator.finish()
+        except OutputMismatch:
+            pass
+    if comparator.report is not None:
+        return False, comparator.report, time.perf_counter() - start
+    return True, [], time.perf_counter() - start
+
+# Compares a log that batch.iter_many returned against the expected output.
+# Returns (passed, report lines), like run_test.
+def compare_batch_result(simulation_file: str, log: str, error: str | None, context: int):
+    if error is not None:
+        return False, [f"Simulation raised {error}"]
+    with open(correct_output_path(simulation_file), 'r') as expected:
+        comparator = StreamComparator(expected, context)
+        if comparator.feed(log):
+            comparator.finish()
+    return comparator.report is None, comparator.report or []
+
+# Runs one of WATCHDOG_CASES, which has to be aborted with the expected diagnostic.
+# Returns (passed, report lines, wall time in seconds), like run_test.
+def run_watchdog_case(name: str, options: TestOptions = TestOptions()):
+    description, expected = WATCHDOG_CASES[name]
+    start = time.perf_counter()
+    simulator = Simulator(parse_workload(description), None, False, options.event_driven, TextLogSink(), options.tickless,
+                          None, None, None, Watchdog(WATCHDOG_STARVATION_LIMIT))
+    try:
+        simulator.run_simulator()
+        report = ["Generated: <end of log>", f"Correct:   {expected}"]
+    except SimulationError as e:
+        diagnostic = str(e).splitlines()[0]
+        report = [] if diagnostic == expected else [f"Generated: {diagnostic}", f"Correct:   {expected}"]
+    except Exception as e:
+        report = [f"Simulation raised {type(e).__name__}: {e}"]
+    return len(report) == 0, report, time.perf_counter() - start
+
+# Runs one of GENERATOR_CASES: the workload has to be generated the same way from the same seed and differently from another,
+# pass validation, include processes without CPU time when they are allowed, and run to the end.
+# Returns (passed, report lines, wall time in seconds), like run_test.
+def run_generator_case(name: str, options: TestOptions = TestOptions()):
+    config = GENERATOR_CASES[name]
+    start = time.perf_counter()
+    try:
+        description = generate_workload(config)
+        if generate_workload(config) != description:
+            raise CheckFailed(f"seed {config.seed} generated a different workload the second time")
+        if generate_workload(replace(config, seed=config.seed + 1)) == description:
+            raise CheckFailed(f"seeds {config.seed} and {config.seed + 1} generated the same workload")
+        workload = parse_workload(description)
+        if config.min_cpu_time == 0 and all(process.total_cpu_time > 0 for process in workload.processes):
+            raise CheckFailed("no process was generated without CPU time")
+        Simulator(workload, None, False, options.event_driven, CountingLogSink(), options.tickless).run_simulator()
+        report = []
+    except Exception as e:
+        report = [f"{type(e).__name__}: {e}"]
+    return len(report) == 0, report, time.perf_counter() - start
+
+# Runs one of JSONL_CASES with a checkpoint every microsecond. The run, and the run resumed from its first checkpoint,
+# which reopens the description where the stream had read it to, both have to fail with the expected errors.
+# Returns (passed, report lines, wall time in seconds), like run_test.
+def run_jsonl_case(name: str, options: TestOptions = TestOptions()):
+    lines, expected = JSONL_CASES[name]
+    start = time.perf_counter()
+    report = []
+    with tempfile.TemporaryDirectory() as run_dir:
+        description_path = Path(run_dir) / "description.jsonl"
+        description_path.write_text("".join(line + "\n" for line in lines))
+        simulator = Simulator(description_path, None, False, options.event_driven, TextLogSink(), options.tickless)
+        simulator.checkpoint_every(1, os.path.join(run_dir, "{time}.ckpt"))
+        for run in ("run", "resumed run"):
+            try:
+                simulator.run_simulator()
+                report += [f"Generated: the {run} finished"] + [f"Correct:   {error}" for error in expected]
+            except ValidationError as e:
+                if e.errors != expected:
+                    report += [f"Generated: {error}" for error in e.errors] + [f"Correct:   {error}" for error in expected]
+            except Exception as e:
+                report.append(f"The {run} raised {type(e).__name__}: {e}")
+            simulator = Simulator.load_checkpoint(os.path.join(run_dir, "0.ckpt"), TextLogSink())
+    return len(report) == 0, report, time.perf_counter() - start
+
+# Recounts the per-core statistics of an SMPSimulator from its log, and counts the processes that exited.
+def recount_core_stats(log: str, cpus: int) -> tuple[list[CoreStats], int]:
+    stats = [CoreStats(cpu) for cpu in range(cpus)]
+    last_cpu = dict()
+    exits = 0
+    for line in log.splitlines():
+        if line == "":
+            continue
+        tag, message = line.split(f" {SIMULATOR_DELIMITER} ", 1)[1].split("] ", 1)
+        cpu = int(tag.removeprefix("[cpu "))
+        if message.startswith("Context switching to pid: "):
+            pid = int(message.removeprefix("Context switching to pid: "))
+            stats[cpu].context_switches += 1
+            if pid != 0:
+                stats[cpu].migrations_in += last_cpu.get(pid, cpu) != cpu
+                last_cpu[pid] = cpu
+        elif message.startswith("Stole pid: "):
+            stats[cpu].steals += 1
+        elif message.endswith(" has finished execution and is exiting"):
+            exits += 1
+    return stats, exits
+
+# Runs a simulation or one of GENERATOR_CASES on cpus cores. It has to finish, or deadlock if listed in SMP_DEADLOCKS,
+# and the cores have to have been busy for as long as the processes ran, and count the switches, migrations and steals in the log.
+# Returns (passed, report lines, wall time in seconds), like run_test.
+def run_smp_case(case: tuple[str, int], options: TestOptions = TestOptions()):
+    name, cpus = case
+    start = time.perf_counter()
+    try:
+        if name in GENERATOR_CASES:
+            workload = parse_workload(generate_workload(GENERATOR_CASES[name]))
+        else:
+            workload = load_workload(SIMULATIONS_DIR / name)
+        log_sink = TextLogSink()
+        simulator = SMPSimulator(workload, None, False, cpus, log_sink)
+        try:
+            simulator.run_simulator()
+            if name in SMP_DEADLOCKS:
+                raise CheckFailed(f"finished, but should deadlock: {SMP_DEADLOCKS[name]}")
+        except SimulationError as e:
+            if name not in SMP_DEADLOCKS or not str(e).startswith("Every core has been idle"):
+                raise
+        # A process runs for at least the microsecond in which it exits.
+        unfinished = list(simulator.processes.values()) + simulator.arrivals
+        cpu_time = sum(max(process.total_cpu_time, 1) for process in workload.processes) \
+            - sum(max(process.total_cpu_time, 1) - process.elapsed_cpu_time for process in unfinished)
+        busy_time = sum(stats.busy_time for stats in simulator.stats)
+        if busy_time != cpu_time:
+            raise CheckFailed(f"the cores were busy for {busy_time}us, but the processes ran for {cpu_time}us")
+        if any(stats.busy_time > simulator.elapsed_time for stats in simulator.stats):
+            raise CheckFailed(f"a core was busy for longer than the {simulator.elapsed_time}us the run took")
+        recounted, exits = recount_core_stats(log_sink.getvalue(), cpus)
+        if exits != len(workload.processes) - len(unfinished):
+            raise CheckFailed(f"{exits} processes exited, but {len(workload.processes) - len(unfinished)} finished")
+        for stats, logged in zip(simulator.stats, recounted):
+            logged.busy_time = stats.busy_time
+            if stats != logged:
+                raise CheckFailed(f"cpu {stats.cpu} counted {stats}, but its log shows {logged}")
+        report = []
+    except Exception as e:
+        report = [f"{type(e).__name__}: {e}"]
+    return len(report) == 0, report, time.perf_counter() - start
+
+# Validates one of SCHEMA_CASES, which has to be rejected with the expected errors.
+# Returns (passed, report lines, wall time in seconds), like run_test.
+def run_schema_case(name: str, options: TestOptions = TestOptions()):
+    schema, value, expected = SCHEMA_CASES[name]
+    start = time.perf_counter()
+    try:
+        schema.validate(value)
+        report = ["Generated: <valid>"] + [f"Correct:   {error}" for error in expected]
+    except ValidationError as e:
+        report = [] if e.errors == expected else [f"Generated: {error}" for error in e.errors] + [f"Correct:   {error}" for error in expected]
+    return len(report) == 0, report, time.perf_counter() - start
 
 def main():
-    simulations_dir = "simulator/simulations"
-    simulation_files = [f for f in os.listdir(simulations_dir)]    
-    
-    for simulation_file in simulation_files:
-        print(f"\nTesting {simulation_file}...")
-        passed = run_test(simulation_file)
-        print('PASSED' if passed else 'FAILED')
+    parser = argparse.ArgumentParser(description="Run every simulation and compare it against its expected output.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of simulations to run in parallel")
+    parser.add_argument("--event-driven", action="store_true", help="run the simulator in event-driven mode")
+    parser.add_argument("--tickless", action="store_true", help="only raise the timer interrupts the kernel asks for")
+    parser.add_argument("--binary-trace", action="store_true", help="write binary traces and compare them converted to text")
+    parser.add_argument("--context", type=int, default=3, help="lines of context shown around the first divergent line")
+    parser.add_argument("--pipe", action="store_true", help="stream each log from a child process through a pipe while comparing it")
+    parser.add_argument("--checkpoint", action="store_true", help="resume each simulation from a checkpoint taken halfway through it")
+    parser.add_argument("--no-fast-path", action="store_true", help="step through simulations without syscalls instead of computing their logs")
+    parser.add_argument("--watchdog", action="store_true", help="watch for deadlocks and starvation, and check runs it has to abort")
+    parser.add_argument("--metrics", action="store_true", help="collect metrics and check them against a sweep at the default configuration")
+    parser.add_argument("--smp", action="store_true", help="run on the SMP simulator with one core, and check runs on several")
+    parser.add_argument("--workload-cache", action="store_true", help="load each workload through a scratch workload cache")
+    parser.add_argument("--compact-log", action="store_true", help="record compact logs and compare them rendered to text")
+    parser.add_argument("--jsonl", action="store_true", help="stream each simulation from a .jsonl copy, and check bad streams")
+    parser.add_argument("--cli", action="store_true", help="run simulator.py from the command line with student logs")
+    parser.add_argument("--schema", action="store_true", help="check the errors invalid descriptions are rejected with")
+    parser.add_argument("--generator", action="store_true", help="check workloads generated by workload_generator.py")
+    parser.add_argument("--batch", action="store_true", help="run the simulations through batch.iter_many")
+    args = parser.parse_args()
+    if args.smp and (args.event_driven or args.tickless or args.checkpoint or args.no_fast_path or args.watchdog or args.metrics):
+        parser.error("--smp only combines with --binary-trace, --compact-log, --pipe and --workload-cache")
+    if args.binary_trace and args.compact_log:
+        parser.error("--binary-trace and --compact-log are different log formats")
+    if args.cli and (args.binary_trace or args.pipe or args.checkpoint or args.watchdog or args.metrics or args.smp
+                     or args.workload_cache or args.jsonl):
+        parser.error("--cli only combines with --event-driven, --tickless, --compact-log and --no-fast-path")
+    if args.jsonl and args.workload_cache:
+        parser.error("--jsonl streams descriptions, which --workload-cache loads whole")
+    if args.batch and (args.binary_trace or args.pipe or args.checkpoint or args.no_fast_path or args.watchdog or args.metrics
+                       or args.smp or args.workload_cache or args.compact_log or args.cli or args.jsonl):
+        parser.error("--batch only combines with --event-driven and --tickless")
+
+    options = TestOptions(args.event_driven, args.tickless, args.binary_trace, args.context, args.pipe, args.checkpoint, args.no_fast_path,
+                          args.watchdog, args.metrics, args.smp, args.workload_cache,
+                          args.compact_log, args.jsonl, args.cli)
+    simulation_files = sorted(f for f in os.listdir(SIMULATIONS_DIR) if f.endswith(".json"))
+
+    failed = 0
+    tests = len(simulation_files)
+    start = time.perf_counter()
+    if args.batch:
+        run_options = RunOptions(event_driven=args.event_driven, tickless=args.tickless)
+        for result in iter_many([SIMULATIONS_DIR / f for f in simulation_files], args.workers, run_options):
+            passed, report = compare_batch_result(simulation_files[result.index], result.log, result.error, args.context)
+            failed += print_result(simulation_files[result.index], passed, report, result.run_time_s)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            results = executor.map(run_test, simulation_files, [options] * len(simulation_files))
+            for simulation_file, (passed, report, wall_time) in zip(simulation_files, results):
+                failed += print_result(simulation_file, passed, report, wall_time)
+            if args.watchdog:
+                tests += len(WATCHDOG_CASES)
+                results = executor.map(run_watchdog_case, WATCHDOG_CASES, [options] * len(WATCHDOG_CASES))
+                for name, (passed, report, wall_time) in zip(WATCHDOG_CASES, results):
+                    failed += print_result(f"watchdog case {name}", passed, report, wall_time)
+            if args.smp:
+                cases = [(name, cpus) for name in simulation_files + list(GENERATOR_CASES) for cpus in SMP_CPUS]
+                tests += len(cases)
+                results = executor.map(run_smp_case, cases, [options] * len(cases))
+                for (name, cpus), (passed, report, wall_time) in zip(cases, results):
+                    failed += print_result(f"{name} on {cpus} cpus", passed, report, wall_time)
+            if args.jsonl:
+                tests += len(JSONL_CASES)
+                results = executor.map(run_jsonl_case, JSONL_CASES, [options] * len(JSONL_CASES))
+                for name, (passed, report, wall_time) in zip(JSONL_CASES, results):
+                    failed += print_result(f"jsonl case {name}", passed, report, wall_time)
+            if args.schema:
+                tests += len(SCHEMA_CASES)
+                results = executor.map(run_schema_case, SCHEMA_CASES, [options] * len(SCHEMA_CASES))
+                for name, (passed, report, wall_time) in zip(SCHEMA_CASES, results):
+                    failed += print_result(f"schema case {name}", passed, report, wall_time)
+            if args.generator:
+                tests += len(GENERATOR_CASES)
+                results = executor.map(run_generator_case, GENERATOR_CASES, [options] * len(GENERATOR_CASES))
+                for name, (passed, report, wall_time) in zip(GENERATOR_CASES, results):
+                    failed += print_result(f"generator case {name}", passed, report, wall_time)
+
+    print(f"\n{tests - failed}/{tests} passed in {time.perf_counter() - start:.2f}s")
+    return 1 if failed > 0 else 0
+
+# Returns 1 if the test failed, so that failures can be counted.
+def print_result(name: str, passed: bool, report: list[str], wall_time: float) -> int:
+    print(f"\nTesting {name}...")
+    for line in report:
+        print(line)
+    print(f"{'PASSED' if passed else 'FAILED'} ({wall_time * 1000:.1f}ms)")
+    return 0 if passed else 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())